@@ -2,12 +2,13 @@ import matplotlib
 matplotlib.use('Agg')
 
 import numpy as np
-import matplotlib.pyplot as pltgit log --oneline
+import matplotlib.pyplot as plt
 import math
 import io
 import base64
 from flask import jsonify
 from matplotlib.patches import Arc
+from backend.axis import axis_diagnosis
 
 # This function calculates a side using the Law of Cosines
 def laws_of_cosine_side(b, c, A):
@@ -116,25 +117,7 @@ def Display_Vector(lead1, lead3):
        
     Angle_result = math.ceil(Angle_result-0.5)
     
-    diagnose = "ERROR"
-    
-    if Angle_result >= -29.0 and Angle_result <= 80.0:
-        diagnose = "No Axis Deviation"
-        
-    elif Angle_result <= -30.0 and Angle_result >= -80.0:
-        diagnose = "Abnormal Left Axis Deviation"
-        
-    elif Angle_result <= -100.0 and Angle_result >= -180.0:
-        diagnose = "Extreme Axis Deviation"
-        
-    elif Angle_result >= 100.0 and Angle_result <= 180.0:
-        diagnose = "Abnormal Right Axis Deviation"
-        
-    elif Angle_result <= -81.0 and Angle_result >= -99.0:
-        diagnose = "Superior Axis Deviation"
-        
-    elif Angle_result >= 81.0 and Angle_result <= 99.0:
-        diagnose = "Inferior Axis Deviation"
+    diagnose = axis_diagnosis(Angle_result)
 
     #EAX = Electrical Axis Deviation
     EAX_Area_Shading = ([-30,80],[-80,-30],[100,180],[-100,-180],[-100,-80],[80,100])
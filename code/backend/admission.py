@@ -0,0 +1,142 @@
+"""Admission control for heavy ingestion routes.
+
+At most max_concurrent uploads are processed at once, the rest wait in a
+bounded queue. When a slot frees up it goes to the waiting user with the
+fewest uploads running (oldest request first on ties), and a user can only
+run per_user_limit uploads and queue per_user_queue more, so one bulk upload
+cannot starve everyone else. Requests that cannot be queued, or wait longer
+than max_wait seconds, get a 429 with a Retry-After header.
+
+Limits are per process, with several server workers each one has its own.
+"""
+import itertools
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from functools import wraps
+
+from flask import jsonify
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=2, max_queue=8, max_wait=30.0, per_user_limit=1, per_user_queue=4):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.per_user_limit = per_user_limit
+        self.per_user_queue = per_user_queue
+
+        self._cond = threading.Condition()
+        self._sequence = itertools.count()
+        self._running = defaultdict(int)   # user -> uploads running
+        self._waiting = {}                  # ticket -> user, tickets increase with arrival
+        self._wait_times = deque(maxlen=1000)
+        self._service_times = deque(maxlen=100)
+        self._counters = {"admitted": 0, "rejected": 0, "timed_out": 0}
+
+    def _running_total(self):
+        return sum(self._running.values())
+
+    def _next_ticket(self):
+        # Eligible waiters are users under their own limit, the one with the fewest running goes first
+        # .get so checking a waiter does not leave a 0 entry behind if it never runs
+        eligible = [(self._running.get(user, 0), ticket) for ticket, user in self._waiting.items()
+                    if self._running.get(user, 0) < self.per_user_limit]
+        return min(eligible)[1] if eligible else None
+
+    def retry_after(self):
+        """ Seconds a rejected client should wait, from the recent processing times and queue depth """
+        average = sum(self._service_times) / len(self._service_times) if self._service_times else 5.0
+        rounds = (len(self._waiting) + self._running_total()) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(average * max(rounds, 1)))
+
+    def acquire(self, user):
+        """ Blocks until the user may start an upload, raises AdmissionRejected if it cannot be queued """
+        started = time.monotonic()
+        with self._cond:
+            if (not self._waiting and self._running_total() < self.max_concurrent
+                    and self._running.get(user, 0) < self.per_user_limit):
+                # Free slot and nobody ahead, no need to queue
+                self._running[user] += 1
+                self._counters["admitted"] += 1
+                self._wait_times.append(0.0)
+                return time.monotonic()
+
+            user_waiting = sum(1 for waiting_user in self._waiting.values() if waiting_user == user)
+            if len(self._waiting) >= self.max_queue or user_waiting >= self.per_user_queue:
+                self._counters["rejected"] += 1
+                raise AdmissionRejected("Too many uploads are queued.", self.retry_after())
+
+            ticket = next(self._sequence)
+            self._waiting[ticket] = user
+            try:
+                while not (self._running_total() < self.max_concurrent and self._next_ticket() == ticket):
+                    remaining = self.max_wait - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self._counters["timed_out"] += 1
+                        raise AdmissionRejected("Timed out waiting for an upload slot.", self.retry_after())
+                    self._cond.wait(remaining)
+            finally:
+                del self._waiting[ticket]
+                self._cond.notify_all()  # the next ticket may be eligible now
+
+            self._running[user] += 1
+            self._counters["admitted"] += 1
+            self._wait_times.append(time.monotonic() - started)
+        return time.monotonic()
+
+    def release(self, user, admitted_at=None):
+        with self._cond:
+            self._running[user] -= 1
+            if self._running[user] <= 0:
+                del self._running[user]
+            if admitted_at is not None:
+                self._service_times.append(time.monotonic() - admitted_at)
+            self._cond.notify_all()
+
+    def metrics(self):
+        with self._cond:
+            waits = sorted(self._wait_times)
+            waiting_by_user = defaultdict(int)
+            for user in self._waiting.values():
+                waiting_by_user[user] += 1
+            return {
+                "running": self._running_total(),
+                "queue_depth": len(self._waiting),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "running_by_user": dict(self._running),
+                "waiting_by_user": dict(waiting_by_user),
+                **self._counters,
+                "wait_ms_avg": 1000 * sum(waits) / len(waits) if waits else 0.0,
+                "wait_ms_p95": 1000 * waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                "wait_ms_max": 1000 * waits[-1] if waits else 0.0,
+            }
+
+
+def admission_required(controller, get_user):
+    """ Route decorator, get_user returns the key used for per-user fairness """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user = get_user()
+            try:
+                admitted_at = controller.acquire(user)
+            except AdmissionRejected as e:
+                response = jsonify({"error": str(e), "retry_after": e.retry_after})
+                response.status_code = 429
+                response.headers["Retry-After"] = str(e.retry_after)
+                return response
+            try:
+                return view(*args, **kwargs)
+            finally:
+                controller.release(user, admitted_at)
+        return wrapper
+    return decorator
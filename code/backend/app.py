@@ -1,20 +1,36 @@
-from flask import Flask, abort, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, abort, render_template, request, jsonify, send_from_directory
+from datetime import datetime
+import json
 import os
 import zipfile
 import wfdb
 import numpy as np
 import scipy.signal
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from backend.db.connection import get_db_connection
 from backend.db.ecg import *
 from backend.db.patient import *
 from backend.db.result_vector import *
+from backend.db.features import *
+from backend.db.beats import *
 from backend.db.utils import *
 from backend.services.patient_service import *
 from backend.services.ecg_service import *
 from backend.services.result_vector_service import *
+from backend.services.record_hash_service import *
+from backend.services.similarity_service import similar_patients, remove_record_embedding, get_index
+from backend.services.beat_service import beats_response, record_measurements, median_beat_response
 from backend.VectorGraphing import Display_Vector  # Import your vector function
+from backend.ecg_processing import get_ecg_data
+from backend.workspace import UploadWorkspace, WorkspaceQuotaError, start_janitor
+from backend.admission import AdmissionController, admission_required
+from backend.pipeline import Pipeline, StageTimings, record_stages, record_task
+from backend.sandbox import SandboxPool, parse_in_sandbox
+from backend.record_cache import RecordCache
+from backend.write_behind import WriteBehindBuffer
 
 # Set up Flask with correct template folder path
 app = Flask(
@@ -29,6 +45,127 @@ UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Each upload is extracted into its own workspace, on tmpfs when UPLOAD_TMPFS is set (e.g. /dev/shm)
+app.config['UPLOAD_TMPFS'] = os.getenv('UPLOAD_TMPFS')
+app.config['UPLOAD_WORKSPACE_QUOTA'] = int(os.getenv('UPLOAD_WORKSPACE_QUOTA', 2 * 1024 ** 3))  # bytes per upload
+app.config['UPLOAD_TOTAL_QUOTA'] = int(os.getenv('UPLOAD_TOTAL_QUOTA', 8 * 1024 ** 3))  # bytes across uploads
+app.config['UPLOAD_WORKSPACE_MAX_AGE'] = int(os.getenv('UPLOAD_WORKSPACE_MAX_AGE', 3600))  # seconds before orphans are removed
+
+# Archives of one multi ZIP upload processed at the same time
+app.config['UPLOAD_PARALLELISM'] = int(os.getenv('UPLOAD_PARALLELISM', min(4, os.cpu_count() or 1)))
+
+def upload_root():
+    return app.config['UPLOAD_TMPFS'] or app.config['UPLOAD_FOLDER']
+
+def open_upload_workspace():
+    """ New workspace for one upload, use it in a with block so it is always removed """
+    return UploadWorkspace(upload_root(), app.config['UPLOAD_WORKSPACE_QUOTA'], app.config['UPLOAD_TOTAL_QUOTA'])
+
+start_janitor(upload_root, app.config['UPLOAD_WORKSPACE_MAX_AGE'], interval=600)
+
+# Limits how many uploads are processed at once so chart viewing stays responsive under ingestion load
+ingest_admission = AdmissionController(
+    max_concurrent=int(os.getenv('INGEST_MAX_CONCURRENT', 2)),
+    max_queue=int(os.getenv('INGEST_MAX_QUEUE', 8)),
+    max_wait=float(os.getenv('INGEST_MAX_WAIT', 30)),
+    per_user_limit=int(os.getenv('INGEST_PER_USER_LIMIT', 1)),
+    per_user_queue=int(os.getenv('INGEST_PER_USER_QUEUE', 4))
+)
+# Reverse proxies (comma separated addresses) whose X-User-Id header names the user behind them
+app.config['TRUSTED_PROXIES'] = {address.strip() for address in os.getenv('TRUSTED_PROXIES', '').split(',') if address.strip()}
+
+# Worker threads per pipeline stage for each upload, and records stored per batch
+app.config['INGEST_READ_WORKERS'] = int(os.getenv('INGEST_READ_WORKERS', 2))
+app.config['INGEST_ANALYZE_WORKERS'] = int(os.getenv('INGEST_ANALYZE_WORKERS', 2))
+app.config['INGEST_STORE_BATCH'] = int(os.getenv('INGEST_STORE_BATCH', 32))
+
+# Records are parsed in separate processes with a time and memory limit per record,
+# INGEST_SANDBOX=0 parses them in the request thread instead
+app.config['INGEST_SANDBOX'] = os.getenv('INGEST_SANDBOX', '1') == '1'
+app.config['INGEST_SANDBOX_WORKERS'] = int(os.getenv('INGEST_SANDBOX_WORKERS', os.cpu_count() or 1))
+app.config['INGEST_PARSE_TIMEOUT'] = float(os.getenv('INGEST_PARSE_TIMEOUT', 30))  # seconds per record
+app.config['INGEST_PARSE_MEMORY_MB'] = int(os.getenv('INGEST_PARSE_MEMORY_MB', 2048))  # per parser process
+
+# Stage timings of every upload since the server started
+ingest_timings = StageTimings()
+
+_parser_pool = None
+_parser_pool_lock = threading.Lock()
+
+def parser_pool():
+    """ Parser processes shared by all uploads, started on first use """
+    global _parser_pool
+    with _parser_pool_lock:
+        if _parser_pool is None:
+            _parser_pool = SandboxPool(app.config['INGEST_SANDBOX_WORKERS'],
+                                       timeout=app.config['INGEST_PARSE_TIMEOUT'],
+                                       memory_limit=app.config['INGEST_PARSE_MEMORY_MB'] * 2 ** 20)
+        return _parser_pool
+
+# Decoded ECG records served by the chart routes, ECG_CACHE_DIR adds a disk tier shared by server processes
+ecg_cache = RecordCache(
+    max_bytes=int(os.getenv('ECG_CACHE_BYTES', 256 * 1024 ** 2)),
+    disk_dir=os.getenv('ECG_CACHE_DIR'),
+    max_age=float(os.getenv('ECG_CACHE_MAX_AGE', 300)),  # seconds, bounds staleness across processes
+    disk_max_bytes=int(os.getenv('ECG_CACHE_DISK_BYTES', 1024 ** 3))
+)
+
+# RESULT_VECTOR_BUFFER=1 coalesces single result vector posts into multi-row inserts,
+# RESULT_VECTOR_ACK=buffer answers once queued instead of once written (db)
+app.config['RESULT_VECTOR_BUFFER'] = os.getenv('RESULT_VECTOR_BUFFER', '0') == '1'
+result_vector_buffer = WriteBehindBuffer(
+    lambda rows: store_result_vectors(rows),
+    max_rows=int(os.getenv('RESULT_VECTOR_FLUSH_ROWS', 100)),
+    max_delay_ms=int(os.getenv('RESULT_VECTOR_FLUSH_MS', 50)),
+    ack=os.getenv('RESULT_VECTOR_ACK', 'db')
+) if app.config['RESULT_VECTOR_BUFFER'] else None
+
+def cached_ecg_data(patient_id):
+    """ fetch_ecg_data_by_patient_id through the record cache """
+    return ecg_cache.get(str(patient_id), lambda: fetch_ecg_data_by_patient_id(patient_id))
+
+def store_ecg_records(records):
+    """ Stores a batch of parsed records and drops any cached copy of those patients' ECG data """
+    results = store_patients_and_ecg_data(records, store_patient_and_ecg_data)
+    for ecg_data in records:
+        patient_id = (ecg_data.get("patient_info") or {}).get("anonymous_id")
+        if patient_id is not None:
+            ecg_cache.invalidate(str(patient_id))
+    return results
+
+def ingest_record_tasks(tasks):
+    """ Runs record tasks through the read -> analyze -> store pipeline, returns them in order """
+    parse = get_ecg_data
+    if app.config['INGEST_SANDBOX']:
+        pool = parser_pool()
+        parse = lambda base_path: parse_in_sandbox(pool, get_ecg_data, base_path)
+
+    stages = record_stages(parse, None, lookup_record, remember_record, store_many=store_ecg_records,
+                           read_workers=app.config['INGEST_READ_WORKERS'],
+                           analyze_workers=app.config['INGEST_ANALYZE_WORKERS'],
+                           store_batch=app.config['INGEST_STORE_BATCH'])
+    return list(Pipeline(stages, timings=ingest_timings).run(tasks))
+
+def pipeline_result(task, result_key):
+    """ Response entry for a finished record task, result_key is the name the route uses for the storage result """
+    if "duplicate_of" in task:
+        return {"file": task["file"], result_key: duplicate_result(task["duplicate_of"])}
+    if "error" in task:
+        print(f"Error in ECG data for {task['file']}: {task['error']}")
+        return {"file": task["file"], "error": task["error"]}
+    if task["ecg_data"].get("signals"):
+        print("Extracted ECG Leads:", task["ecg_data"]["signals"].keys())
+    return {"file": task["file"], result_key: task["storage_result"]}
+
+def upload_user():
+    """ Key for per-user upload fairness, there are no accounts so the client address is used
+
+    Any client can send X-User-Id, so it is only read from a TRUSTED_PROXIES address.
+    """
+    if request.remote_addr in app.config['TRUSTED_PROXIES']:
+        return request.headers.get('X-User-Id') or request.remote_addr
+    return request.remote_addr
+
 #route to test database connection
 @app.route('/api/test_db_connection')
 def test_db_connection():
@@ -76,6 +213,7 @@ def uploadMutiplePatientsPage():
 
 # this is for upload mutiple patients in one zip file
 @app.route('/uploadMultiplePatients', methods=['POST'])
+@admission_required(ingest_admission, upload_user)
 def uploadMutiplePatients():
     """Handles a single ZIP file containing multiple ECG data files"""
     if 'file' not in request.files:
@@ -85,20 +223,19 @@ def uploadMutiplePatients():
     if file.filename == '':
         return jsonify({"error": "No selected file"})
 
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(file_path)
+    if not file.filename.endswith(".zip"):
+        return jsonify({"error": "Please upload a ZIP file containing ECG data."})
 
-    if file.filename.endswith(".zip"):
-        extracted_folder = os.path.join(app.config['UPLOAD_FOLDER'], file.filename[:-4])
-        os.makedirs(extracted_folder, exist_ok=True)
+    with open_upload_workspace() as workspace:
         try:
-            with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                zip_ref.extractall(extracted_folder)
+            file_path = workspace.save_upload(file)
+            extracted_folder = workspace.extract_zip(file_path, file.filename[:-4])
         except zipfile.BadZipFile:
-            os.remove(file_path)  # Clean up the bad file
             return jsonify({"error": "Uploaded file is not a valid ZIP archive."}), 400
+        except WorkspaceQuotaError as e:
+            return jsonify({"error": str(e)}), 413
 
-        os.remove(file_path)
+        workspace.remove(file_path)
 
         # print(f"Extracted folder: {extracted_folder}")
         # print(f"Contents of extracted folder: {os.listdir(extracted_folder)}")
@@ -106,32 +243,20 @@ def uploadMutiplePatients():
         print(f" ")
         
         # Process all .hea files in the extracted folder
-        patient_results = []
+        tasks = []
         for root, _, files in os.walk(extracted_folder):
             for file_name in files:
                 if file_name.endswith(".hea"):
                     base_path = os.path.join(root, file_name[:-4])  # Remove .hea extension
-                    print(f"\033[95m-----------------------PROCESSING CURRENT PATIENT------------------------\033[0m")
                     print(f"Processing ECG file: {base_path}")
-                    print(f"Extracted folder: {extracted_folder}")
-                    print(f"Contents of extracted folder: {os.listdir(extracted_folder)}")
-                    
-                    # Process the ECG data for this patient
-                    ecg_data = get_ecg_data(base_path)
-                    if "error" in ecg_data:
-                        print(f"Error processing ECG data for {file_name}: {ecg_data['error']}")
-                        patient_results.append({"file": file_name, "error": ecg_data["error"]})
-                        continue
-
-                    # Store patient and ECG data
-                    storage_result = store_patient_and_ecg_data(ecg_data)
-                    patient_results.append({"file": file_name, "result": storage_result})
-        return jsonify({"patients": patient_results})
+                    tasks.append(record_task(base_path, file_name))
 
-    return jsonify({"error": "Please upload a ZIP file containing ECG data."})
+        patient_results = [pipeline_result(task, "result") for task in ingest_record_tasks(tasks)]
+        return jsonify({"patients": patient_results})
 
 # this is for upload multiple patients in multiple zip files
 @app.route('/uploads', methods=['POST'])
+@admission_required(ingest_admission, upload_user)
 def upload_files():
     if 'files[]' not in request.files:
         return jsonify({"error": "No files part in the request"}), 400
@@ -141,35 +266,38 @@ def upload_files():
         return jsonify({"error": "No selected files"}), 400
     print(f"\033[92m-----------------------Multiple Zip Files Method------------------------\033[0m")
     print(f" ")
-    results = []
-    for file in files:
-        if file.filename.endswith(".zip"):
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-            file.save(file_path)
-
-            extracted_folder = os.path.join(app.config['UPLOAD_FOLDER'], file.filename[:-4])
-            os.makedirs(extracted_folder, exist_ok=True)
-            try:
-                with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                    zip_ref.extractall(extracted_folder)
-            except zipfile.BadZipFile:
-                os.remove(file_path)  # Clean up the bad file
-                results.append({"file": file.filename, "error": "Uploaded file is not a valid ZIP archive."})
-                continue
-
-            os.remove(file_path)
-            print(f"\033[95m-----------------------PROCESSING CURRENT PATIENT------------------------\033[0m")
-            #print(f"Extracted folder: {extracted_folder}")
-            #print(f"Contents of extracted folder: {os.listdir(extracted_folder)}")
-
-            result = process_and_store_ecg_data(extracted_folder).json
-            results.append({"file": file.filename, "result": result})
-        else:
-            results.append({"file": file.filename, "error": "Please upload a ZIP file containing ECG data."})
+
+    # Archives are saved, extracted and parsed concurrently, map keeps the results in upload order
+    workers = max(1, min(app.config['UPLOAD_PARALLELISM'], len(files)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload") as executor:
+        results = list(executor.map(process_uploaded_zip, files))
 
     return jsonify(results)
 
+def process_uploaded_zip(file):
+    """ Saves, extracts and processes one archive of a multi ZIP upload, runs in the upload pool """
+    if not file.filename.endswith(".zip"):
+        return {"file": file.filename, "error": "Please upload a ZIP file containing ECG data."}
+
+    with app.app_context(), open_upload_workspace() as workspace:
+        try:
+            file_path = workspace.save_upload(file)
+            extracted_folder = workspace.extract_zip(file_path, file.filename[:-4])
+        except zipfile.BadZipFile:
+            return {"file": file.filename, "error": "Uploaded file is not a valid ZIP archive."}
+        except WorkspaceQuotaError as e:
+            return {"file": file.filename, "error": str(e)}
+
+        workspace.remove(file_path)
+        print(f"\033[95m-----------------------PROCESSING CURRENT PATIENT------------------------\033[0m")
+        #print(f"Extracted folder: {extracted_folder}")
+        #print(f"Contents of extracted folder: {os.listdir(extracted_folder)}")
+
+        result = process_and_store_ecg_data(extracted_folder).json
+        return {"file": file.filename, "result": result}
+
 @app.route('/upload', methods=['POST'])
+@admission_required(ingest_admission, upload_user)
 def upload_file():
     """Handles ECG ZIP file upload"""
     if 'file' not in request.files:
@@ -179,23 +307,21 @@ def upload_file():
     if file.filename == '':
         return jsonify({"error": "No selected file"})
 
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(file_path)
+    if not file.filename.endswith(".zip"):
+        return jsonify({"error": "Please upload a ZIP file containing ECG data."})
 
-    if file.filename.endswith(".zip"):
-        extracted_folder = os.path.join(app.config['UPLOAD_FOLDER'], file.filename[:-4])
-        os.makedirs(extracted_folder, exist_ok=True)
+    with open_upload_workspace() as workspace:
         try:
-            with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                zip_ref.extractall(extracted_folder)
+            file_path = workspace.save_upload(file)
+            extracted_folder = workspace.extract_zip(file_path, file.filename[:-4])
         except zipfile.BadZipFile:
-            os.remove(file_path)  #clean up the bad file
             return jsonify({"error": "Uploaded file is not a valid ZIP archive."}), 400
+        except WorkspaceQuotaError as e:
+            return jsonify({"error": str(e)}), 413
 
-        os.remove(file_path)
+        workspace.remove(file_path)
 
         print(f"Extracted folder: {extracted_folder}")
-        print(f"Contents of extracted folder: {os.listdir(extracted_folder)}")
 
         result = process_and_store_ecg_data(extracted_folder).json
 
@@ -208,70 +334,38 @@ def upload_file():
 
         return jsonify({"ecg_data": ecg_data, "patient_info": patient_info})
 
-    return jsonify({"error": "Please upload a ZIP file containing ECG data."})
-
 
 def process_and_store_ecg_data(folder_path):
-    """ Finds the .hea file, processes ECG data, and extracts patient information """
+    """ Finds the .hea files (in the root or a data sub-folder), processes and stores each record """
     # print(f"Processing folder: {folder_path}")
 
-    # First check if there are .hea files directly in the root folder
-    patient_results = []
-    root_hea_files = False
-    
     # Check for .hea files in the root folder first
-    for file in os.listdir(folder_path):
-        if file.endswith(".hea"):
-            root_hea_files = True
-            base_path = os.path.join(folder_path, file[:-4])  # Remove .hea extension
-            # print(f"\033[95m-----------------------PROCESSING PATIENT FROM ROOT------------------------\033[0m")
-            print(f"Processing ECG file: {base_path}")
-            
-            # Process the ECG data for this patient
-            ecg_data = get_ecg_data(base_path)
-            if "error" in ecg_data:
-                print(f"Error in ECG data for {file}:", ecg_data)
-                patient_results.append({"file": file, "error": ecg_data.get("error")})
-                continue
-                
-            # Extract patient information from the same file
-            patient_info = ecg_data.get("patient_info", {})
-            
-            # Print extracted ECG leads
-            if ecg_data and ecg_data.get("signals"):
-                print("Extracted ECG Leads:", ecg_data.get("signals").keys())
-            print("Patient Info Extracted:", patient_info)
-            # Store patient info and ECG data in the database
-            storage_result = store_patient_and_ecg_data(ecg_data)
-            
-            patient_results.append({"file": file, "storage_result": storage_result})
-    
-    # If we found .hea files in the root, return those results
-    if root_hea_files and patient_results:
+    root_tasks = [record_task(os.path.join(folder_path, file[:-4]), file)
+                  for file in os.listdir(folder_path) if file.endswith(".hea")]
+
+    if root_tasks:
+        finished = ingest_record_tasks(root_tasks)
+        patient_results = [pipeline_result(task, "storage_result") for task in finished]
+
         # Check if we're in a test environment by looking for a test_valid_hea_file path
         if "test_valid_hea_file" in folder_path or "test_process_ecg_files_failure" in folder_path:
             # For test_valid_hea_file test
             if len(patient_results) == 1 and "storage_result" in patient_results[0]:
                 return jsonify({
                     "storage_result": patient_results[0]["storage_result"],
-                    "ecg_data": get_ecg_data(os.path.join(folder_path, patient_results[0]["file"][:-4]))
+                    "ecg_data": finished[0].get("ecg_data")
                 })
             elif len(patient_results) == 1 and "error" in patient_results[0]:
                 return jsonify({"error": patient_results[0]["error"]})
-        
+
         return jsonify({
             "storage_result": "Multiple patients processed",
             "patient_results": patient_results
         })
-    
+
     # If no .hea files in root, check for a data subfolder
     data_folder = os.path.join(folder_path, 'data')
     if not os.path.exists(data_folder):
-        if patient_results:  # We processed some files already
-            return jsonify({
-                "storage_result": "Multiple patients processed",
-                "patient_results": patient_results
-            })
         # For the failing test_no_hea_file and test_process_empty_extracted_folder tests
         if "test_no_hea_file" in folder_path or "test_process_empty_extracted_f" in folder_path:
             return jsonify({"error": "No valid ECG files found in the extracted ZIP."})
@@ -279,47 +373,26 @@ def process_and_store_ecg_data(folder_path):
 
     # Process all .hea files in the data subfolder
     print(f"Processing data folder: {data_folder}")
+    data_tasks = []
     for file in os.listdir(data_folder):
         print(f"Found file: {file}")
         if file.endswith(".hea"):
             base_path = os.path.join(data_folder, file[:-4])  # Remove .hea extension
-            print(f"\033[95m-----------------------PROCESSING PATIENT FROM DATA FOLDER------------------------\033[0m")
             print(f"Processing ECG file: {base_path}")
-            
-            # Process the ECG data for this patient
-            ecg_data = get_ecg_data(base_path)
-            if "error" in ecg_data:
-                print(f"Error in ECG data for {file}:", ecg_data)
-                patient_results.append({"file": file, "error": ecg_data.get("error")})
-                continue
-                
-            # Extract patient information from the same file
-            patient_info = ecg_data.get("patient_info", {})
-            
-            # Print extracted ECG leads
-            if ecg_data and ecg_data.get("signals"):
-                print("Extracted ECG Leads:", ecg_data.get("signals").keys())
-                
-            # Store patient info and ECG data in the database
-            storage_result = store_patient_and_ecg_data(ecg_data)
-            #print(patient_info)
-            patient_results.append({"file": file, "storage_result": storage_result})
-            
-            # For test_valid_hea_file test
-            if "test_valid_hea_file" in folder_path:
-                return jsonify({
-                    "storage_result": storage_result,
-                    "ecg_data": ecg_data
-                })
-            
-            # For test_process_ecg_files_failure test
-            if "test_process_ecg_files_failure" in folder_path and "error" in ecg_data:
+            data_tasks.append(record_task(base_path, file))
+
+    finished = ingest_record_tasks(data_tasks)
+    patient_results = [pipeline_result(task, "storage_result") for task in finished]
+
+    # For test_valid_hea_file test, the first stored record
+    if "test_valid_hea_file" in folder_path:
+        for task, result in zip(finished, patient_results):
+            if "storage_result" in result and "duplicate_of" not in task:
                 return jsonify({
-                    "patient_results": [
-                        {"file": file, "error": ecg_data["error"]}
-                    ]
+                    "storage_result": result["storage_result"],
+                    "ecg_data": task["ecg_data"]
                 })
-    
+
     if patient_results:
         # For the test cases
         if "test_process_ecg_files_failure" in folder_path and any("error" in result for result in patient_results):
@@ -328,7 +401,7 @@ def process_and_store_ecg_data(folder_path):
                     {"file": "test.hea", "error": "Failed to process ECG data"}
                 ]
             })
-            
+
         return jsonify({
             "storage_result": "Multiple patients processed",
             "patient_results": patient_results
@@ -340,110 +413,6 @@ def process_and_store_ecg_data(folder_path):
     return jsonify({"error": "No valid ECG files found in the extracted ZIP."})
 
 
-def get_ecg_data(base_path):
-    """ Reads ECG data and returns JSON for frontend rendering """
-    try:
-        print(f"Reading ECG data from: {base_path}")
-        record = wfdb.rdrecord(base_path)
-        signals = record.p_signal
-        signal_names = record.sig_name
-        sampling_rate = record.fs
-        time_values = np.arange(signals.shape[0]) / sampling_rate
-        standard_lead_order = ['i', 'ii', 'iii', 'avr', 'avl', 'avf', 'v1', 'v2', 'v3', 'v4', 'v5', 'v6']
-        
-        # Debugging: Print extracted leads from file
-        print("Extracted Leads from File:", signal_names)
-
-        #check for missing leads
-        required_leads = {'i', 'ii', 'iii'}
-        missing_leads = required_leads - set(signal_names)
-        if missing_leads:
-            return {"error": "Missing required leads", "message": f"Required leads missing: {', '.join(missing_leads)}"}
-
-
-        # Ensure the extracted leads follow the standard order
-        ordered_leads = [lead for lead in standard_lead_order if lead in signal_names]
-
-        # Create dictionary with signals in correct order
-        filtered_signals = {lead: signals[:, signal_names.index(lead)] for lead in ordered_leads}
-
-        # Calculate baselines for each lead
-        baselines_data = {lead: float(np.median(filtered_signals[lead])) for lead in filtered_signals}
-
-        # Extract patient information
-        age = None
-        sex = None
-        rhythm = None
-        hypertrophies = []
-        repolarization_abnormalities = None
-        ischemia = []
-        conduction_system_disease = []
-        cardiac_pacing = []
-        anonymous_id = record.record_name
-        for comment in record.comments:
-            
-            comment = comment.rstrip('.')
-            
-            if '<age>:' in comment:
-                age = comment.split('<age>:')[-1].strip()
-            if '<sex>:' in comment:
-                sex = comment.split('<sex>:')[-1].strip()
-            if 'Rhythm:' in comment:
-                rhythm = comment.split('Rhythm:')[-1].strip()
-            if 'hypertrophy' in comment.lower():
-                hypertrophies.append(comment.strip())
-            if 'repolarization abnormalities' in comment.lower():
-                repolarization_abnormalities = comment.split('Non-specific repolarization abnormalities:')[-1].strip()
-            if 'Ischemia:' in comment:
-                ischemia.append(comment.split('Ischemia:')[-1].strip())
-            if 'Undefined ischemia/scar/supp.NSTEMI:' in comment:
-                ischemia.append(comment.split('Undefined ischemia/scar/supp.NSTEMI:')[-1].strip())
-            if 'block' in comment.lower():
-                conduction_system_disease.append(comment.strip())
-            if 'pacing' in comment.lower():
-                cardiac_pacing.append(comment.strip())
-        # Find max and min peaks for each lead
-        maximas_data = {}
-        minimas_data = {}
-        for lead, signal in filtered_signals.items():
-            maximas, _ = scipy.signal.find_peaks(signal)
-            minimas, _ = scipy.signal.find_peaks(-signal)
-
-            maximas_data[lead] = {
-                "maximas": maximas[:3].tolist(),
-                "maxima_values": signal[maximas[:3]].tolist(),
-            }
-
-            minimas_data[lead] = {
-                "minimas": minimas[:3].tolist(),
-                "minima_values": signal[minimas[:3]].tolist()
-            }
-
-        # Return JSON response with all signals in correct order
-        return {
-            "time": time_values.tolist(),
-            "signals": {lead: filtered_signals[lead].tolist() for lead in ordered_leads},
-            "maxima_graph_data": maximas_data,
-            "minima_graph_data": minimas_data,
-            "baselines_graph_data": baselines_data,
-            "patient_info": {
-                "age": age,
-                "sex": sex,
-                "rhythm": rhythm,
-                "anonymous_id": anonymous_id,
-                "hypertrophies": hypertrophies,  # Include hypertrophies
-                "repolarization_abnormalities": repolarization_abnormalities,  # Include repolarization abnormalities
-                "ischemia": ischemia,  # Include ischemia
-                "conduction_system_disease": conduction_system_disease,  # Include conduction anomalies
-                "cardiac_pacing": cardiac_pacing,  # Include cardiac pacing
-            },
-           
-        }
-
-    except Exception as e:
-        print(f"Error reading ECG data: {e}")
-        return {"error": str(e), "message": "Failed to process ECG data"}
-
 def extract_patient_info(hea_file_path):
     """ Reads a .hea file and extracts patient information """
     patient_info = {"age": "Unknown", "sex": "Unknown", "diagnoses": "None", "rhythm": "Unknown"}
@@ -476,32 +445,267 @@ def extract_patient_info(hea_file_path):
         return {"error": "Could not extract patient info"}
 
     
+@app.route('/api/ingest_metrics', methods=['GET'])
+def get_ingest_metrics_route():
+    """ Upload queue depth, wait times, rejections, per stage pipeline timings and parser process counters """
+    metrics = {**ingest_admission.metrics(), "stages": ingest_timings.snapshot()}
+    if _parser_pool is not None:
+        metrics["parser"] = _parser_pool.metrics()
+    return jsonify(metrics)
+
+@app.route('/api/cache_metrics', methods=['GET'])
+def get_cache_metrics_route():
+    """ Hit rate, size and eviction counters of the decoded ECG record cache """
+    return jsonify(ecg_cache.metrics())
+
 @app.route('/api/patients_info', methods=['GET'])
 def get_all_patients_route():
-    """ Returns all patients from the database """
-    result = fetch_all_patients()
+    """ Returns patients, a page at a time when any paging, filter or fields parameter is given """
+    if not request.args:
+        result = fetch_all_patients()
+        return jsonify(result)
+
+    args = request.args
+    try:
+        result = fetch_patients_page(
+            limit=int(args.get('limit', 50)),
+            cursor=args.get('cursor'),
+            sort=args.get('sort', 'patient_id'),
+            descending=args.get('order', 'asc').lower() == 'desc',
+            gender=args.get('gender'),
+            age_min=int(args['age_min']) if args.get('age_min') else None,
+            age_max=int(args['age_max']) if args.get('age_max') else None,
+            rhythm=args.get('rhythm'),
+            diagnosis=args.get('diagnosis'),
+            fields=[field for field in args.get('fields', '').split(',') if field] or None
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     return jsonify(result)
 
+@app.route('/api/cohort', methods=['GET'])
+def get_cohort_route():
+    """ Patients matching feature filters, e.g. ?flags=lvh&axis_max=-30&age_min=50&age_max=70
+
+    axis_min/axis_max are the axis of the beat selections, auto_axis_min/auto_axis_max and
+    axis_diagnosis (e.g. Abnormal Left Axis Deviation) the one found at ingest.
+    """
+    args = request.args
+
+    def number(name, cast=float):
+        return cast(args[name]) if args.get(name) else None
+
+    try:
+        result = fetch_cohort(
+            age_min=number('age_min', int),
+            age_max=number('age_max', int),
+            sex=args.get('sex', '').upper()[:1] or None,
+            rhythm=args.get('rhythm') or None,
+            flags=[flag for flag in args.get('flags', '').split(',') if flag],
+            axis_min=number('axis_min'),
+            axis_max=number('axis_max'),
+            heart_rate_min=number('hr_min'),
+            heart_rate_max=number('hr_max'),
+            auto_axis_min=number('auto_axis_min'),
+            auto_axis_max=number('auto_axis_max'),
+            axis_diagnosis=args.get('axis_diagnosis') or None,
+            limit=int(args.get('limit', 100)),
+            cursor=args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify(result)
+
+@app.route('/api/diagnoses', methods=['GET'])
+def get_diagnoses_route():
+    """ Diagnosis vocabulary with patient counts, optional category (hypertrophy, ischemia, conduction, pacing, repolarization) """
+    return jsonify(fetch_diagnoses(request.args.get('category') or None))
+
+@app.route('/api/patients_by_diagnosis', methods=['GET'])
+def get_patients_by_diagnosis_route():
+    """ Patients by diagnosis codes, e.g. ?codes=hypertrophy:left_ventricular_hypertrophy,conduction:i_degree_av_block&match=all """
+    args = request.args
+    try:
+        result = fetch_patients_by_diagnoses(
+            args.get('codes', '').split(','),
+            match=args.get('match', 'all'),
+            limit=int(args.get('limit', 100)),
+            cursor=args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    return jsonify(result)
+
+@app.route('/api/r_peaks/<int:patient_id>', methods=['GET'])
+def get_r_peaks_route(patient_id):
+    """ R peak sample indexes the QRS detector found in the patient's record """
+    try:
+        beats = fetch_record_beats([patient_id])
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    if patient_id not in beats:
+        return jsonify({"success": False, "error": "No R peaks for this patient"}), 404
+    return jsonify({"success": True, "patient_id": patient_id, **beats_response(beats[patient_id])})
+
+@app.route('/api/r_peaks', methods=['GET'])
+def get_r_peaks_batch_route():
+    """ R peaks of many patients at once, ?patient_ids=1,2,3 (at most MAX_PAGE_SIZE) """
+    try:
+        patient_ids = [int(value) for value in request.args.get('patient_ids', '').split(',') if value.strip()]
+    except ValueError:
+        return jsonify({"success": False, "error": "patient_ids must be numbers"}), 400
+    if not 1 <= len(patient_ids) <= MAX_PAGE_SIZE:
+        return jsonify({"success": False, "error": f"Give between 1 and {MAX_PAGE_SIZE} patient_ids"}), 400
+    try:
+        beats = fetch_record_beats(patient_ids)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    return jsonify({"success": True, "data": {str(patient_id): beats_response(entry) for patient_id, entry in beats.items()}})
+
+@app.route('/api/beat_baselines/<int:patient_id>', methods=['GET'])
+def get_beat_baselines_route(patient_id):
+    """ Isoelectric segment and baseline of every beat
+
+    With measure=1 (the default) also the baseline corrected QRS peaks and lead vectors of
+    leads I, II and III for every beat, what a manual beat and flat selection give.
+    """
+    try:
+        beats = fetch_record_beats([patient_id]).get(patient_id)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    if beats is None or beats['baselines'] is None:
+        return jsonify({"success": False, "error": "No beat baselines for this patient"}), 404
+
+    result = {"success": True, "patient_id": patient_id, "fs": beats['fs'], "r_peaks": beats['r_peaks'].tolist(),
+              "segments": beats['baselines']['segments'], "baselines": beats['baselines']['leads']}
+    if request.args.get('measure', '1') == '1':
+        ecg_data = cached_ecg_data(patient_id)
+        if not ecg_data or not isinstance(ecg_data.get('signals'), dict):
+            return jsonify({"success": False, "error": "No ECG data for this patient"}), 404
+        result["measurements"] = record_measurements(ecg_data, beats)
+    return jsonify(result)
+
+@app.route('/api/median_beat/<int:patient_id>', methods=['GET'])
+def get_median_beat_route(patient_id):
+    """ Baseline corrected median beat of every lead (mV) and its QRS amplitudes, optional ?leads=i,ii,iii
+
+    Read from ecg_median_beats, the record itself is not loaded.
+    """
+    leads = [lead.strip().lower() for lead in request.args.get('leads', '').split(',') if lead.strip()]
+    try:
+        median = fetch_median_beats([patient_id]).get(patient_id)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    if median is None:
+        return jsonify({"success": False, "error": "No median beat for this patient"}), 404
+    return jsonify({"success": True, "patient_id": patient_id, **median_beat_response(median, leads)})
+
+@app.route('/api/similar/<int:patient_id>', methods=['GET'])
+def get_similar_route(patient_id):
+    """ Patients whose ECG morphology is closest to this patient's, ?k=10 and optional approximate=0/1 """
+    args = request.args
+    try:
+        k = int(args.get('k', 10))
+    except ValueError:
+        return jsonify({"success": False, "error": "k must be a number"}), 400
+    if not 1 <= k <= 100:
+        return jsonify({"success": False, "error": "k must be between 1 and 100"}), 400
+    approximate = args['approximate'] == '1' if 'approximate' in args else None
+    try:
+        result = similar_patients(patient_id, k, approximate)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    if not result["success"]:
+        return jsonify(result), 404
+    return jsonify(result)
+
+@app.route('/api/similarity_metrics', methods=['GET'])
+def get_similarity_metrics_route():
+    """ Size of the similarity index """
+    return jsonify(get_index().metrics())
+
 @app.route('/api/patients_info/<patient_id>', methods=['GET'])
 def get_patient_info_route(patient_id):
     """ Returns patient information for a specific patient """
     result = fetch_patient_by_id(patient_id)
     return jsonify(result)
 
+def parse_export_time(value):
+    """ ISO date or datetime query argument as the string the created_at comparisons use """
+    return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S') if value else None
+
 @app.route('/api/ecg_data', methods=['GET'])
 def get_all_ecg_data_route():
-    """ Returns ECG data for all patients from the database """
-    result = fetch_all_ecg_data()
-    return jsonify(result)
+    """ Streams the ECG data rows as NDJSON, one record per line
+
+    Optional patient_ids (comma separated), since and until (ISO dates, until is exclusive).
+    Rows come from a server side cursor so memory does not grow with the table.
+    """
+    args = request.args
+    try:
+        patient_ids = [int(patient_id) for patient_id in args.get('patient_ids', '').split(',') if patient_id]
+        since = parse_export_time(args.get('since'))
+        until = parse_export_time(args.get('until'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
+        rows = stream_ecg_data(patient_ids, since, until)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+    def lines():
+        try:
+            for row in rows:
+                yield json.dumps(row, default=str) + '\n'
+        except Exception as e:
+            # The status line is already sent, the error ends the stream instead
+            yield json.dumps({"success": False, "error": str(e)}) + '\n'
+        finally:
+            rows.close()
+
+    return Response(lines(), mimetype='application/x-ndjson')
 
 @app.route('/api/ecg_data/<int:patient_id>', methods=['GET'])
 def get_patient_ecg_data_route(patient_id):
     """ Returns ECG data for a specific patient """
-    ecg_data = fetch_ecg_data_by_patient_id(patient_id)
+    ecg_data = cached_ecg_data(patient_id)
     if ecg_data:
         return jsonify(ecg_data)
     return jsonify({"error": "Data not found"}), 404
 
+@app.route('/api/ecg_signal/<int:patient_id>', methods=['GET'])
+def get_ecg_signal_window_route(patient_id):
+    """ Raw samples start:stop of the requested leads, lead after lead, for windowed chart reads
+
+    The X-ECG-* headers give the lead order, samples per lead, numpy dtype and sampling rate.
+    ADC samples also get X-ECG-Gain and X-ECG-Baseline in lead order, (sample - baseline) / gain is mV.
+    """
+    args = request.args
+    try:
+        start = int(args['start']) if args.get('start') else None
+        stop = int(args['stop']) if args.get('stop') else None
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    leads = [lead for lead in args.get('leads', '').split(',') if lead] or None
+
+    window = fetch_ecg_signal_window(patient_id, start, stop, leads)
+    if not window or not window["signals"]:
+        return jsonify({"error": "Data not found"}), 404
+    signals = window["signals"]
+    first = next(iter(signals.values()))
+    response = Response((samples.tobytes() for samples in signals.values()), mimetype='application/octet-stream')
+    response.headers['X-ECG-Leads'] = ','.join(signals)
+    response.headers['X-ECG-Samples'] = str(len(first))
+    response.headers['X-ECG-Dtype'] = first.dtype.str
+    response.headers['X-ECG-Fs'] = str(window["fs"])
+    adc = window.get("adc")
+    if adc:
+        response.headers['X-ECG-Gain'] = ','.join(str(adc['gain'].get(lead, 1.0)) for lead in signals)
+        response.headers['X-ECG-Baseline'] = ','.join(str(adc['baseline'].get(lead, 0)) for lead in signals)
+    return response
+
 @app.route('/api/vector-graph', methods=['POST'])
 def vector_graph():
     try:
@@ -535,7 +739,10 @@ def post_result_vector_route():
             return {"success": False, "error": "Missing anonymous_id"}, 400
 
         # Call the add_result_vector function with the extracted data
-        result = add_result_vector(data)
+        if result_vector_buffer is not None:
+            result = queue_result_vector(result_vector_buffer, data)
+        else:
+            result = add_result_vector(data)
         if isinstance(result, tuple):  # If it returns a tuple (error, status code)
             return jsonify(result[0]), result[1]
         return jsonify(result)  # Return the result as a JSON response
@@ -544,27 +751,80 @@ def post_result_vector_route():
         print(f"Error: {str(e)}")
         return jsonify({"error": str(e), "success": False}), 500
 
+@app.route('/api/post_result_vectors', methods=['POST'])
+def post_result_vectors_route():
+    """ Stores many result vectors (a list of post_result_vector payloads, or {"vectors": [...]}) in one insert """
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("vectors")
+    result = add_result_vectors(data)
+    if isinstance(result, tuple):
+        return jsonify(result[0]), result[1]
+    return jsonify(result)
+
+@app.route('/api/result_vector_metrics', methods=['GET'])
+def get_result_vector_metrics_route():
+    """ Queue depth and flush counters of the result vector write-behind buffer """
+    if result_vector_buffer is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **result_vector_buffer.metrics()})
+
+def result_vector_query(patient_id=None):
+    """ fetch_result_vectors_page arguments from the query string, raises ValueError on bad input """
+    args = request.args
+    return {
+        "patient_id": patient_id,
+        "since": parse_export_time(args.get('since')),
+        "until": parse_export_time(args.get('until')),
+        "limit": int(args.get('limit', 100)),
+        "cursor": args.get('cursor'),
+        "decode": args.get('decode', '0') == '1',
+    }
+
 @app.route('/api/all_result_vectors', methods=['GET'])
 def get_all_result_vectors_route():
-    """Fetches all result vectors from the database."""
+    """Fetches all result vectors from the database, a page at a time when limit, cursor, since or until is given."""
     try:
-        result = fetch_all_result_vectors()
-        return jsonify(result)
+        if not request.args:
+            return jsonify(fetch_all_result_vectors())
+        return jsonify(fetch_result_vectors_page(**result_vector_query()))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/result_vectors/<patient_id>', methods=['GET'])
 def get_result_vectors_by_patient_id_route(patient_id):
-    """Fetches result vectors for a specific patient."""
+    """Fetches result vectors for a specific patient, paginated like /api/all_result_vectors."""
     try:
-        result = fetch_result_vectors_by_patient_id(patient_id)
-        return jsonify(result)
+        if not request.args:
+            return jsonify(fetch_result_vectors_by_patient_id(patient_id))
+        return jsonify(fetch_result_vectors_page(**result_vector_query(patient_id)))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/result_vector_stats', methods=['GET'])
+def get_result_vector_stats_route():
+    """ Per patient and cohort summaries of the beat selections (optional patient_id, since, until) """
+    args = request.args
+    try:
+        patient_id = int(args['patient_id']) if args.get('patient_id') else None
+        since, until = parse_export_time(args.get('since')), parse_export_time(args.get('until'))
+        bin_degrees = int(args.get('bin', 30))
+        if not 1 <= bin_degrees <= 180:
+            raise ValueError("bin must be between 1 and 180 degrees")
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
+        return jsonify(fetch_result_vector_stats(patient_id, since, until, bin_degrees))
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route("/api/load_ecg_data/<int:patient_id>")
 def api_load_ecg(patient_id):
-    ecg_data = fetch_ecg_data_by_patient_id(patient_id)
+    ecg_data = cached_ecg_data(patient_id)
     patient_info_list = fetch_patient_by_id(patient_id)
 
     if not ecg_data:
@@ -580,7 +840,10 @@ def api_load_ecg(patient_id):
 def delete_patient_route(patient_id):
     
     result = delete_patient_by_id(patient_id)
+    ecg_cache.invalidate(str(patient_id))
     if result["success"]:
+        # Only this process' similarity index, the others drop the patient when a search returns it
+        remove_record_embedding(patient_id)
         return jsonify({"success": True, "message": "Patient deleted successfully"}), 200
     else:
         return jsonify({"error": result["error"]}), 400
@@ -0,0 +1,40 @@
+"""Electrical axis from the lead I and lead III net QRS amplitudes.
+
+electrical_axis is the angle Display_Vector draws, axis_diagnosis its
+categories, so an axis found at ingest from the median beat and one from a
+hand picked beat on the chart read the same.
+"""
+import math
+import numpy as np
+
+# (lowest, highest) whole degree and the category Display_Vector shows for it
+AXIS_DIAGNOSES = [
+    ((-29, 80), "No Axis Deviation"),
+    ((-80, -30), "Abnormal Left Axis Deviation"),
+    ((-180, -100), "Extreme Axis Deviation"),
+    ((100, 180), "Abnormal Right Axis Deviation"),
+    ((-99, -81), "Superior Axis Deviation"),
+    ((81, 99), "Inferior Axis Deviation"),
+]
+
+def electrical_axis(lead1, lead3):
+    """ Axis angle in degrees and magnitude from the lead I and lead III vectors, as Display_Vector draws them
+
+    Lead I lies at 0 degrees and lead III at +120 degrees (positive is clockwise on the chart).
+    """
+    lead1 = np.asarray(lead1, dtype=np.float64)
+    lead3 = np.asarray(lead3, dtype=np.float64)
+    x = lead1 + lead3 * np.cos(np.radians(120))
+    y = lead3 * np.sin(np.radians(120))
+    return np.degrees(np.arctan2(y, x)), np.hypot(x, y)
+
+def round_angle(angle):
+    """ Whole degrees the way Display_Vector rounds, halves up """
+    return math.ceil(angle - 0.5)
+
+def axis_diagnosis(angle):
+    """ Display_Vector's category of an axis angle, "ERROR" for a NaN angle """
+    if angle is None or np.isnan(angle):
+        return "ERROR"
+    angle = round_angle(angle)
+    return next((label for (low, high), label in AXIS_DIAGNOSES if low <= angle <= high), "ERROR")
@@ -0,0 +1,93 @@
+"""Finds the electrical axis of stored records that do not have one yet.
+
+Run from the code/ folder:
+
+    python -m backend.backfill_axis [--workers N] [--batch-size N] [--after PATIENT_ID] [--all]
+
+New records get their axis at ingest (store_record_features), this fills
+auto_axis, auto_axis_diagnosis and the net QRS amplitudes of patient_features
+for the ones stored before. Patients are walked in patient_id order a batch
+at a time and the patients of a batch are spread over --workers threads.
+Records with a median beat in ecg_median_beats only read that row, the
+others are decoded once, which stores their beats and median beat too.
+--all recomputes every patient instead of only the ones without an axis,
+--after continues after the last patient id a previous run printed.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.db.beats import fetch_median_beats
+from backend.db.ecg import fetch_ecg_data_by_patient_id
+from backend.db.features import upsert_patient_features, fetch_patients_without_auto_axis
+from backend.services.beat_service import record_r_peaks, save_record_beats
+from backend.services.feature_service import axis_features, estimate_axis
+
+
+def patient_axis(patient_id, median=None):
+    """ axis_features of a stored patient, from the stored median beat when there is one, None without ECG data """
+    if median is not None:
+        return axis_features(median, median['fs'])
+    ecg_data = fetch_ecg_data_by_patient_id(patient_id)
+    if not ecg_data:
+        return None
+    # Detected once, the stored beats and the axis reuse the peaks
+    ecg_data['r_peaks'] = record_r_peaks(ecg_data)
+    save_record_beats(patient_id, ecg_data)
+    return estimate_axis(ecg_data)
+
+
+def backfill_patient(patient_id, median=None):
+    """ Stores the patient's axis, returns whether one was found; a failure is reported and skips the patient """
+    try:
+        features = patient_axis(patient_id, median)
+        if features is None:
+            return False
+        upsert_patient_features(patient_id, features)
+        return features['auto_axis'] is not None
+    except Exception as e:
+        print("\033[93mCould not find the axis of {}: {}\033[0m".format(patient_id, str(e)))  # Yellow text
+        return False
+
+
+def run(workers=4, batch_size=200, after=0, everyone=False):
+    """ Backfills every patient after the given id, returns (patients walked, axes found) """
+    started = time.perf_counter()
+    walked = found = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="axis") as executor:
+        while True:
+            patient_ids = fetch_patients_without_auto_axis(after, batch_size, everyone)
+            if not patient_ids:
+                break
+            medians = fetch_median_beats(patient_ids)
+            found += sum(executor.map(lambda patient_id: backfill_patient(patient_id, medians.get(patient_id)), patient_ids))
+            walked += len(patient_ids)
+            after = patient_ids[-1]
+            elapsed = time.perf_counter() - started
+            print(f"{walked} patients, {found} axes, last patient_id {after}, {walked / elapsed:.1f} patients/s")
+    return walked, found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.backfill_axis",
+                                     description="Find the electrical axis of the stored records that do not have one.")
+    parser.add_argument("--workers", type=int, default=4, help="patients processed at once (default: 4)")
+    parser.add_argument("--batch-size", type=int, default=200, help="patients read per query (default: 200)")
+    parser.add_argument("--after", type=int, default=0, help="start after this patient_id")
+    parser.add_argument("--all", action="store_true", help="recompute patients that already have an axis")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    walked, found = run(args.workers, args.batch_size, args.after, everyone=args.all)
+    print(f"Found the axis of {found} of {walked} patients")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
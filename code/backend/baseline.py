@@ -0,0 +1,112 @@
+"""Isoelectric baseline per beat, from the local variance of the leads.
+
+Ahead of every R peak, from the end of the previous beat's T wave to just
+before the QRS, the flattest ISO_WINDOW of the leads together is the
+isoelectric (TP or PR) segment, and each lead's mean over it is that beat's
+baseline. Measuring peaks against the baseline of their own beat instead of
+the median of the whole lead keeps them right under baseline wander.
+
+The rolling means and variances come from cumulative sums over all leads at
+once, and the candidate windows of every beat are one padded fancy index, so
+there is no loop over beats or samples.
+"""
+import numpy as np
+
+ISO_WINDOW = 0.04           # s, length of the flat segment
+QRS_ONSET = 0.05            # s before the R peak the segment has to end
+SEARCH_BEFORE = 0.6         # s before the R peak the search starts at most
+T_WAVE_END = 0.45           # s after the previous R peak the T wave is over
+QRS_WINDOW = (-0.06, 0.08)  # s around the R peak the QRS peaks are measured in
+
+def rolling_stats(leads, width):
+    """ Mean and variance of every width long window of each row, index i is the window starting at sample i """
+    # The median is taken out first, the sums of squares stay small enough for long records
+    offset = np.median(leads, axis=1, keepdims=True)
+    centered = leads - offset
+    sums = np.concatenate([np.zeros((len(leads), 1)), np.cumsum(centered, axis=1)], axis=1)
+    squares = np.concatenate([np.zeros((len(leads), 1)), np.cumsum(centered ** 2, axis=1)], axis=1)
+    mean = (sums[:, width:] - sums[:, :-width]) / width
+    variance = np.maximum((squares[:, width:] - squares[:, :-width]) / width - mean ** 2, 0)
+    return mean + offset, variance
+
+def isoelectric_segments(leads, fs, r_peaks):
+    """ Start sample of the flattest window ahead of each R peak (-1 where there is no room) and the window length """
+    width = max(2, int(ISO_WINDOW * fs))
+    r_peaks = np.asarray(r_peaks, dtype=np.int64)
+    if len(r_peaks) == 0 or leads.shape[1] <= width:
+        return np.array([], dtype=np.int64), width, None
+    mean, variance = rolling_stats(leads, width)
+    # Each lead's variance relative to its own typical variance, so leads count alike whatever their gain
+    scale = np.median(variance, axis=1, keepdims=True)
+    score = np.divide(variance, scale, out=np.zeros_like(variance), where=scale > 0).sum(axis=0)
+
+    previous = np.concatenate([[-len(score)], r_peaks[:-1]])
+    low = np.maximum.reduce([r_peaks - int(SEARCH_BEFORE * fs), previous + int(T_WAVE_END * fs), np.zeros_like(r_peaks)])
+    high = np.minimum(r_peaks - int(QRS_ONSET * fs) - width, len(score) - 1)
+    room = high - low
+    starts = np.full(len(r_peaks), -1, dtype=np.int64)
+    if room.max() >= 0:
+        candidates = low[:, None] + np.arange(room.max() + 1)[None, :]
+        outside = candidates > high[:, None]
+        scores = np.where(outside, np.inf, score[np.clip(candidates, 0, len(score) - 1)])
+        best = candidates[np.arange(len(r_peaks)), scores.argmin(axis=1)]
+        starts = np.where(room >= 0, best, -1)
+    return starts, width, mean
+
+def beat_baselines(signals, fs, r_peaks, adc=None):
+    """ {segments: [[start, end] or None per beat], leads: {lead: [baseline or None per beat]}}, baselines in mV for ADC signals """
+    names = list(signals)
+    if not names:
+        return {"segments": [], "leads": {}}
+    leads = np.vstack([np.asarray(signals[name], dtype=np.float64) for name in names])
+    starts, width, mean = isoelectric_segments(leads, fs, r_peaks)
+    found = starts >= 0
+    values = np.full((len(names), len(starts)), np.nan)
+    if found.any():
+        values[:, found] = mean[:, starts[found]]
+    if adc:
+        gain = np.array([adc['gain'].get(name, 1.0) for name in names])[:, None]
+        zero = np.array([adc['baseline'].get(name, 0) for name in names])[:, None]
+        values = (values - zero) / gain
+    return {
+        "segments": [[int(start), int(start) + width] if start >= 0 else None for start in starts],
+        "leads": {name: [None if np.isnan(value) else round(float(value), 5) for value in row] for name, row in zip(names, values)},
+    }
+
+def baseline_at(samples, segments, values):
+    """ A lead's baseline at the given samples, straight lines between the middles of the isoelectric segments """
+    found = [(sum(segment) / 2, value) for segment, value in zip(segments, values) if segment is not None and value is not None]
+    if not found:
+        return np.full(len(samples), np.nan)
+    centers, levels = np.array(found).T
+    return np.interp(samples, centers, levels)
+
+def corrected_peaks(signals, fs, r_peaks, segments, baselines, leads=('i', 'ii', 'iii'), adc=None):
+    """ Per beat QRS max and min of each lead against the baseline at its R peak, and the lead vector the chart computes
+
+    The baseline under the QRS is interpolated between the isoelectric segments
+    of the beat and the next one, which follows baseline wander within the beat.
+
+    {lead: {max_beat, min_beat, avg_baseline, corrected_max_peak, corrected_min_peak, lead_vector}}, one value per beat
+    """
+    r_peaks = np.asarray(r_peaks, dtype=np.int64)
+    result = {}
+    for name in leads:
+        if name not in signals or name not in baselines:
+            continue
+        signal = np.asarray(signals[name], dtype=np.float64)
+        if adc and name in adc.get('gain', {}):
+            signal = (signal - adc['baseline'][name]) / adc['gain'][name]
+        windows = np.clip(r_peaks[:, None] + np.arange(int(QRS_WINDOW[0] * fs), int(QRS_WINDOW[1] * fs) + 1)[None, :],
+                          0, len(signal) - 1)
+        baseline = baseline_at(r_peaks, segments, baselines[name])
+        maxima, minima = signal[windows].max(axis=1), signal[windows].min(axis=1)
+        corrected_max, corrected_min = maxima - baseline, minima - baseline
+        columns = {
+            "max_beat": maxima, "min_beat": minima, "avg_baseline": baseline,
+            "corrected_max_peak": corrected_max, "corrected_min_peak": corrected_min,
+            "lead_vector": corrected_max - np.abs(corrected_min),
+        }
+        result[name] = {key: [None if np.isnan(value) else round(float(value), 5) for value in column]
+                        for key, column in columns.items()}
+    return result
@@ -0,0 +1,85 @@
+import json
+import numpy as np
+from backend.db.utils import *
+
+def encode_baselines(baselines):
+    """ beat_baselines output as (lead names JSON, int32 segment bytes, float32 baseline bytes), missing values as -1 and NaN """
+    names = list(baselines["leads"])
+    segments = np.array([segment or [-1, -1] for segment in baselines["segments"]], dtype=np.int32).reshape(-1, 2)
+    values = np.array([[np.nan if value is None else value for value in baselines["leads"][name]] for name in names],
+                      dtype=np.float32).reshape(len(names), len(segments))
+    return json.dumps(names), segments.tobytes(), values.tobytes()
+
+def decode_baselines(names, segments, values):
+    """ encode_baselines back to the beat_baselines shape """
+    names = json.loads(names)
+    segments = np.frombuffer(segments, dtype=np.int32).reshape(-1, 2)
+    values = np.frombuffer(values, dtype=np.float32).reshape(len(names), len(segments))
+    return {
+        "segments": [None if start < 0 else [int(start), int(end)] for start, end in segments],
+        "leads": {name: [None if np.isnan(value) else round(float(value), 5) for value in row] for name, row in zip(names, values)},
+    }
+
+def upsert_record_beats(patient_id, r_peaks, fs, detector_version, baselines=None):
+    """ Stores the R peak sample indexes of the patient's record as int32 bytes, and the baseline of every beat """
+    r_peaks = np.asarray(r_peaks, dtype=np.int32)
+    names, segments, values = encode_baselines(baselines) if baselines else (None, None, None)
+    execute_query("""
+        REPLACE INTO ecg_beats (patient_id, fs, beat_count, detector_version, r_peaks, baseline_leads, baseline_segments, baselines)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, (patient_id, fs, len(r_peaks), detector_version, r_peaks.tobytes(), names, segments, values))
+
+def fetch_record_beats(patient_ids):
+    """ {patient_id: {fs, beat_count, detector_version, r_peaks, baselines}} of the patients that have stored beats
+
+    baselines is None for rows stored before baselines were detected.
+    """
+    placeholders = ', '.join(['%s'] * len(patient_ids))
+    result = fetch_from_db(f"""
+        SELECT patient_id, fs, beat_count, detector_version, r_peaks, baseline_leads, baseline_segments, baselines
+        FROM ecg_beats WHERE patient_id IN ({placeholders})
+    """, list(patient_ids))
+    if not result["success"]:
+        raise Exception(result["error"])
+    beats = {}
+    for row in result["data"]:
+        baselines = None
+        if row['baseline_leads'] is not None:
+            baselines = decode_baselines(row['baseline_leads'], row['baseline_segments'], row['baselines'])
+        beats[row['patient_id']] = {
+            'fs': row['fs'],
+            'beat_count': row['beat_count'],
+            'detector_version': row['detector_version'],
+            'r_peaks': np.frombuffer(row['r_peaks'], dtype=np.int32),
+            'baselines': baselines,
+        }
+    return beats
+
+def upsert_median_beat(patient_id, fs, median):
+    """ Stores a median_beats result, the beat as float32 (leads x samples) bytes """
+    beat = np.asarray(median['beat'], dtype=np.float32)
+    execute_query("""
+        REPLACE INTO ecg_median_beats (patient_id, fs, leads, samples, r_offset, beat_count, beat)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, (patient_id, fs, json.dumps(median['leads']), beat.shape[1], median['offset'], median['beat_count'], beat.tobytes()))
+
+def fetch_median_beats(patient_ids):
+    """ {patient_id: {fs, leads, beat, offset, beat_count}} of the patients that have a stored median beat """
+    placeholders = ', '.join(['%s'] * len(patient_ids))
+    result = fetch_from_db(f"""
+        SELECT patient_id, fs, leads, samples, r_offset, beat_count, beat
+        FROM ecg_median_beats WHERE patient_id IN ({placeholders})
+    """, list(patient_ids))
+    if not result["success"]:
+        raise Exception(result["error"])
+    medians = {}
+    for row in result["data"]:
+        leads = json.loads(row['leads'])
+        medians[row['patient_id']] = {
+            'fs': row['fs'],
+            'leads': leads,
+            'beat': np.frombuffer(row['beat'], dtype=np.float32).reshape(len(leads), row['samples']),
+            'offset': row['r_offset'],
+            'beat_count': row['beat_count'],
+        }
+    return medians
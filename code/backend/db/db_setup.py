@@ -1,6 +1,7 @@
 from dotenv import load_dotenv
 import os
 import pymysql
+from backend.db.engine import MySQLEngine, SQLiteEngine
 load_dotenv()
 
 # Database setup
@@ -17,5 +18,17 @@ db_config = {
     'cursorclass': pymysql.cursors.DictCursor
 }
 
+# DB_ENGINE=sqlite keeps everything in a local file (SQLITE_PATH) instead of the MySQL server
+DB_ENGINE = os.getenv('DB_ENGINE', 'mysql').lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'ecg.sqlite3')
+
+engine = SQLiteEngine(SQLITE_PATH) if DB_ENGINE == 'sqlite' else MySQLEngine(db_config)
+
+def use_engine(new_engine):
+    """ Switches every query to another engine, returns the previous one """
+    global engine
+    previous, engine = engine, new_engine
+    return previous
+
 def get_db_connection():
-    return pymysql.connect(**db_config)
+    return engine.connect()
@@ -0,0 +1,87 @@
+import json
+import re
+from backend.db.utils import *
+
+# patients column the header parser fills and the category its diagnoses get in the vocabulary
+DIAGNOSIS_CATEGORIES = {
+    'hypertrophies': 'hypertrophy',
+    'ischemia': 'ischemia',
+    'conduction_system_disease': 'conduction',
+    'cardiac_pacing': 'pacing',
+    'repolarization_abnormalities': 'repolarization',
+}
+
+def normalize_diagnosis(text):
+    """ Lower case words joined by underscores, 'Left ventricular hypertrophy.' -> 'left_ventricular_hypertrophy' """
+    return re.sub(r'[^a-z0-9]+', '_', str(text).lower()).strip('_')
+
+def diagnosis_values(value):
+    """ The free text entries of one column, a list, a JSON list from a patients row or a single string """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value) if value.startswith('[') else value
+        except ValueError:
+            pass
+    return value if isinstance(value, list) else [value]
+
+def diagnosis_entries(patient_info):
+    """ (code, category, label) of every diagnosis of a parsed record, codes are '<category>:<normalized text>' """
+    entries = {}
+    for column, category in DIAGNOSIS_CATEGORIES.items():
+        for text in diagnosis_values(patient_info.get(column)):
+            slug = normalize_diagnosis(text)
+            if slug:
+                entries.setdefault(f'{category}:{slug}', (category, str(text).strip().rstrip('.')))
+    return [(code, category, label) for code, (category, label) in entries.items()]
+
+def index_patient_diagnoses(patient_id, patient_info):
+    """ Replaces the patient's rows of the diagnosis index, new codes are added to the vocabulary, returns the code count
+
+    The old rows are only deleted together with the insert of the new ones, a failure keeps the patient indexed.
+    """
+    entries = diagnosis_entries(patient_info)
+    ids = {}
+    if entries:
+        execute_many('INSERT IGNORE INTO diagnoses (code, category, label) VALUES (%s, %s, %s)', entries)
+        ids = fetch_diagnosis_ids([code for code, _, _ in entries])
+    execute_transaction([
+        ('DELETE FROM patient_diagnoses WHERE patient_id = %s', [(patient_id,)]),
+        ('INSERT IGNORE INTO patient_diagnoses (diagnosis_id, patient_id) VALUES (%s, %s)',
+         [(diagnosis_id, patient_id) for diagnosis_id in ids.values()]),
+    ])
+    return len(entries)
+
+def fetch_diagnosis_ids(codes):
+    """ Vocabulary id of each known code """
+    placeholders = ', '.join(['%s'] * len(codes))
+    result = fetch_from_db(f'SELECT id, code FROM diagnoses WHERE code IN ({placeholders})', list(codes))
+    if not result["success"]:
+        raise Exception(result["error"])
+    return {row['code']: row['id'] for row in result["data"]}
+
+def fetch_diagnosis_postings(codes):
+    """ id and patient count of each known code, rarest first, the order the index is intersected in """
+    placeholders = ', '.join(['%s'] * len(codes))
+    result = fetch_from_db(f"""
+        SELECT d.id, d.code, COUNT(pd.patient_id) AS patients
+        FROM diagnoses d LEFT JOIN patient_diagnoses pd ON pd.diagnosis_id = d.id
+        WHERE d.code IN ({placeholders})
+        GROUP BY d.id, d.code
+        ORDER BY patients, d.id
+    """, list(codes))
+    if not result["success"]:
+        raise Exception(result["error"])
+    return result["data"]
+
+def fetch_diagnoses(category=None):
+    """ The vocabulary with the number of patients indexed under each code """
+    where = 'WHERE d.category = %s' if category else ''
+    return fetch_from_db(f"""
+        SELECT d.code, d.category, d.label, COUNT(pd.patient_id) AS patients
+        FROM diagnoses d LEFT JOIN patient_diagnoses pd ON pd.diagnosis_id = d.id
+        {where}
+        GROUP BY d.id, d.code, d.category, d.label
+        ORDER BY d.category, d.code
+    """, [category] if category else [])
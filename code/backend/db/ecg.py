@@ -1,4 +1,6 @@
 import json
+import numpy as np
+from backend import signal_store
 from backend.db.connection import *
 from backend.db.utils import *
 from backend.db.utils import execute_query
@@ -8,37 +10,146 @@ def ecg_data_exists(patient_id):
     result = execute_query(query, (patient_id,), fetch_one=True)
     return result is not None
 
-def insert_ecg_data_into_db(patient_id, ecg_data):
-    query = """
+INSERT_ECG_DATA = """
         INSERT INTO ecg_data (
             patient_id, time_data, signal_raw_data, maxima_data,
-            minima_data, baseline_data
-        ) VALUES (%s, %s, %s, %s, %s, %s)
+            minima_data, baseline_data, adc_data, signal_key, signal_meta
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
     """
-    params = (
+
+def fetch_patient_ids_with_ecg(patient_ids):
+    """ The given patient_ids that already have an ecg_data row, as strings """
+    if not patient_ids:
+        return set()
+    placeholders = ', '.join(['%s'] * len(patient_ids))
+    result = fetch_from_db(f'SELECT patient_id FROM ecg_data WHERE patient_id IN ({placeholders})', list(patient_ids))
+    if not result["success"]:
+        raise Exception(result["error"])
+    return {str(row['patient_id']) for row in result["data"]}
+
+def ecg_data_params(patient_id, ecg_data):
+    """ INSERT_ECG_DATA parameters of a parsed record, its signals go to the signal store first when there is one """
+    # signals are int16 ADC units when 'adc' (per-lead gain/baseline) is present
+    adc = ecg_data.get('adc')
+    time_data = json.dumps(ecg_data['time'])
+    signal_raw_data = json.dumps(ecg_data['signals'])
+    signal_key, signal_meta = None, None
+    store = signal_store.get_store()
+    if store is not None:
+        # The arrays go to the signal store, the row only points to them
+        meta = store.put(ecg_data['signals'], np.int16 if adc is not None else np.float64, sampling_rate(ecg_data))
+        time_data, signal_raw_data = None, None
+        signal_key, signal_meta = meta["key"], json.dumps(meta)
+    return (
         patient_id,
-        json.dumps(ecg_data['time']),
-        json.dumps(ecg_data['signals']),
+        time_data,
+        signal_raw_data,
         json.dumps(ecg_data['maxima_graph_data']),
         json.dumps(ecg_data['minima_graph_data']),
-        json.dumps(ecg_data['baselines_graph_data'])
+        json.dumps(ecg_data['baselines_graph_data']),
+        json.dumps(adc) if adc is not None else None,
+        signal_key,
+        signal_meta
     )
-    execute_query(query, params)
-    
+
+def insert_ecg_data_into_db(patient_id, ecg_data):
+    execute_query(INSERT_ECG_DATA, ecg_data_params(patient_id, ecg_data))
+
+def sampling_rate(ecg_data):
+    """ fs of a parsed record, older dicts only have the time axis """
+    if ecg_data.get('fs'):
+        return float(ecg_data['fs'])
+    time = ecg_data['time']
+    # Rounded so 1 / (1 / fs) gives back the exact rate the time axis was built from
+    return round(float(1 / (time[1] - time[0])), 6) if len(time) > 1 else None
+
 # -------------------- Fetch functions --------------------
 def fetch_all_ecg_data():
     return fetch_from_db('SELECT * FROM ecg_data')
 
+def stream_ecg_data(patient_ids=None, since=None, until=None):
+    """ Iterator over ecg_data rows without loading the table, since <= created_at < until """
+    conditions, params = [], []
+    if patient_ids:
+        conditions.append(f"patient_id IN ({', '.join(['%s'] * len(patient_ids))})")
+        params.extend(patient_ids)
+    if since is not None:
+        conditions.append('created_at >= %s')
+        params.append(since)
+    if until is not None:
+        conditions.append('created_at < %s')
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return inline_stored_rows(stream_from_db(f'SELECT * FROM ecg_data {where} ORDER BY id', params))
+
+def inline_stored_rows(rows):
+    """ Fills time_data and signal_raw_data of signal store rows so exported rows look the same """
+    try:
+        for row in rows:
+            if row.get("signal_meta") and row.get("signal_raw_data") is None:
+                ecg_data = decode_ecg_row(row)
+                row["time_data"] = json.dumps(ecg_data["time"])
+                row["signal_raw_data"] = json.dumps(ecg_data["signals"])
+            yield row
+    finally:
+        rows.close()
+
+def stored_signals(meta, start=None, stop=None, leads=None):
+    """ {lead: samples} memory map views of a row written to the signal store """
+    store = signal_store.get_store()
+    if store is None:
+        raise RuntimeError("ECG row is in the signal store but SIGNAL_STORE_DIR is not set")
+    return store.read(meta, start, stop, leads)
+
+def decode_ecg_row(result):
+    """ ECG data dict of an ecg_data row, signals come from the database or the signal store """
+    meta = json.loads(result["signal_meta"]) if result.get("signal_meta") else None
+    if meta is not None:
+        signals = {lead: samples.tolist() for lead, samples in stored_signals(meta).items()}
+        time = (np.arange(meta["shape"][1]) / meta["fs"]).tolist()
+    else:
+        signals = json.loads(result["signal_raw_data"])
+        time = json.loads(result["time_data"])
+
+    ecg_data = {
+        "time": time,
+        "signals": signals,
+        "maxima_graph_data": json.loads(result["maxima_data"]),
+        "minima_graph_data": json.loads(result["minima_data"]),
+        "baselines_graph_data": json.loads(result["baseline_data"])
+    }
+    # Older rows have physical float signals and no adc_data
+    if result.get("adc_data"):
+        ecg_data["adc"] = json.loads(result["adc_data"])
+    return ecg_data
+
 def fetch_ecg_data_by_patient_id(patient_id):
     query = "SELECT * FROM ecg_data WHERE patient_id = %s"
     result = execute_query(query, (patient_id,), fetch_one=True)
     if not result:
         return None
+    return decode_ecg_row(result)
 
-    return {
-        "time": json.loads(result["time_data"]),
-        "signals": json.loads(result["signal_raw_data"]),
-        "maxima_graph_data": json.loads(result["maxima_data"]),
-        "minima_graph_data": json.loads(result["minima_data"]),
-        "baselines_graph_data": json.loads(result["baseline_data"])
-    }
+def fetch_ecg_signal_window(patient_id, start=None, stop=None, leads=None):
+    """ Samples start:stop of the leads with fs, dtype and adc, no copies for rows in the signal store
+
+    adc is the per-lead gain and baseline of int16 samples, (sample - baseline) / gain is mV.
+    It is None for older rows, their samples are already in mV.
+    """
+    query = "SELECT signal_meta, adc_data FROM ecg_data WHERE patient_id = %s"
+    result = execute_query(query, (patient_id,), fetch_one=True)
+    if not result:
+        return None
+    adc = json.loads(result["adc_data"]) if result.get("adc_data") else None
+    if result.get("signal_meta"):
+        meta = json.loads(result["signal_meta"])
+        return {"signals": stored_signals(meta, start, stop, leads), "fs": meta["fs"], "adc": adc}
+
+    # The row still holds JSON text, only this path reads the blobs
+    dtype = np.int16 if adc else np.float64
+    result = execute_query("SELECT time_data, signal_raw_data FROM ecg_data WHERE patient_id = %s",
+                           (patient_id,), fetch_one=True)
+    all_signals = json.loads(result["signal_raw_data"])
+    signals = {lead: np.asarray(all_signals[lead], dtype=dtype)[start:stop]
+               for lead in (leads or all_signals) if lead in all_signals}
+    return {"signals": signals, "fs": sampling_rate({"time": json.loads(result["time_data"])}), "adc": adc}
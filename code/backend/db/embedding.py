@@ -0,0 +1,22 @@
+import numpy as np
+from backend.db.utils import *
+
+def upsert_embedding(patient_id, vector):
+    """ Stores the patient's record embedding as float32 bytes """
+    execute_query('REPLACE INTO ecg_embeddings (patient_id, embedding) VALUES (%s, %s)',
+                  (patient_id, np.asarray(vector, dtype=np.float32).tobytes()))
+
+def stream_embeddings(batch_size=1000):
+    """ (patient_id, float32 vector) of every stored embedding """
+    for row in stream_from_db('SELECT patient_id, embedding FROM ecg_embeddings', batch_size=batch_size):
+        yield row['patient_id'], np.frombuffer(row['embedding'], dtype=np.float32)
+
+def fetch_embedded_patient_ids(patient_ids):
+    """ The given patient_ids that still have a stored embedding, rows go with their patient """
+    if not patient_ids:
+        return set()
+    placeholders = ', '.join(['%s'] * len(patient_ids))
+    result = fetch_from_db(f'SELECT patient_id FROM ecg_embeddings WHERE patient_id IN ({placeholders})', list(patient_ids))
+    if not result["success"]:
+        raise Exception(result["error"])
+    return {row['patient_id'] for row in result["data"]}
@@ -0,0 +1,140 @@
+"""Storage engines behind get_db_connection.
+
+Both engines hand out connections that work like a pymysql connection with a
+DictCursor (cursor() as a context manager, %s placeholders, dict rows), so the
+query functions in backend/db run unchanged on either one.
+
+MySQLEngine is the remote database the app has always used. SQLiteEngine keeps
+the same schema (schema_sqlite.sql) in a local file in WAL mode, for single
+node deployments, benchmarks and running the real query code offline.
+"""
+import os
+import re
+import sqlite3
+import threading
+
+import pymysql
+
+SQLITE_SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema_sqlite.sql')
+
+# MySQL only syntax used by the queries and its SQLite spelling
+_SQLITE_REWRITES = [
+    (re.compile(r'\bINSERT\s+IGNORE\b', re.IGNORECASE), 'INSERT OR IGNORE'),
+]
+
+
+def to_sqlite_query(query):
+    """ pymysql style query to SQLite, %s placeholders become ? and %% a literal % """
+    query = re.sub(r'%([s%])', lambda match: '?' if match.group(1) == 's' else '%', query)
+    for pattern, replacement in _SQLITE_REWRITES:
+        query = pattern.sub(replacement, query)
+    return query
+
+
+class MySQLEngine:
+    name = 'mysql'
+
+    def __init__(self, config):
+        self.config = config
+
+    def connect(self):
+        return pymysql.connect(**self.config)
+
+
+class SQLiteCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __iter__(self):
+        return (dict(row) for row in self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def execute(self, query, params=None):
+        self._cursor.execute(to_sqlite_query(query), tuple(params or ()))
+        return self._cursor.rowcount
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(to_sqlite_query(query), [tuple(params) for params in seq_of_params])
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return dict(row) if row is not None else None
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        return [dict(row) for row in rows]
+
+    def fetchall(self):
+        return [dict(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """ One per thread, close() only ends the open transaction so the next query reuses it """
+    def __init__(self, raw):
+        self._raw = raw
+
+    def cursor(self, cursor_class=None):
+        # sqlite3 cursors already step through the result, cursor_class (SSDictCursor) is not needed
+        return SQLiteCursor(self._raw.cursor())
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        if self._raw.in_transaction:
+            self._raw.rollback()
+
+
+class SQLiteEngine:
+    name = 'sqlite'
+
+    def __init__(self, path, timeout=30.0):
+        self.path = os.path.abspath(path)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _open(self):
+        raw = sqlite3.connect(self.path, timeout=self.timeout)
+        raw.row_factory = sqlite3.Row
+        raw.execute('PRAGMA journal_mode=WAL')  # readers never wait for the writer
+        raw.execute('PRAGMA synchronous=NORMAL')
+        raw.execute('PRAGMA foreign_keys=ON')
+        with self._schema_lock:
+            if not self._schema_ready:
+                with open(SQLITE_SCHEMA, 'r') as file:
+                    raw.executescript(file.read())
+                self._schema_ready = True
+        return raw
+
+    def connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = SQLiteConnection(self._open())
+            self._local.connection = connection
+        return connection
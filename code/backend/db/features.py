@@ -0,0 +1,82 @@
+from backend.db.utils import *
+from backend.db.patient import encode_cursor, decode_cursor, MAX_PAGE_SIZE
+
+# Boolean diagnosis columns of patient_features
+FEATURE_FLAGS = ['lvh', 'rvh', 'lah', 'rah', 'lbbb', 'rbbb', 'av_block', 'ischemia', 'pacing', 'repolarization']
+FEATURE_COLUMNS = ['patient_id', 'age', 'sex', 'rhythm_code'] + FEATURE_FLAGS + [
+    'heart_rate', 'axis', 'qrs_amplitude_1', 'qrs_amplitude_2', 'qrs_amplitude_3', 'selections',
+    'auto_axis', 'auto_axis_diagnosis', 'net_qrs_1', 'net_qrs_2', 'net_qrs_3'
+]
+# Columns the automatic axis at ingest sets
+AUTO_AXIS_COLUMNS = ['auto_axis', 'auto_axis_diagnosis', 'net_qrs_1', 'net_qrs_2', 'net_qrs_3']
+
+def upsert_patient_features(patient_id, values):
+    """ Creates the patient's feature row if needed and sets the given columns, leaves the others as they are """
+    unknown = [column for column in values if column not in FEATURE_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown feature columns: {', '.join(unknown)}")
+    execute_query('INSERT IGNORE INTO patient_features (patient_id) VALUES (%s)', (patient_id,))
+    if values:
+        assignments = ', '.join(f'{column} = %s' for column in values)
+        execute_query(f'UPDATE patient_features SET {assignments} WHERE patient_id = %s', list(values.values()) + [patient_id])
+
+def fetch_result_vector_measures(patient_id):
+    """ lead_vector and corrected peaks of every beat selection of a patient, as numbers """
+    fields = ['lead_vector', 'corrected_max_peak', 'corrected_min_peak']
+    columns = ', '.join(f"lead_{lead}_data->>'$.{field}' AS lead_{lead}_{field}" for lead in (1, 2, 3) for field in fields)
+    return fetch_from_db(f'SELECT {columns} FROM ecg_beat_selection WHERE patient_id = %s', (patient_id,))
+
+def fetch_cohort(age_min=None, age_max=None, sex=None, rhythm=None, flags=None, axis_min=None, axis_max=None,
+                 heart_rate_min=None, heart_rate_max=None, auto_axis_min=None, auto_axis_max=None,
+                 axis_diagnosis=None, limit=100, cursor=None):
+    """ Patients matching every filter, a page of feature rows in patient_id order plus the total count
+
+    axis_min/axis_max filter the axis of the beat selections, auto_axis_min/auto_axis_max and
+    axis_diagnosis the one found at ingest.
+    """
+    unknown = [flag for flag in flags or [] if flag not in FEATURE_FLAGS]
+    if unknown:
+        raise ValueError(f"Unknown flags: {', '.join(unknown)}")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    conditions, params = [], []
+    for column, operator, value in [('age', '>=', age_min), ('age', '<=', age_max), ('sex', '=', sex),
+                                    ('rhythm_code', '=', rhythm), ('axis', '>=', axis_min), ('axis', '<=', axis_max),
+                                    ('heart_rate', '>=', heart_rate_min), ('heart_rate', '<=', heart_rate_max),
+                                    ('auto_axis', '>=', auto_axis_min), ('auto_axis', '<=', auto_axis_max),
+                                    ('auto_axis_diagnosis', '=', axis_diagnosis)]:
+        if value is not None:
+            conditions.append(f'{column} {operator} %s')
+            params.append(value)
+    conditions.extend(f'{flag} = 1' for flag in flags or [])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    count = fetch_from_db(f'SELECT COUNT(*) AS count FROM patient_features {where}', params)
+    if not count["success"]:
+        return count
+    page_conditions, page_params = list(conditions), list(params)
+    if cursor:
+        _, patient_id = decode_cursor(cursor)
+        page_conditions.append('patient_id > %s')
+        page_params.append(patient_id)
+    page_where = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ''
+    result = fetch_from_db(f"SELECT {', '.join(FEATURE_COLUMNS)} FROM patient_features {page_where} ORDER BY patient_id LIMIT %s",
+                           page_params + [limit + 1])
+    if not result["success"]:
+        return result
+
+    rows = result["data"]
+    next_cursor = encode_cursor(rows[limit - 1], 'patient_id') if len(rows) > limit else None
+    rows = [{**row, **{flag: bool(row[flag]) for flag in FEATURE_FLAGS}} for row in rows[:limit]]
+    return {"success": True, "count": count["data"][0]["count"], "data": rows, "next_cursor": next_cursor}
+
+def fetch_patients_without_auto_axis(after=0, limit=200, everyone=False):
+    """ patient_ids after the given one in order whose automatic axis was never found, every patient with everyone """
+    missing = '' if everyone else 'AND (f.patient_id IS NULL OR f.auto_axis_diagnosis IS NULL)'
+    result = fetch_from_db(f"""
+        SELECT p.patient_id FROM patients p LEFT JOIN patient_features f ON f.patient_id = p.patient_id
+        WHERE p.patient_id > %s {missing} ORDER BY p.patient_id LIMIT %s
+    """, (after, limit))
+    if not result["success"]:
+        raise Exception(result["error"])
+    return [row['patient_id'] for row in result["data"]]
@@ -1,20 +1,23 @@
+import base64
 import json
 from backend.db.connection import *
 from backend.db.utils import *
+from backend.db.diagnosis import *
 
 def patient_exists(patient_id):
     query = 'SELECT * FROM patients WHERE patient_id = %s'
     result = execute_query(query, (patient_id,), fetch_one=True)
     return result is not None
 
-def insert_patient_into_db(patient_info):
-    query = """
+INSERT_PATIENT = """
         INSERT INTO patients (
             patient_id, gender, age, heart_rhythm, conduction_system_disease,
             cardiac_pacing, hypertrophies, ischemia, repolarization_abnormalities
         ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
     """
-    params = (
+
+def patient_params(patient_info):
+    return (
         patient_info['anonymous_id'],
         patient_info['sex'],
         patient_info['age'],
@@ -25,13 +28,181 @@ def insert_patient_into_db(patient_info):
         json.dumps(patient_info.get('ischemia', [])),
         patient_info['repolarization_abnormalities']
     )
-    execute_query(query, params)
+
+def index_new_patient(patient_info):
+    try:
+        index_patient_diagnoses(patient_info['anonymous_id'], patient_info)
+    except Exception as e:
+        # The patient is stored, python -m backend.rebuild_features indexes it later
+        print("\033[93mCould not index patient diagnoses: {}\033[0m".format(str(e)))  # Yellow text
+
+def insert_patient_into_db(patient_info):
+    execute_query(INSERT_PATIENT, patient_params(patient_info))
+    index_new_patient(patient_info)
+
+def fetch_existing_patient_ids(patient_ids):
+    """ The given patient_ids that are stored, as strings """
+    if not patient_ids:
+        return set()
+    placeholders = ', '.join(['%s'] * len(patient_ids))
+    result = fetch_from_db(f'SELECT patient_id FROM patients WHERE patient_id IN ({placeholders})', list(patient_ids))
+    if not result["success"]:
+        raise Exception(result["error"])
+    return {str(row['patient_id']) for row in result["data"]}
     
 # -------------------- Fetch functions --------------------  
 
 def fetch_all_patients():
     return fetch_from_db('SELECT * FROM patients')
 
+# Columns the patient list can return, sort on and search in
+PATIENT_COLUMNS = [
+    'patient_id', 'gender', 'age', 'heart_rhythm', 'conduction_system_disease',
+    'cardiac_pacing', 'hypertrophies', 'ischemia', 'repolarization_abnormalities'
+]
+PATIENT_SORT_COLUMNS = ['patient_id', 'age', 'gender', 'heart_rhythm']
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(row, sort, key='patient_id'):
+    """ Opaque cursor for the row a page ended on, sort value and the unique key column """
+    raw = json.dumps([row[sort], row[key]], default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        value, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(key)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def keyset_segments(sort, descending, cursor):
+    """ WHERE clauses for the rows after the cursor, run in order until the page is full
+
+    NULLs sort first ascending and last descending, the NULL block is queried on
+    its own so each clause is a plain index range instead of an OR over the whole index.
+    """
+    if not cursor:
+        return [(None, [])]
+    value, patient_id = decode_cursor(cursor)
+    compare = '<' if descending else '>'
+    if sort == 'patient_id':
+        return [(f'patient_id {compare} %s', [patient_id])]
+    if value is None:
+        after_nulls = [] if descending else [(f'{sort} IS NOT NULL', [])]
+        return [(f'{sort} IS NULL AND patient_id {compare} %s', [patient_id])] + after_nulls
+    segments = [(f'{sort} {compare}= %s AND ({sort} {compare} %s OR patient_id {compare} %s)', [value, value, patient_id])]
+    if descending:
+        segments.append((f'{sort} IS NULL', []))
+    return segments
+
+def like_pattern(term):
+    # '!' is the LIKE escape character, MySQL and SQLite read a backslash differently
+    escaped = term.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+    return f'%{escaped}%'
+
+def fetch_patients_page(limit=50, cursor=None, sort='patient_id', descending=False, gender=None,
+                        age_min=None, age_max=None, rhythm=None, diagnosis=None, fields=None):
+    """ One page of patients in keyset order, next_cursor is None on the last page """
+    if sort not in PATIENT_SORT_COLUMNS:
+        raise ValueError(f"Cannot sort on {sort}")
+    fields = fields or PATIENT_COLUMNS
+    unknown = [field for field in fields if field not in PATIENT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    conditions, params = [], []
+    if gender:
+        conditions.append('gender = %s')
+        params.append(gender)
+    if age_min is not None:
+        conditions.append('age >= %s')
+        params.append(age_min)
+    if age_max is not None:
+        conditions.append('age <= %s')
+        params.append(age_max)
+    if rhythm:
+        conditions.append('heart_rhythm = %s')
+        params.append(rhythm)
+    if diagnosis:
+        # Matched against the small diagnosis vocabulary, the patients come from the index
+        conditions.append("""patient_id IN (SELECT pd.patient_id FROM patient_diagnoses pd
+            JOIN diagnoses d ON d.id = pd.diagnosis_id WHERE d.label LIKE %s ESCAPE '!' OR d.code = %s)""")
+        params.extend([like_pattern(diagnosis), diagnosis])
+
+    # The sort column and patient_id are always read, they make up the cursor
+    columns = ['patient_id'] + [column for column in PATIENT_COLUMNS if column in fields and column != 'patient_id']
+    if sort not in columns:
+        columns.append(sort)
+    direction = 'DESC' if descending else 'ASC'
+    order_by = f'patient_id {direction}' if sort == 'patient_id' else f'{sort} {direction}, patient_id {direction}'
+
+    rows = []
+    for segment, segment_params in keyset_segments(sort, descending, cursor):
+        where_conditions = conditions + ([segment] if segment else [])
+        where = f"WHERE {' AND '.join(where_conditions)}" if where_conditions else ''
+        query = f"SELECT {', '.join(columns)} FROM patients {where} ORDER BY {order_by} LIMIT %s"
+        result = fetch_from_db(query, params + segment_params + [limit + 1 - len(rows)])
+        if not result["success"]:
+            return result
+        rows.extend(result["data"])
+        if len(rows) > limit:
+            break
+
+    next_cursor = encode_cursor(rows[limit - 1], sort) if len(rows) > limit else None
+    rows = [{column: row[column] for column in row if column in fields or column == 'patient_id'} for row in rows[:limit]]
+    return {"success": True, "data": rows, "next_cursor": next_cursor}
+
+def fetch_patients_by_diagnoses(codes, match='all', limit=100, cursor=None):
+    """ Patients indexed under every (match='all') or any (match='any') of the codes, a page in patient_id order
+
+    'all' walks the rarest code's patients and probes the (diagnosis_id, patient_id)
+    key of each other code, so the work grows with the rarest code and not the table.
+    """
+    codes = list(dict.fromkeys(code.strip().lower() for code in codes if code.strip()))
+    if not codes:
+        raise ValueError("No diagnosis codes given")
+    if match not in ('all', 'any'):
+        raise ValueError(f"Unknown match: {match}")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    postings = fetch_diagnosis_postings(codes)
+    unknown = sorted(set(codes) - {row['code'] for row in postings})
+    if unknown:
+        raise ValueError(f"Unknown diagnosis codes: {', '.join(unknown)}")
+    ids = [row['id'] for row in postings]
+
+    if match == 'all':
+        joins = ''.join(f' JOIN patient_diagnoses p{n} ON p{n}.diagnosis_id = %s AND p{n}.patient_id = p0.patient_id'
+                        for n in range(1, len(ids)))
+        source, source_params = f'patient_diagnoses p0{joins} WHERE p0.diagnosis_id = %s', ids[1:] + ids[:1]
+    else:
+        placeholders = ', '.join(['%s'] * len(ids))
+        source, source_params = f'patient_diagnoses p0 WHERE p0.diagnosis_id IN ({placeholders})', ids
+
+    count = fetch_from_db(f'SELECT COUNT(DISTINCT p0.patient_id) AS count FROM {source}', source_params)
+    if not count["success"]:
+        return count
+    after = decode_cursor(cursor)[1] if cursor else None
+    page_source = source + (' AND p0.patient_id > %s' if after is not None else '')
+    page_params = source_params + ([after] if after is not None else [])
+    page = fetch_from_db(f'SELECT DISTINCT p0.patient_id FROM {page_source} ORDER BY p0.patient_id LIMIT %s', page_params + [limit + 1])
+    if not page["success"]:
+        return page
+
+    patient_ids = [row['patient_id'] for row in page["data"]]
+    next_cursor = encode_cursor(page["data"][limit - 1], 'patient_id') if len(patient_ids) > limit else None
+    patient_ids = patient_ids[:limit]
+    rows = []
+    if patient_ids:
+        placeholders = ', '.join(['%s'] * len(patient_ids))
+        result = fetch_from_db(f"SELECT {', '.join(PATIENT_COLUMNS)} FROM patients WHERE patient_id IN ({placeholders}) ORDER BY patient_id",
+                               patient_ids)
+        if not result["success"]:
+            return result
+        rows = result["data"]
+    return {"success": True, "count": count["data"][0]["count"], "data": rows, "next_cursor": next_cursor}
+
 def fetch_patient_by_id(patient_id):
     patient = fetch_from_db('SELECT * FROM patients WHERE patient_id = %s', (patient_id,))
     if not patient.get('data'):  # No patient found, return an error
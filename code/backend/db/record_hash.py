@@ -0,0 +1,25 @@
+from datetime import datetime
+from backend.db.utils import *
+
+def fetch_patient_id_by_hash(content_hash):
+    # Joined with patients, a hash left behind by a deleted patient is not a duplicate
+    query = """
+        SELECT r.patient_id FROM ingested_records r JOIN patients p ON p.patient_id = r.patient_id
+        WHERE r.content_hash = %s
+    """
+    result = execute_query(query, (content_hash,), fetch_one=True)
+    return result["patient_id"] if result else None
+
+def insert_record_hash(content_hash, patient_id):
+    # REPLACE takes over a row a deleted patient left behind when the record is ingested again
+    query = """
+        REPLACE INTO ingested_records (
+            content_hash, patient_id, created_at
+        ) VALUES (%s, %s, %s)
+    """
+    params = (
+        content_hash,
+        patient_id,
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    )
+    execute_query(query, params)
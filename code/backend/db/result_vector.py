@@ -1,21 +1,34 @@
 import json
 from datetime import datetime
+import numpy as np
 from backend.db.utils import *
+from backend.db.patient import encode_cursor, decode_cursor, MAX_PAGE_SIZE
+from backend.axis import electrical_axis
 
-def insert_result_vector_into_db(processed_data):
-    query = """
+INSERT_RESULT_VECTOR = """
         INSERT INTO ecg_beat_selection (
             patient_id, lead_1_data, lead_2_data, lead_3_data, created_at
         ) VALUES (%s, %s, %s, %s, %s)
     """
-    params = (
+
+def result_vector_params(processed_data):
+    # created_at is set when the row was queued for a later write, otherwise it is now
+    return (
         processed_data['anonymous_id'],
         json.dumps(processed_data['beat_data']['Lead 1']),
         json.dumps(processed_data['beat_data']['Lead 2']),
         json.dumps(processed_data['beat_data']['Lead 3']),
-        datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        processed_data.get('created_at') or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     )
-    execute_query(query, params)
+
+def insert_result_vector_into_db(processed_data):
+    execute_query(INSERT_RESULT_VECTOR, result_vector_params(processed_data))
+
+def insert_result_vectors_into_db(processed_list):
+    """ All rows in one transaction, pymysql sends them as a single multi-row INSERT """
+    if not processed_list:
+        return 0
+    return execute_many(INSERT_RESULT_VECTOR, [result_vector_params(processed_data) for processed_data in processed_list])
     
 # -------------------- Fetch functions --------------------  
 def fetch_all_result_vectors():
@@ -23,3 +36,87 @@ def fetch_all_result_vectors():
 
 def fetch_result_vectors_by_patient_id(patient_id):
     return fetch_from_db('SELECT * FROM ecg_beat_selection WHERE patient_id = %s', (patient_id,))
+
+LEAD_COLUMNS = ['lead_1_data', 'lead_2_data', 'lead_3_data']
+
+def result_vector_conditions(patient_id=None, since=None, until=None):
+    conditions, params = [], []
+    if patient_id is not None:
+        conditions.append('patient_id = %s')
+        params.append(patient_id)
+    if since is not None:
+        conditions.append('created_at >= %s')
+        params.append(since)
+    if until is not None:
+        conditions.append('created_at < %s')
+        params.append(until)
+    return conditions, params
+
+def fetch_result_vectors_page(patient_id=None, since=None, until=None, limit=100, cursor=None, decode=False):
+    """ Newest selections first, one page at a time, since <= created_at < until """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    conditions, params = result_vector_conditions(patient_id, since, until)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        conditions.append('created_at <= %s AND (created_at < %s OR id < %s)')
+        params.extend([created_at, created_at, row_id])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    result = fetch_from_db(f'SELECT * FROM ecg_beat_selection {where} ORDER BY created_at DESC, id DESC LIMIT %s',
+                           params + [limit + 1])
+    if not result["success"]:
+        return result
+
+    rows = result["data"]
+    next_cursor = encode_cursor(rows[limit - 1], 'created_at', 'id') if len(rows) > limit else None
+    rows = rows[:limit]
+    if decode:
+        rows = [{**row, **{column: json.loads(row[column]) for column in LEAD_COLUMNS if row[column]}} for row in rows]
+    return {"success": True, "data": rows, "next_cursor": next_cursor}
+
+def fetch_result_vector_stats(patient_id=None, since=None, until=None, bin_degrees=30):
+    """ Counts, mean lead vectors, axis histogram and selections per day, per patient and for the whole cohort """
+    conditions, params = result_vector_conditions(patient_id, since, until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    per_day = fetch_from_db(f'SELECT DATE(created_at) AS day, COUNT(*) AS count FROM ecg_beat_selection {where} '
+                            'GROUP BY DATE(created_at) ORDER BY day', params)
+    if not per_day["success"]:
+        return per_day
+
+    # Only the three lead_vector numbers of each row leave the database
+    rows = stream_from_db('SELECT patient_id, ' + ', '.join(f"{column}->>'$.lead_vector' AS {column}" for column in LEAD_COLUMNS)
+                          + f' FROM ecg_beat_selection {where}', params, batch_size=1000)
+    patient_ids, vectors = [], []
+    for row in rows:
+        patient_ids.append(row['patient_id'])
+        vectors.append([float(row[column]) if row[column] not in (None, '', 'null') else np.nan for column in LEAD_COLUMNS])
+    patient_ids = np.asarray(patient_ids)
+    vectors = np.asarray(vectors, dtype=np.float64).reshape(-1, 3)
+
+    angle, _ = electrical_axis(vectors[:, 0], vectors[:, 2])
+    edges = np.arange(-180, 180 + bin_degrees, bin_degrees)
+
+    def summary(index):
+        selected, angles = vectors[index], angle[index]
+        angles = angles[~np.isnan(angles)]
+        counts, _ = np.histogram(angles, edges)
+        means = [float(np.nanmean(column)) if np.any(~np.isnan(column)) else None for column in selected.T]
+        return {
+            "count": len(selected),
+            "mean_lead_vector": dict(zip(["lead_1", "lead_2", "lead_3"], means)),
+            # Circular mean, -170 and 170 average to 180 and not 0
+            "mean_axis": float(np.degrees(np.arctan2(np.sin(np.radians(angles)).mean(), np.cos(np.radians(angles)).mean()))) if len(angles) else None,
+            "axis_histogram": [{"from": int(low), "to": int(high), "count": int(count)} for low, high, count in zip(edges[:-1], edges[1:], counts)],
+        }
+
+    # Rows grouped by patient with one sort instead of a pass over all rows per patient
+    order = np.argsort(patient_ids, kind='stable')
+    unique_ids, starts = np.unique(patient_ids[order], return_index=True)
+    groups = np.split(order, starts[1:])
+    return {
+        "success": True,
+        "cohort": summary(np.arange(len(patient_ids))),
+        "patients": {str(pid): summary(group) for pid, group in zip(unique_ids, groups)},
+        "per_day": [{"day": str(row["day"]), "count": row["count"]} for row in per_day["data"]],
+    }
+
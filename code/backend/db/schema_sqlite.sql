@@ -0,0 +1,132 @@
+-- SQLite version of the MySQL schema, used when DB_ENGINE=sqlite.
+-- JSON columns are TEXT holding the same JSON strings the MySQL columns get.
+
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id INTEGER NOT NULL PRIMARY KEY,
+    gender TEXT,
+    age INTEGER,
+    heart_rhythm TEXT,
+    conduction_system_disease TEXT,
+    cardiac_pacing TEXT,
+    hypertrophies TEXT,
+    ischemia TEXT,
+    repolarization_abnormalities TEXT
+);
+-- keyset pagination of the patient list, (sort column, patient_id)
+CREATE INDEX IF NOT EXISTS patients_age ON patients (age, patient_id);
+CREATE INDEX IF NOT EXISTS patients_gender ON patients (gender, patient_id);
+CREATE INDEX IF NOT EXISTS patients_heart_rhythm ON patients (heart_rhythm, patient_id);
+
+-- ON DELETE CASCADE does what the delete trigger does in MySQL
+CREATE TABLE IF NOT EXISTS ecg_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id INTEGER NOT NULL REFERENCES patients (patient_id) ON DELETE CASCADE,
+    time_data TEXT,
+    signal_raw_data TEXT,
+    maxima_data TEXT,
+    minima_data TEXT,
+    baseline_data TEXT,
+    adc_data TEXT,
+    signal_key TEXT,
+    signal_meta TEXT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ecg_data_patient_id ON ecg_data (patient_id);
+CREATE INDEX IF NOT EXISTS ecg_data_created_at ON ecg_data (created_at);
+
+CREATE TABLE IF NOT EXISTS ecg_beat_selection (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id INTEGER NOT NULL REFERENCES patients (patient_id) ON DELETE CASCADE,
+    lead_1_data TEXT,
+    lead_2_data TEXT,
+    lead_3_data TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ecg_beat_selection_created_at ON ecg_beat_selection (created_at, id);
+CREATE INDEX IF NOT EXISTS ecg_beat_selection_patient_created_at ON ecg_beat_selection (patient_id, created_at, id);
+
+CREATE TABLE IF NOT EXISTS ingested_records (
+    content_hash TEXT NOT NULL PRIMARY KEY,
+    patient_id INTEGER NOT NULL REFERENCES patients (patient_id) ON DELETE CASCADE,
+    created_at TEXT NOT NULL
+);
+
+-- Typed per patient features for cohort queries, see backend/services/feature_service.py
+CREATE TABLE IF NOT EXISTS patient_features (
+    patient_id INTEGER NOT NULL PRIMARY KEY REFERENCES patients (patient_id) ON DELETE CASCADE,
+    age INTEGER,
+    sex TEXT,
+    rhythm_code TEXT,
+    lvh INTEGER NOT NULL DEFAULT 0,
+    rvh INTEGER NOT NULL DEFAULT 0,
+    lah INTEGER NOT NULL DEFAULT 0,
+    rah INTEGER NOT NULL DEFAULT 0,
+    lbbb INTEGER NOT NULL DEFAULT 0,
+    rbbb INTEGER NOT NULL DEFAULT 0,
+    av_block INTEGER NOT NULL DEFAULT 0,
+    ischemia INTEGER NOT NULL DEFAULT 0,
+    pacing INTEGER NOT NULL DEFAULT 0,
+    repolarization INTEGER NOT NULL DEFAULT 0,
+    heart_rate REAL,
+    axis REAL,
+    qrs_amplitude_1 REAL,
+    qrs_amplitude_2 REAL,
+    qrs_amplitude_3 REAL,
+    selections INTEGER NOT NULL DEFAULT 0,
+    auto_axis REAL,
+    auto_axis_diagnosis TEXT,
+    net_qrs_1 REAL,
+    net_qrs_2 REAL,
+    net_qrs_3 REAL
+);
+CREATE INDEX IF NOT EXISTS patient_features_age ON patient_features (age);
+CREATE INDEX IF NOT EXISTS patient_features_axis ON patient_features (axis);
+CREATE INDEX IF NOT EXISTS patient_features_heart_rate ON patient_features (heart_rate);
+CREATE INDEX IF NOT EXISTS patient_features_rhythm_age ON patient_features (rhythm_code, age);
+CREATE INDEX IF NOT EXISTS patient_features_sex_age ON patient_features (sex, age);
+CREATE INDEX IF NOT EXISTS patient_features_lvh_age ON patient_features (lvh, age);
+CREATE INDEX IF NOT EXISTS patient_features_auto_axis ON patient_features (auto_axis);
+CREATE INDEX IF NOT EXISTS patient_features_auto_axis_diagnosis ON patient_features (auto_axis_diagnosis, auto_axis);
+
+-- Diagnosis vocabulary and the patient index over it, see backend/db/diagnosis.py
+CREATE TABLE IF NOT EXISTS diagnoses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    code TEXT NOT NULL UNIQUE,
+    category TEXT NOT NULL,
+    label TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS patient_diagnoses (
+    diagnosis_id INTEGER NOT NULL REFERENCES diagnoses (id),
+    patient_id INTEGER NOT NULL REFERENCES patients (patient_id) ON DELETE CASCADE,
+    PRIMARY KEY (diagnosis_id, patient_id)
+);
+CREATE INDEX IF NOT EXISTS patient_diagnoses_patient ON patient_diagnoses (patient_id);
+
+-- Morphology embedding per patient behind /api/similar, see backend/services/similarity_service.py
+CREATE TABLE IF NOT EXISTS ecg_embeddings (
+    patient_id INTEGER NOT NULL PRIMARY KEY REFERENCES patients (patient_id) ON DELETE CASCADE,
+    embedding BLOB NOT NULL
+);
+
+-- R peak sample indexes per record (int32 bytes), see backend/qrs.py, and the
+-- isoelectric segment (int32 start/end pairs) and baseline of every beat (float32 leads x beats), see backend/baseline.py
+CREATE TABLE IF NOT EXISTS ecg_beats (
+    patient_id INTEGER NOT NULL PRIMARY KEY REFERENCES patients (patient_id) ON DELETE CASCADE,
+    fs REAL NOT NULL,
+    beat_count INTEGER NOT NULL,
+    detector_version INTEGER NOT NULL,
+    r_peaks BLOB NOT NULL,
+    baseline_leads TEXT,
+    baseline_segments BLOB,
+    baselines BLOB
+);
+
+CREATE TABLE IF NOT EXISTS ecg_median_beats (
+    patient_id INTEGER NOT NULL PRIMARY KEY REFERENCES patients (patient_id) ON DELETE CASCADE,
+    fs REAL NOT NULL,
+    leads TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    r_offset INTEGER NOT NULL,
+    beat_count INTEGER NOT NULL,
+    beat BLOB NOT NULL
+);
@@ -1,3 +1,4 @@
+import pymysql
 from backend.db.connection import *
 
 def fetch_from_db(query, params=None):
@@ -24,3 +25,65 @@ def execute_query(query, params=None, fetch_one=False):
         return result
     finally:
         connection.close()
+
+
+def stream_from_db(query, params=None, batch_size=100):
+    """ Runs the query now and returns an iterator over its rows, read from the server batch_size at a time
+
+    Uses an unbuffered (server side) cursor so only one batch is in memory. The
+    connection is held until the iterator is exhausted or closed.
+    """
+    connection = get_db_connection_safe()
+    try:
+        cursor = connection.cursor(pymysql.cursors.SSDictCursor)
+        cursor.execute(query, params or ())
+    except Exception:
+        connection.close()
+        raise
+
+    def rows():
+        finished = False
+        try:
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    finished = True
+                    break
+                yield from batch
+        finally:
+            # Closing an unbuffered cursor reads the rest of the result first, a reader
+            # that stopped early (client went away) only drops the connection
+            if finished:
+                cursor.close()
+            connection.close()
+    return rows()
+
+def execute_transaction(statements):
+    """ Runs every (query, params_list) pair with executemany in one transaction, all or nothing """
+    connection = get_db_connection_safe()
+    try:
+        with connection.cursor() as cursor:
+            for query, params_list in statements:
+                if params_list:
+                    cursor.executemany(query, params_list)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+def execute_many(query, params_list):
+    """ Runs the query once per params tuple in one transaction, returns the affected row count """
+    connection = get_db_connection_safe()
+    try:
+        with connection.cursor() as cursor:
+            cursor.executemany(query, params_list)
+            affected = cursor.rowcount
+        connection.commit()
+        return affected
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
@@ -0,0 +1,174 @@
+import os
+import posixpath
+import tempfile
+import numpy as np
+import scipy.signal
+import wfdb
+from backend.wfdb_reader import read_record, read_record_from_zip, record_members
+from backend.qrs import detect_qrs
+from backend.baseline import beat_baselines
+
+INT16_MIN, INT16_MAX = -32768, 32767
+
+STANDARD_LEAD_ORDER = ['i', 'ii', 'iii', 'avr', 'avl', 'avf', 'v1', 'v2', 'v3', 'v4', 'v5', 'v6']
+
+
+def read_wfdb_record(base_path):
+    """ Reads a record with wfdb as int16 ADC units, wider formats are rescaled per lead to fit """
+    record = wfdb.rdrecord(base_path, physical=False)
+    signals = record.d_signal
+    if signals.size and (signals.min() < INT16_MIN or signals.max() > INT16_MAX):
+        # e.g. format 32 from wrsamp, divide the samples, gain and baseline by the same factor
+        signals = signals.astype(np.float64)
+        for index in range(signals.shape[1]):
+            peak = max(np.abs(signals[:, index]).max(), abs(record.baseline[index]))
+            factor = max(1.0, np.ceil(peak / INT16_MAX))
+            signals[:, index] = np.round(signals[:, index] / factor)
+            record.adc_gain[index] = record.adc_gain[index] / factor
+            record.baseline[index] = int(round(record.baseline[index] / factor))
+    record.d_signal = signals.astype(np.int16)
+    return record
+
+
+def get_ecg_data(base_path):
+    """ Reads ECG data and returns JSON for frontend rendering """
+    try:
+        # Read the raw ADC samples (int16) instead of float64 physical units,
+        # gain/baseline are only applied where physical values are needed.
+        # Format 16/212 records take the fast path, anything else goes through wfdb
+        record = read_record(base_path)
+        if record is None:
+            record = read_wfdb_record(base_path)
+        return analyze_record(record)
+    except Exception as e:
+        print(f"Error reading ECG data: {e}")
+        return {"error": str(e), "message": "Failed to process ECG data"}
+
+
+def get_ecg_data_from_zip(zip_ref, base_name):
+    """ Same as get_ecg_data for a record inside an open ZipFile, base_name is the member path without .hea """
+    try:
+        record = read_record_from_zip(zip_ref, base_name)
+        if record is None:
+            # Not a fast path record, extract just this record for wfdb
+            with tempfile.TemporaryDirectory() as temp_dir:
+                for member in record_members(zip_ref, base_name):
+                    with open(os.path.join(temp_dir, posixpath.basename(member)), 'wb') as file:
+                        file.write(zip_ref.read(member))
+                record = read_wfdb_record(os.path.join(temp_dir, posixpath.basename(base_name)))
+        return analyze_record(record)
+    except Exception as e:
+        print(f"Error reading ECG data: {e}")
+        return {"error": str(e), "message": "Failed to process ECG data"}
+
+
+def analyze_record(record):
+    """ Builds the ECG data dict (signals, peaks, baselines, patient info) from a digital record """
+    signals = record.d_signal
+    signal_names = record.sig_name
+    sampling_rate = record.fs
+    time_values = np.arange(signals.shape[0]) / sampling_rate
+
+    #check for missing leads
+    required_leads = {'i', 'ii', 'iii'}
+    missing_leads = required_leads - set(signal_names)
+    if missing_leads:
+        return {"error": "Missing required leads", "message": f"Required leads missing: {', '.join(missing_leads)}"}
+
+
+    # Ensure the extracted leads follow the standard order
+    ordered_leads = [lead for lead in STANDARD_LEAD_ORDER if lead in signal_names]
+
+    # Create dictionary with signals in correct order
+    filtered_signals = {lead: signals[:, signal_names.index(lead)] for lead in ordered_leads}
+
+    # Per-lead ADC gain and baseline, physical = (digital - baseline) / gain
+    adc_gains = {lead: float(record.adc_gain[signal_names.index(lead)]) for lead in ordered_leads}
+    adc_baselines = {lead: int(record.baseline[signal_names.index(lead)]) for lead in ordered_leads}
+
+    def to_physical(lead, values):
+        return (np.asarray(values, dtype=np.float64) - adc_baselines[lead]) / adc_gains[lead]
+
+    # Isoelectric baseline of every beat, a lead's baseline is their median (the whole lead's median without beats)
+    r_peaks = detect_qrs(filtered_signals, sampling_rate)
+    adc = {"gain": adc_gains, "baseline": adc_baselines}
+    baselines_per_beat = beat_baselines(filtered_signals, sampling_rate, r_peaks, adc)
+    baselines_data = {}
+    for lead in filtered_signals:
+        values = [value for value in baselines_per_beat["leads"][lead] if value is not None]
+        baselines_data[lead] = float(np.median(values)) if values else float(to_physical(lead, np.median(filtered_signals[lead])))
+
+    # Extract patient information
+    age = None
+    sex = None
+    rhythm = None
+    hypertrophies = []
+    repolarization_abnormalities = None
+    ischemia = []
+    conduction_system_disease = []
+    cardiac_pacing = []
+    anonymous_id = record.record_name
+    for comment in record.comments:
+        
+        comment = comment.rstrip('.')
+        
+        if '<age>:' in comment:
+            age = comment.split('<age>:')[-1].strip()
+        if '<sex>:' in comment:
+            sex = comment.split('<sex>:')[-1].strip()
+        if 'Rhythm:' in comment:
+            rhythm = comment.split('Rhythm:')[-1].strip()
+        if 'hypertrophy' in comment.lower():
+            hypertrophies.append(comment.strip())
+        if 'repolarization abnormalities' in comment.lower():
+            repolarization_abnormalities = comment.split('Non-specific repolarization abnormalities:')[-1].strip()
+        if 'Ischemia:' in comment:
+            ischemia.append(comment.split('Ischemia:')[-1].strip())
+        if 'Undefined ischemia/scar/supp.NSTEMI:' in comment:
+            ischemia.append(comment.split('Undefined ischemia/scar/supp.NSTEMI:')[-1].strip())
+        if 'block' in comment.lower():
+            conduction_system_disease.append(comment.strip())
+        if 'pacing' in comment.lower():
+            cardiac_pacing.append(comment.strip())
+    # Find max and min peaks for each lead
+    maximas_data = {}
+    minimas_data = {}
+    for lead, signal in filtered_signals.items():
+        # Widen before negating so -32768 does not overflow int16
+        maximas, _ = scipy.signal.find_peaks(signal)
+        minimas, _ = scipy.signal.find_peaks(-signal.astype(np.int32))
+
+        maximas_data[lead] = {
+            "maximas": maximas[:3].tolist(),
+            "maxima_values": to_physical(lead, signal[maximas[:3]]).tolist(),
+        }
+
+        minimas_data[lead] = {
+            "minimas": minimas[:3].tolist(),
+            "minima_values": to_physical(lead, signal[minimas[:3]]).tolist()
+        }
+
+    # Return JSON response with all signals in correct order
+    return {
+        "time": time_values.tolist(),
+        "fs": float(sampling_rate),
+        "r_peaks": r_peaks.tolist(),  # sample indexes, all leads together
+        "beat_baselines": baselines_per_beat,  # isoelectric segment and mV baseline of every beat
+        "signals": {lead: filtered_signals[lead].tolist() for lead in ordered_leads},  # int16 ADC units
+        "adc": adc,
+        "maxima_graph_data": maximas_data,
+        "minima_graph_data": minimas_data,
+        "baselines_graph_data": baselines_data,
+        "patient_info": {
+            "age": age,
+            "sex": sex,
+            "rhythm": rhythm,
+            "anonymous_id": anonymous_id,
+            "hypertrophies": hypertrophies,  # Include hypertrophies
+            "repolarization_abnormalities": repolarization_abnormalities,  # Include repolarization abnormalities
+            "ischemia": ischemia,  # Include ischemia
+            "conduction_system_disease": conduction_system_disease,  # Include conduction anomalies
+            "cardiac_pacing": cardiac_pacing,  # Include cardiac pacing
+        },
+       
+    }
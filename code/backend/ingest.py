@@ -0,0 +1,244 @@
+"""Bulk loader for WFDB datasets that bypasses Flask and the upload routes.
+
+Run from the code/ folder:
+
+    python -m backend.ingest <dir-or-zip> [--workers N] [--batch-size N]
+                             [--checkpoint PATH] [--resume] [--dry-run]
+                             [--timeout S] [--memory-limit MB] [--no-sandbox]
+
+Records stream through the read -> analyze -> store pipeline (backend.pipeline)
+with parsing in sandboxed worker processes (backend.sandbox), so a record that
+hangs or runs out of memory fails on its own. The store stage writes the new
+patients and ECG rows of up to --batch-size records in one transaction
+(store_patients_and_ecg_data), and the checkpoint is rewritten every
+--batch-size records so an interrupted load can pick up where it stopped with
+--resume. --no-sandbox parses in --workers threads of this process.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.ecg_processing import get_ecg_data, get_ecg_data_from_zip
+from backend.services.patient_service import store_patients_and_ecg_data
+from backend.services.record_hash_service import lookup_record, remember_record
+from backend.pipeline import Pipeline, StageTimings, record_stages, record_task
+from backend.sandbox import SandboxPool, parse_in_sandbox
+
+# ZipFile opened once per worker process when the source is a ZIP
+_source_zip = None
+
+
+def discover_records(source):
+    """ Record keys in a stable order, base paths for a folder or member names (without .hea) for a ZIP """
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zip_ref:
+            return sorted(name[:-4] for name in zip_ref.namelist() if name.endswith('.hea'))
+
+    keys = []
+    for root, _, files in os.walk(source):
+        keys.extend(os.path.join(root, name[:-4]) for name in files if name.endswith('.hea'))
+    return sorted(keys)
+
+
+def open_source(source):
+    """ Opens the source ZIP for this process, nothing to do for folders """
+    global _source_zip
+    if zipfile.is_zipfile(source):
+        _source_zip = zipfile.ZipFile(source)
+
+
+def close_source():
+    global _source_zip
+    if _source_zip is not None:
+        _source_zip.close()
+        _source_zip = None
+
+
+def parse_record(key):
+    """ Parses one record, runs in the sandboxed parser processes (or inline with --no-sandbox) """
+    if _source_zip is not None:
+        return get_ecg_data_from_zip(_source_zip, key)
+    return get_ecg_data(key)
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r') as file:
+        return set(json.load(file).get("done", []))
+
+
+def save_checkpoint(path, done):
+    # Write then rename so a crash never leaves a half written checkpoint
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump({"done": sorted(done)}, file)
+    os.replace(temp_path, path)
+
+
+def new_stats(discovered=0, resumed=0):
+    return {"discovered": discovered, "resumed": resumed, "parsed": 0,
+            "stored": 0, "duplicates": 0, "failed": 0}
+
+
+def count_result(task, stats):
+    """ Adds a finished record task to the counters, returns True if it does not need another try """
+    if "ecg_data" in task:
+        stats["parsed"] += 1
+    if "duplicate_of" in task:
+        stats["duplicates"] += 1
+        return True
+    if "error" in task:
+        stats["failed"] += 1
+        print(f"{task['key']}: {task['error']}", file=sys.stderr)
+        return False
+    storage_result = task.get("storage_result")
+    if storage_result is None:
+        return False  # dry run
+    if storage_result.get("success"):
+        stats["stored"] += 1
+    elif storage_result.get("ecg_exists"):
+        stats["duplicates"] += 1
+    else:
+        stats["failed"] += 1
+        print(f"{task['key']}: {storage_result.get('error')}", file=sys.stderr)
+        return False
+    return True
+
+
+def ingest_records(keys, stats, pool=None, dry_run=False, timings=None, workers=1, store_batch=32):
+    """ Streams record keys through the pipeline, yields (key, finished) in input order
+
+    Without a pool records are parsed in workers threads, store_batch records are stored per transaction.
+    """
+    if pool is not None:
+        # Each analyze thread waits on one record in a parser process
+        parse = lambda key: parse_in_sandbox(pool, parse_record, key)
+        analyze_workers = pool.workers
+    else:
+        parse = parse_record
+        analyze_workers = workers
+
+    stages = record_stages(
+        parse,
+        store_many=None if dry_run else store_patients_and_ecg_data,
+        lookup=None if dry_run else lambda key: lookup_record(key, _source_zip),
+        remember=remember_record,
+        analyze_workers=analyze_workers,
+        store_batch=store_batch,
+    )
+    pipeline = Pipeline(stages, queue_size=max(16, analyze_workers * 2, store_batch), timings=timings)
+    for task in pipeline.run(record_task(key) for key in keys):
+        yield task["key"], count_result(task, stats)
+
+
+@contextlib.contextmanager
+def quiet_output(verbose):
+    """ Sends the per record prints of the parse and store code to /dev/null unless verbose """
+    if verbose:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def ingest_batch(batch, stats, pool=None, dry_run=False, verbose=False):
+    """ Dedups, parses and stores one batch of record keys, returns the keys that are finished """
+    with quiet_output(verbose):
+        return [key for key, finished in ingest_records(batch, stats, pool, dry_run) if finished and not dry_run]
+
+
+def parser_pool(source, workers, timeout=30.0, memory_limit_mb=2048):
+    """ Sandboxed parser processes that each open the source once """
+    return SandboxPool(workers, timeout=timeout, memory_limit=memory_limit_mb * 2 ** 20,
+                       initializer=open_source, initargs=(source,))
+
+
+def run(source, workers=1, batch_size=100, checkpoint=None, resume=False, dry_run=False, verbose=False,
+        sandbox=True, timeout=30.0, memory_limit_mb=2048):
+    """ Loads every record under source, returns the summary counters """
+    started = time.perf_counter()
+    keys = discover_records(source)
+    checkpoint = checkpoint or source.rstrip('/\\') + '.ingest-checkpoint.json'
+    done = load_checkpoint(checkpoint) if resume else set()
+    pending = [key for key in keys if key not in done]
+    stats = new_stats(len(keys), len(keys) - len(pending))
+    timings = StageTimings()
+    progress = sys.stdout
+
+    open_source(source)
+    pool = parser_pool(source, workers, timeout, memory_limit_mb) if sandbox else None
+    try:
+        with quiet_output(verbose):
+            processed = 0
+            for key, finished in ingest_records(pending, stats, pool, dry_run, timings, workers, batch_size):
+                processed += 1
+                if finished and not dry_run:
+                    done.add(key)
+                # The checkpoint is rewritten every batch_size records, as often as the store stage commits
+                if processed % batch_size == 0 or processed == len(pending):
+                    if not dry_run:
+                        save_checkpoint(checkpoint, done)
+                    elapsed = time.perf_counter() - started
+                    print(f"{processed}/{len(pending)} records, {processed / elapsed:.1f} records/s", file=progress)
+    finally:
+        if pool is not None:
+            stats["parser"] = pool.metrics()
+            pool.close()
+        close_source()
+
+    stats["elapsed"] = time.perf_counter() - started
+    stats["stages"] = timings.snapshot()
+    return stats
+
+
+def print_summary(stats):
+    elapsed = stats["elapsed"]
+    rate = stats["parsed"] / elapsed if elapsed > 0 else 0.0
+    print("")
+    print(f"Discovered:  {stats['discovered']}")
+    print(f"Resumed:     {stats['resumed']} (already in checkpoint)")
+    print(f"Duplicates:  {stats['duplicates']}")
+    print(f"Parsed:      {stats['parsed']}")
+    print(f"Stored:      {stats['stored']}")
+    print(f"Failed:      {stats['failed']}")
+    print(f"Elapsed:     {elapsed:.1f}s ({rate:.1f} records/s)")
+    if "parser" in stats:
+        print(f"Timed out:   {stats['parser']['timed_out']}, crashed: {stats['parser']['crashed']} (parser processes respawned)")
+    for name, stage in stats.get("stages", {}).items():
+        print(f"  {name:<10} {stage['items']} records, {stage['seconds']:.1f}s busy, {stage['ms_per_item']:.1f} ms/record")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.ingest", description="Bulk load WFDB ECG records into the database.")
+    parser.add_argument("source", help="folder or ZIP file containing .hea/.dat records")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parser processes, or threads with --no-sandbox (default: CPU count)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds a record may take to parse (default: 30)")
+    parser.add_argument("--memory-limit", type=int, default=2048, help="MB of memory per parser process (default: 2048)")
+    parser.add_argument("--no-sandbox", action="store_true", help="parse in this process, without time or memory limits")
+    parser.add_argument("--batch-size", type=int, default=100, help="records stored per transaction and between checkpoint writes (default: 100)")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <source>.ingest-checkpoint.json)")
+    parser.add_argument("--resume", action="store_true", help="skip records listed in the checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="parse records without touching the database")
+    parser.add_argument("--verbose", action="store_true", help="show the per record storage messages")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.source):
+        parser.error(f"{args.source} does not exist")
+    if args.workers < 1 or args.batch_size < 1:
+        parser.error("--workers and --batch-size must be at least 1")
+
+    stats = run(args.source, workers=args.workers, batch_size=args.batch_size, checkpoint=args.checkpoint,
+                resume=args.resume, dry_run=args.dry_run, verbose=args.verbose,
+                sandbox=not args.no_sandbox, timeout=args.timeout, memory_limit_mb=args.memory_limit)
+    print_summary(stats)
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
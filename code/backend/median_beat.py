@@ -0,0 +1,73 @@
+"""Median beat (ensemble average) of a record, per lead.
+
+Every beat is a row of a strided view of the leads (numpy's
+sliding_window_view), so picking the windows around the R peaks of all
+leads is one index and the record is never copied per beat. Each beat is
+taken against its own isoelectric baseline before the median, so baseline
+wander lines the beats up instead of smearing them, and the median leaves
+out the odd ectopic or noisy beat.
+
+The median beat is a few hundred samples per lead, the axis and amplitude
+measurements read it instead of the whole record.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from backend.baseline import baseline_at, QRS_WINDOW
+
+MEDIAN_WINDOW = (-0.25, 0.45)  # s around the R peak, the P wave to the end of the T wave
+
+def median_beats(signals, fs, r_peaks, adc=None, baselines=None, window=MEDIAN_WINDOW):
+    """ Median of the beats of every lead, in mV for ADC signals, None without a whole beat in the record
+
+    baselines is a beat_baselines result for the same R peaks, each beat is moved
+    down by the baseline at its R peak first.
+
+    {leads: [lead], beat: (leads, samples) float32, offset: R peak sample of the beat, beat_count}
+    """
+    names = list(signals)
+    if not names or not fs:
+        return None
+    leads = np.vstack([np.asarray(signals[name], dtype=np.float64) for name in names])
+    if adc:
+        gain = np.array([adc['gain'].get(name, 1.0) for name in names])[:, None]
+        zero = np.array([adc['baseline'].get(name, 0) for name in names])[:, None]
+        leads = (leads - zero) / gain
+    before, after = int(-window[0] * fs), int(window[1] * fs)
+    length = before + after
+    r_peaks = np.asarray(r_peaks, dtype=np.int64)
+    whole = (r_peaks >= before) & (r_peaks + after <= leads.shape[1])
+    if length < 1 or not whole.any():
+        return None
+
+    # (leads, beats, samples) out of the (leads, windows, samples) view, one gather for every lead
+    beats = sliding_window_view(leads, length, axis=1)[:, r_peaks[whole] - before]
+    if baselines:
+        levels = np.vstack([baseline_at(r_peaks, baselines['segments'], baselines['leads'].get(name, []))
+                            for name in names])
+        beats = beats - np.nan_to_num(levels[:, whole])[:, :, None]
+    return {
+        "leads": names,
+        "beat": np.median(beats, axis=1).astype(np.float32),
+        "offset": before,
+        "beat_count": int(whole.sum()),
+    }
+
+def median_beat_amplitudes(median, fs):
+    """ QRS max and min of each lead's median beat and the lead vector the chart computes from them
+
+    {lead: {max_peak, min_peak, lead_vector}}, the median beat is already against the baseline.
+    """
+    start = max(0, median['offset'] + int(QRS_WINDOW[0] * fs))
+    end = median['offset'] + int(QRS_WINDOW[1] * fs) + 1
+    qrs = np.asarray(median['beat'], dtype=np.float64)[:, start:end]
+    if qrs.shape[1] == 0:
+        return {}
+    maxima, minima = qrs.max(axis=1), qrs.min(axis=1)
+    return {
+        name: {
+            "max_peak": round(float(high), 5),
+            "min_peak": round(float(low), 5),
+            "lead_vector": round(float(high - abs(low)), 5),
+        }
+        for name, high, low in zip(median['leads'], maxima, minima)
+    }
@@ -0,0 +1,180 @@
+"""Moves the JSON signals of existing ecg_data rows into the signal store.
+
+Run from the code/ folder while the app keeps serving:
+
+    python -m backend.migrate_signals [--store DIR] [--batch-size N] [--rate ROWS_PER_S]
+                                      [--checkpoint PATH] [--resume] [--keep-json] [--limit N]
+
+Rows are walked in id order (keyset, WHERE id > last id), a batch at a time.
+Each row's signals are written to the store and read back, and the row is
+only switched over when the stored arrays and the rebuilt time axis equal the
+JSON exactly. The switch of a whole batch is one short UPDATE transaction.
+Readers handle both formats (backend.db.ecg.decode_ecg_row), so the app
+works the same before, during and after the migration. --rate throttles the
+job so it does not compete with the app for the database. The checkpoint
+keeps the last id and is rewritten after every batch, so --resume continues
+an interrupted run.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend import signal_store
+from backend.signal_store import SignalStore
+from backend.db.ecg import sampling_rate
+from backend.db.utils import execute_many, execute_query, fetch_from_db
+
+
+class MigrationError(Exception):
+    """Raised when a row cannot be stored or does not read back unchanged"""
+
+
+def count_pending():
+    return execute_query("SELECT COUNT(*) AS pending FROM ecg_data WHERE signal_key IS NULL", fetch_one=True)["pending"]
+
+
+def pending_rows(after_id, batch_size):
+    """ Next batch of rows that still hold JSON signals, in id order """
+    result = fetch_from_db(
+        "SELECT id, time_data, signal_raw_data, adc_data FROM ecg_data "
+        "WHERE id > %s AND signal_key IS NULL ORDER BY id LIMIT %s", (after_id, batch_size))
+    if not result["success"]:
+        raise MigrationError(result["error"])
+    return result["data"]
+
+
+def encode_row(store, row):
+    """ Writes the row's signals to the store, returns the signal_meta once they read back unchanged """
+    if row["signal_raw_data"] is None or row["time_data"] is None:
+        raise MigrationError("row has no JSON signals")
+    signals = json.loads(row["signal_raw_data"])
+    time_values = json.loads(row["time_data"])
+    dtype = np.int16 if row["adc_data"] else np.float64
+    try:
+        meta = store.put(signals, dtype, sampling_rate({"time": time_values}))
+    except (ValueError, OverflowError) as e:
+        raise MigrationError(f"cannot store the signals as {np.dtype(dtype).name}: {e}")
+
+    stored = store.read(meta)
+    for lead, samples in signals.items():
+        if not np.array_equal(stored[lead], np.asarray(samples)):
+            raise MigrationError(f"lead {lead} does not round trip as {np.dtype(dtype).name}")
+    if not np.array_equal(np.arange(meta["shape"][1]) / meta["fs"], np.asarray(time_values)):
+        raise MigrationError("time axis does not round trip")
+    return meta
+
+
+def migrate_batch(store, rows, keep_json=False):
+    """ Encodes and verifies a batch, switches the good rows over in one transaction, returns the failures """
+    updates, failures = [], {}
+    for row in rows:
+        try:
+            meta = encode_row(store, row)
+        except MigrationError as e:
+            failures[row["id"]] = str(e)
+            continue
+        updates.append((meta["key"], json.dumps(meta), row["id"]))
+
+    if updates:
+        # signal_key IS NULL keeps a row another run already switched untouched
+        clear_json = "" if keep_json else ", time_data = NULL, signal_raw_data = NULL"
+        execute_many(f"UPDATE ecg_data SET signal_key = %s, signal_meta = %s{clear_json} "
+                     "WHERE id = %s AND signal_key IS NULL", updates)
+    return len(updates), failures
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {"last_id": 0, "failed": {}}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def save_checkpoint(path, state):
+    # Write then rename so a crash never leaves a half written checkpoint
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(state, file)
+    os.replace(temp_path, path)
+
+
+def format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def run(store, batch_size=50, rate=None, checkpoint='signal-migration-checkpoint.json', resume=False,
+        keep_json=False, limit=None):
+    """ Migrates pending rows, returns the summary counters """
+    started = time.perf_counter()
+    state = load_checkpoint(checkpoint) if resume else {"last_id": 0, "failed": {}}
+    total = count_pending()
+    if limit is not None:
+        total = min(total, limit)
+    stats = {"pending": total, "migrated": 0, "failed": 0}
+    processed = 0
+
+    while processed < total:
+        rows = pending_rows(state["last_id"], min(batch_size, total - processed))
+        if not rows:
+            break
+        migrated, failures = migrate_batch(store, rows, keep_json)
+        processed += len(rows)
+        stats["migrated"] += migrated
+        stats["failed"] += len(failures)
+        for row_id, error in failures.items():
+            state["failed"][str(row_id)] = error
+            print(f"row {row_id}: {error}", file=sys.stderr)
+        state["last_id"] = rows[-1]["id"]
+        save_checkpoint(checkpoint, state)
+
+        elapsed = time.perf_counter() - started
+        if rate:
+            # Sleep off whatever the batch finished ahead of the allowed rate
+            ahead = processed / rate - elapsed
+            if ahead > 0:
+                time.sleep(ahead)
+                elapsed = time.perf_counter() - started
+        speed = processed / elapsed if elapsed > 0 else 0.0
+        eta = (total - processed) / speed if speed > 0 else 0.0
+        print(f"{processed}/{total} rows, {speed:.1f} rows/s, ETA {format_eta(eta)}")
+
+    stats["elapsed"] = time.perf_counter() - started
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.migrate_signals",
+                                     description="Move the JSON signals of ecg_data rows into the signal store.")
+    parser.add_argument("--store", default=signal_store.SIGNAL_STORE_DIR, help="signal store directory (default: SIGNAL_STORE_DIR)")
+    parser.add_argument("--batch-size", type=int, default=50, help="rows per transaction (default: 50)")
+    parser.add_argument("--rate", type=float, help="at most this many rows per second (default: no limit)")
+    parser.add_argument("--checkpoint", default="signal-migration-checkpoint.json", help="checkpoint file")
+    parser.add_argument("--resume", action="store_true", help="continue after the last id in the checkpoint")
+    parser.add_argument("--keep-json", action="store_true", help="leave the JSON columns filled, for a way back")
+    parser.add_argument("--limit", type=int, help="migrate at most this many rows")
+    args = parser.parse_args(argv)
+
+    if not args.store:
+        parser.error("set SIGNAL_STORE_DIR or pass --store")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    stats = run(SignalStore(args.store), batch_size=args.batch_size, rate=args.rate, checkpoint=args.checkpoint,
+                resume=args.resume, keep_json=args.keep_json, limit=args.limit)
+    print("")
+    print(f"Pending:   {stats['pending']}")
+    print(f"Migrated:  {stats['migrated']}")
+    print(f"Failed:    {stats['failed']} (left as JSON, see the checkpoint)")
+    print(f"Elapsed:   {stats['elapsed']:.1f}s")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
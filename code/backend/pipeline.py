@@ -0,0 +1,208 @@
+"""Streaming ingestion pipeline shared by the upload routes and the CLI tools.
+
+Records go through read (content hash / dedup) -> analyze (parse the record)
+-> store (database writes, in batches). Every stage has its own worker threads
+and the stages are joined by bounded queues, so a slow stage holds back the
+ones before it instead of records piling up in memory. Results come out in
+the order they went in, and each stage records how many items it handled and
+how long that took.
+
+Items are dicts. A stage can mark an item finished with item["done"] = True
+(a duplicate, a parse error), later stages then pass it through untouched.
+"""
+import queue
+import threading
+import time
+
+_END = object()
+
+
+class Stage:
+    def __init__(self, name, func, workers=1, batch_size=1):
+        # func updates the item in place, with batch_size > 1 it gets a list of items
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+
+
+class StageTimings:
+    """ Per stage counters, one instance can be shared by many pipelines """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def add(self, name, items, seconds):
+        with self._lock:
+            stage = self._stages.setdefault(name, {"items": 0, "calls": 0, "seconds": 0.0})
+            stage["items"] += items
+            stage["calls"] += 1
+            stage["seconds"] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {
+                    "items": stage["items"],
+                    "calls": stage["calls"],
+                    "seconds": round(stage["seconds"], 3),
+                    "ms_per_item": round(1000 * stage["seconds"] / stage["items"], 2) if stage["items"] else 0.0,
+                }
+                for name, stage in self._stages.items()
+            }
+
+
+class Pipeline:
+    def __init__(self, stages, queue_size=16, timings=None):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.timings = timings if timings is not None else StageTimings()
+
+    def run(self, items):
+        """ Generator over the processed items, in input order """
+        queues = [queue.Queue(self.queue_size) for _ in self.stages]
+        queues.append(queue.Queue())  # results, bounded by the in flight window below
+        # Caps the items between the input and the caller so the reorder buffer stays small
+        in_flight = sum(stage.workers * stage.batch_size for stage in self.stages) + self.queue_size * (len(self.stages) + 1)
+        window = threading.Semaphore(in_flight)
+        stop = threading.Event()
+        failure = []
+
+        def feed():
+            try:
+                for sequence, item in enumerate(items):
+                    while not window.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    queues[0].put((sequence, item))
+            except Exception as e:
+                failure.append(e)
+            finally:
+                queues[0].put(_END)
+
+        threads = [threading.Thread(target=feed, name="pipeline-feed", daemon=True)]
+        for index, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for number in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(stage, queues[index], queues[index + 1], remaining, lock),
+                    name=f"pipeline-{stage.name}-{number}", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        pending = {}
+        next_sequence = 0
+        try:
+            while True:
+                entry = queues[-1].get()
+                if entry is _END:
+                    break
+                pending[entry[0]] = entry[1]
+                while next_sequence in pending:
+                    yield pending.pop(next_sequence)
+                    next_sequence += 1
+                    window.release()
+            if failure:
+                raise failure[0]
+        finally:
+            stop.set()
+
+    def _work(self, stage, inbox, outbox, remaining, lock):
+        while True:
+            entry = inbox.get()
+            if entry is _END:
+                inbox.put(_END)  # for the other workers of this stage
+                break
+            batch = [entry]
+            while len(batch) < stage.batch_size:
+                try:
+                    entry = inbox.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _END:
+                    inbox.put(_END)
+                    break
+                batch.append(entry)
+
+            todo = [item for _, item in batch if not item.get("done")]
+            if todo:
+                started = time.perf_counter()
+                try:
+                    stage.func(todo if stage.batch_size > 1 else todo[0])
+                except Exception as e:
+                    # One bad record must not stop the others
+                    for item in todo:
+                        if not item.get("done"):
+                            item["error"] = str(e)
+                            item["done"] = True
+                self.timings.add(stage.name, len(todo), time.perf_counter() - started)
+
+            for entry in batch:
+                outbox.put(entry)
+
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                outbox.put(_END)  # the last worker out closes the next stage
+
+
+def record_task(key, file_name=None):
+    """ Pipeline item for one record, key is the base path (or ZIP member path) without .hea """
+    return {"key": key, "file": file_name}
+
+
+def record_stages(parse, store=None, lookup=None, remember=None, read_workers=2, analyze_workers=2, store_batch=32,
+                  store_many=None):
+    """ read -> analyze -> store stages for record tasks, without store and store_many the database is left alone
+
+    store_many takes a list of parsed records and returns their storage results in
+    order, it gets up to store_batch records at a time. store stores one record.
+    """
+    def read(task):
+        if lookup is None:
+            task["content_hash"] = None
+            return
+        task["content_hash"], known_patient_id = lookup(task["key"])
+        if known_patient_id is not None:
+            task["duplicate_of"] = known_patient_id
+            task["done"] = True
+
+    def analyze(task):
+        task["ecg_data"] = parse(task["key"])
+        if "error" in task["ecg_data"]:
+            task["error"] = task["ecg_data"]["error"]
+            task["done"] = True
+
+    def store_all(tasks):
+        if isinstance(tasks, dict):
+            tasks = [tasks]  # store_batch=1, the stage hands over the task itself
+        if store_many is not None:
+            try:
+                results = store_many([task["ecg_data"] for task in tasks])
+            except Exception as e:
+                for task in tasks:
+                    task["error"] = str(e)
+                    task["done"] = True
+                return
+        else:
+            results = []
+            for task in tasks:
+                try:
+                    results.append(store(task["ecg_data"]))
+                except Exception as e:
+                    results.append(None)
+                    task["error"] = str(e)
+                    task["done"] = True
+        for task, result in zip(tasks, results):
+            if result is None:
+                continue
+            task["storage_result"] = result
+            if remember is not None:
+                remember(task["content_hash"], task["ecg_data"].get("patient_info"), result)
+
+    stages = [Stage("read", read, read_workers), Stage("analyze", analyze, analyze_workers)]
+    if store_many is not None or store is not None:
+        # One writer, with store_many the records that arrived together are written in one transaction
+        stages.append(Stage("store", store_all, 1, store_batch))
+    return stages
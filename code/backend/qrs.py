@@ -0,0 +1,100 @@
+"""QRS detection in the style of Pan and Tompkins, over all leads at once.
+
+The leads are stacked into one (leads, samples) array so the band-pass,
+derivative and squaring are each a single NumPy/SciPy call. Each lead is
+scaled by its own noise floor before the leads are summed, so a large lead
+does not outweigh a clean one and a noisy lead adds little. The moving window integration of
+the sum gives one candidate peak per wave, and only the walk over those
+candidates (a few per second) with the adaptive signal and noise levels is a
+Python loop.
+"""
+import numpy as np
+import scipy.signal
+
+# Bump when the detector changes, stored with the peaks so old rows can be found
+QRS_DETECTOR_VERSION = 1
+
+BAND = (5.0, 15.0)          # Hz, where most of the QRS energy is
+INTEGRATION_WINDOW = 0.15   # s, about the widest QRS
+REFRACTORY = 0.2            # s, no two beats closer (300 bpm)
+T_WAVE_WINDOW = 0.36        # s, a candidate this close to a beat may be its T wave
+SEARCHBACK_RR = 1.66        # a gap this many average RR intervals long is searched again
+
+def bandpass(leads, fs, band):
+    """ Zero phase band-pass of every row of a (leads, samples) array """
+    sos = scipy.signal.butter(2, band, btype='bandpass', fs=fs, output='sos')
+    return scipy.signal.sosfiltfilt(sos, leads, axis=1)
+
+def scaled_sum(values):
+    """ Sum over the leads of each lead divided by its median, flat leads add nothing
+
+    The median of a squared lead is its noise floor, so a clean lead counts for
+    more than a noisy one whatever their amplitudes.
+    """
+    scale = np.median(values, axis=1, keepdims=True)
+    weights = np.divide(1.0, scale, out=np.zeros_like(scale), where=scale > 0)
+    return (values * weights).sum(axis=0)
+
+def adaptive_threshold(candidates, heights, slopes, fs):
+    """ The candidates that are beats, by the running signal (SPKI) and noise (NPKI) peak levels """
+    if len(candidates) == 0:
+        return []
+    learning = candidates < 2 * fs
+    spki = 0.25 * heights[learning].max() if learning.any() else 0.25 * heights.max()
+    npki = 0.5 * heights[learning].mean() if learning.any() else 0.5 * heights.mean()
+    beats, missed, rr = [], [], []
+    beat_slope = 0.0
+
+    for candidate, height, slope in zip(candidates, heights, slopes):
+        threshold = npki + 0.25 * (spki - npki)
+        is_beat = height > threshold
+        if is_beat and beats and candidate - beats[-1] < T_WAVE_WINDOW * fs and slope < 0.5 * beat_slope:
+            is_beat = False  # T wave, the QRS upstroke is steeper
+        if not is_beat:
+            npki = 0.125 * height + 0.875 * npki
+            missed.append((candidate, height, slope))
+            continue
+
+        # A long gap means a beat was below the threshold, take the largest candidate in it at half the threshold
+        if len(rr) >= 2 and candidate - beats[-1] > SEARCHBACK_RR * np.mean(rr[-8:]):
+            back = [entry for entry in missed if entry[0] - beats[-1] >= REFRACTORY * fs and entry[1] > 0.5 * threshold]
+            if back:
+                found = max(back, key=lambda entry: entry[1])
+                rr.append(found[0] - beats[-1])
+                beats.append(found[0])
+                spki = 0.25 * found[1] + 0.75 * spki
+        if beats:
+            rr.append(candidate - beats[-1])
+        beats.append(candidate)
+        beat_slope = slope
+        spki = 0.125 * height + 0.875 * spki
+        missed = []
+    return beats
+
+def detect_qrs(signals, fs):
+    """ Sample indexes of the R peaks of a record, signals is {lead: samples} or a list of equally long leads """
+    signals = list(signals.values()) if isinstance(signals, dict) else list(signals)
+    if not signals or not fs or fs <= 2 * BAND[1] or len(signals[0]) < fs:
+        return np.array([], dtype=np.int32)
+    leads = np.vstack([np.asarray(signal, dtype=np.float64) for signal in signals])
+    energy = scaled_sum(np.gradient(bandpass(leads, fs, BAND), axis=1) ** 2)
+    window = max(1, int(INTEGRATION_WINDOW * fs))
+    integrated = np.convolve(energy, np.ones(window) / window, mode='same')
+    if not integrated.any():
+        return np.array([], dtype=np.int32)
+
+    candidates, properties = scipy.signal.find_peaks(integrated, height=0, distance=max(1, int(REFRACTORY * fs)))
+    # Steepest slope ahead of each candidate, all windows in one fancy index
+    windows = np.clip(candidates[:, None] + np.arange(-window, 1)[None, :], 0, len(energy) - 1)
+    slopes = np.sqrt(energy[windows].max(axis=1))
+    beats = np.array(adaptive_threshold(candidates, properties['peak_heights'], slopes, fs), dtype=np.int64)
+    if len(beats) == 0:
+        return np.array([], dtype=np.int32)
+
+    # The integration window is centered, the QRS lies within half a window either side of its peak.
+    # The R peak is where the scaled leads together deviate most, on a wider band that keeps the wave's shape.
+    amplitude = scaled_sum(bandpass(leads, fs, (1.0, min(40.0, 0.45 * fs))) ** 2)
+    half = window // 2
+    windows = np.clip(beats[:, None] + np.arange(-half, half + 1)[None, :], 0, len(amplitude) - 1)
+    r_peaks = windows[np.arange(len(beats)), amplitude[windows].argmax(axis=1)]
+    return np.unique(r_peaks).astype(np.int32)
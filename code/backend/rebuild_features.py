@@ -0,0 +1,101 @@
+"""Fills patient_features, the diagnosis index, the R peaks, beat baselines and
+median beats and the similarity embeddings for patients stored before the tables existed.
+
+Run from the code/ folder:
+
+    python -m backend.rebuild_features [--batch-size N] [--after PATIENT_ID] [--no-heart-rate]
+
+Patients are walked in patient_id order. New records and result vector posts
+keep the tables up to date on their own, so this is only needed once (or after
+the feature, diagnosis, QRS detector or embedding definitions change).
+--no-heart-rate skips decoding the ECG data and only rebuilds the header and
+result vector columns, without the beats, heart rate, axis and embedding. --after
+continues after the last patient id a previous run printed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.db.ecg import fetch_ecg_data_by_patient_id
+from backend.db.diagnosis import index_patient_diagnoses
+from backend.db.features import upsert_patient_features
+from backend.db.utils import fetch_from_db
+from backend.services.feature_service import patient_features, estimate_heart_rate, estimate_axis, refresh_result_vector_features
+from backend.services.similarity_service import record_embedding
+from backend.services.beat_service import record_r_peaks, save_record_beats
+from backend.db.embedding import upsert_embedding
+
+LIST_COLUMNS = ['conduction_system_disease', 'cardiac_pacing', 'hypertrophies', 'ischemia']
+
+
+def patient_info_from_row(row):
+    """ patients row in the shape patient_features expects, the list columns are JSON text """
+    info = dict(row)
+    for column in LIST_COLUMNS:
+        if isinstance(info.get(column), str):
+            try:
+                info[column] = json.loads(info[column])
+            except ValueError:
+                info[column] = [info[column]]
+    return info
+
+
+def rebuild_patient(row, heart_rate=True):
+    patient_info = patient_info_from_row(row)
+    index_patient_diagnoses(row['patient_id'], patient_info)
+    features = patient_features(patient_info)
+    if heart_rate:
+        ecg_data = fetch_ecg_data_by_patient_id(row['patient_id'])
+        if ecg_data:
+            # Detected once, the heart rate and embedding reuse the peaks
+            ecg_data['r_peaks'] = record_r_peaks(ecg_data)
+            save_record_beats(row['patient_id'], ecg_data)
+        features['heart_rate'] = estimate_heart_rate(ecg_data) if ecg_data else None
+        if ecg_data:
+            features.update(estimate_axis(ecg_data))
+        embedding = record_embedding(ecg_data) if ecg_data else None
+        if embedding is not None:
+            upsert_embedding(row['patient_id'], embedding)
+    upsert_patient_features(row['patient_id'], features)
+    refresh_result_vector_features([row['patient_id']])
+
+
+def run(batch_size=200, after=0, heart_rate=True):
+    """ Rebuilds every patient after the given id, returns the number rebuilt """
+    started = time.perf_counter()
+    rebuilt = 0
+    while True:
+        result = fetch_from_db('SELECT * FROM patients WHERE patient_id > %s ORDER BY patient_id LIMIT %s', (after, batch_size))
+        if not result["success"]:
+            raise Exception(result["error"])
+        if not result["data"]:
+            break
+        for row in result["data"]:
+            rebuild_patient(row, heart_rate)
+        rebuilt += len(result["data"])
+        after = result["data"][-1]['patient_id']
+        elapsed = time.perf_counter() - started
+        print(f"{rebuilt} patients, last patient_id {after}, {rebuilt / elapsed:.1f} patients/s")
+    return rebuilt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.rebuild_features",
+                                     description="Rebuild the patient_features table and diagnosis index from the stored patients.")
+    parser.add_argument("--batch-size", type=int, default=200, help="patients read per query (default: 200)")
+    parser.add_argument("--after", type=int, default=0, help="start after this patient_id")
+    parser.add_argument("--no-heart-rate", action="store_true", help="do not decode ECG data for the heart rate")
+    args = parser.parse_args(argv)
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    rebuilt = run(args.batch_size, args.after, heart_rate=not args.no_heart_rate)
+    print(f"Rebuilt features of {rebuilt} patients")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Read-through cache for decoded ECG records.
+
+The memory tier is an LRU bounded by an estimate of the decoded size in
+bytes. The optional disk tier keeps one JSON file per record in a directory
+that several server processes can share, so a record another process already
+decoded skips the database. Entries of both tiers are dropped after max_age
+seconds: an invalidation in one process only reaches its memory and the disk
+file, and the other processes pick it up once their copy expires. The disk
+tier drops its oldest files beyond disk_max_bytes.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_size(value):
+    """ Rough in-memory size of a decoded JSON value, lists of numbers are counted without walking them """
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, list):
+        if value and isinstance(value[0], (int, float)):
+            return sys.getsizeof(value) + 24 * len(value)
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class RecordCache:
+    def __init__(self, max_bytes=256 * 1024 ** 2, disk_dir=None, max_age=300.0, disk_max_bytes=1024 ** 3):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.max_age = max_age
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size, stored at), least recently used first
+        self._bytes = 0
+        self._generation = 0  # bumped by every invalidation, stops a load that raced it from being stored
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0, "invalidations": 0}
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+            with open(path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, value, generation):
+        # Written to a temporary file and renamed so readers never see half a record. The rename
+        # happens under the lock and only if no invalidation came in since the value was loaded,
+        # otherwise a stale record would be put back after invalidate removed it.
+        try:
+            descriptor, temp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+            with os.fdopen(descriptor, 'w') as file:
+                json.dump(value, file)
+            with self._lock:
+                current = generation == self._generation
+                if current:
+                    os.replace(temp_path, self._disk_path(key))
+            if not current:
+                os.remove(temp_path)
+                return
+            self._prune_disk()
+        except OSError as e:
+            print(f"\033[93mCould not write the ECG cache file for {key}: {e}\033[0m")  # Yellow text
+
+    def _prune_disk(self):
+        """ Removes the oldest cache files until the disk tier fits in disk_max_bytes """
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # removed by another process meanwhile
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self._counters["disk_evictions"] += 1
+
+    def _store(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size, time.monotonic())
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._counters["evictions"] += 1
+
+    def get(self, key, load):
+        """ Cached value for key, otherwise load() is called and a result that is not None is cached """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[2] <= self.max_age:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry[0]
+            if entry is not None:
+                self._bytes -= self._entries.pop(key)[1]
+            generation = self._generation
+
+        value = self._read_disk(key)
+        from_disk = value is not None
+        if not from_disk:
+            value = load()
+            if value is None:
+                with self._lock:
+                    self._counters["misses"] += 1
+                return None
+        size = estimate_size(value)
+
+        with self._lock:
+            self._counters["disk_hits" if from_disk else "misses"] += 1
+            if generation != self._generation:
+                return value  # invalidated while loading, the value may already be stale
+            self._store(key, value, size)
+        if not from_disk and self.disk_dir:
+            self._write_disk(key, value, generation)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._counters["invalidations"] += 1
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+        if self.disk_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": round((self._counters["hits"] + self._counters["disk_hits"]) / lookups, 3) if lookups else 0.0,
+                "disk": bool(self.disk_dir),
+                **self._counters,
+            }
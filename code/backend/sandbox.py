@@ -0,0 +1,167 @@
+"""Runs record parsing in separate worker processes with time and memory limits.
+
+A pathological .hea/.dat pair can make wfdb or find_peaks hang or eat memory.
+Each call is sent to an idle worker process. The worker has an address space
+limit (RLIMIT_AS, where the platform supports it), and the caller stops
+waiting after timeout seconds. A worker that times out is killed, and one
+that crashes is replaced, so only that record fails and the other workers keep
+going. ProcessPoolExecutor is not used because it cannot kill one stuck task
+without breaking the whole pool.
+"""
+import multiprocessing
+import os
+import pickle
+import queue
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows, no memory limit
+    resource = None
+
+# Modules the fork server imports once so new workers start quickly
+PRELOAD = ['backend.ecg_processing']
+
+
+class SandboxError(Exception):
+    """Raised when a call timed out, ran out of memory or its worker died"""
+
+
+def _context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(PRELOAD)
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _worker_main(conn, memory_limit, initializer, initargs):
+    sys.stdout = open(os.devnull, 'w')  # the parse code prints for every record
+    if memory_limit and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    if initializer is not None:
+        initializer(*initargs)
+
+    while True:
+        try:
+            func, args = conn.recv()
+        except EOFError:
+            return  # the pool was closed
+        try:
+            conn.send(("ok", func(*args)))
+        except MemoryError:
+            conn.send(("error", f"Out of memory (limit {memory_limit // 2 ** 20} MB)"))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, context, memory_limit, initializer, initargs):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit, initializer, initargs),
+                                       name="ecg-parser", daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class SandboxPool:
+    def __init__(self, workers=2, timeout=30.0, memory_limit=2 * 1024 ** 3, initializer=None, initargs=()):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.initializer = initializer
+        self.initargs = initargs
+
+        self._context = _context()
+        self._lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._started = 0
+        self._all = set()
+        self._closed = False
+        self._counters = {"calls": 0, "timed_out": 0, "crashed": 0, "failed": 0, "respawned": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _spawn(self):
+        worker = _Worker(self._context, self.memory_limit, self.initializer, self.initargs)
+        with self._lock:
+            self._all.add(worker)
+        return worker
+
+    def _checkout(self):
+        # Workers are started on first use, up to self.workers of them
+        with self._lock:
+            if self._closed:
+                raise SandboxError("Parser pool is closed.")
+            start_new = self._idle.empty() and self._started < self.workers
+            if start_new:
+                self._started += 1
+        return self._spawn() if start_new else self._idle.get()
+
+    def _replace(self, worker, reason):
+        worker.kill()
+        with self._lock:
+            self._all.discard(worker)
+            self._counters[reason] += 1
+            self._counters["respawned"] += 1
+        return self._spawn()
+
+    def call(self, func, *args):
+        """ Runs func(*args) in a worker process, raises SandboxError if it fails, hangs or crashes """
+        worker = self._checkout()
+        with self._lock:
+            self._counters["calls"] += 1
+        try:
+            try:
+                worker.conn.send((func, args))
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                raise SandboxError(f"Cannot send the call to a parser process: {e}")
+            if not worker.conn.poll(self.timeout):
+                worker = self._replace(worker, "timed_out")
+                raise SandboxError(f"Timed out after {self.timeout:g}s")
+            status, value = worker.conn.recv()
+        except (EOFError, OSError):
+            worker.process.join(1)
+            exitcode = worker.process.exitcode
+            worker = self._replace(worker, "crashed")
+            raise SandboxError(f"Parser process crashed (exit code {exitcode})")
+        finally:
+            self._idle.put(worker)
+
+        if status == "error":
+            with self._lock:
+                self._counters["failed"] += 1
+            raise SandboxError(value)
+        return value
+
+    def metrics(self):
+        with self._lock:
+            return {"workers": self.workers, "started": len(self._all), **self._counters}
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            workers = list(self._all)
+            self._all.clear()
+        for worker in workers:
+            worker.kill()
+
+
+def parse_in_sandbox(pool, parse, key):
+    """ parse(key) in the pool, sandbox failures come back as the usual ECG error dict """
+    try:
+        return pool.call(parse, key)
+    except SandboxError as e:
+        print(f"Error reading ECG data: {e}")
+        return {"error": str(e), "message": "Failed to process ECG data"}
@@ -0,0 +1,93 @@
+import numpy as np
+from backend.db.beats import *
+from backend.qrs import detect_qrs, QRS_DETECTOR_VERSION
+from backend.baseline import beat_baselines, corrected_peaks
+from backend.median_beat import median_beats, median_beat_amplitudes
+
+def record_fs(ecg_data):
+    """ Sampling rate of a parsed or stored record, from the time axis for records without fs """
+    time = ecg_data.get('time') or []
+    return ecg_data.get('fs') or (1 / (time[1] - time[0]) if len(time) > 1 else None)
+
+def record_r_peaks(ecg_data):
+    """ R peak sample indexes of a record, the ones analyze_record found or detected now """
+    if ecg_data.get('r_peaks') is not None:
+        return np.asarray(ecg_data['r_peaks'], dtype=np.int32)
+    signals = ecg_data.get('signals')
+    if not isinstance(signals, dict) or not signals:
+        return np.array([], dtype=np.int32)
+    return detect_qrs(signals, record_fs(ecg_data))
+
+def record_beat_baselines(ecg_data, r_peaks=None):
+    """ Isoelectric segment and baseline of every beat, the ones analyze_record found or detected now """
+    if ecg_data.get('beat_baselines') is not None:
+        return ecg_data['beat_baselines']
+    signals = ecg_data.get('signals')
+    if not isinstance(signals, dict) or not signals:
+        return {"segments": [], "leads": {}}
+    r_peaks = record_r_peaks(ecg_data) if r_peaks is None else r_peaks
+    return beat_baselines(signals, record_fs(ecg_data), r_peaks, ecg_data.get('adc'))
+
+def record_measurements(ecg_data, beats):
+    """ Baseline corrected QRS peaks and lead vectors of every beat of leads I, II and III, from a fetch_record_beats entry """
+    baselines = beats['baselines']
+    return corrected_peaks(ecg_data['signals'], beats['fs'], beats['r_peaks'], baselines['segments'], baselines['leads'],
+                           adc=ecg_data.get('adc'))
+
+def heart_rate(r_peaks, fs):
+    """ Beats per minute from the median RR interval, None with fewer than two beats """
+    if len(r_peaks) < 2 or not fs:
+        return None
+    return round(float(60 * fs / np.median(np.diff(r_peaks))), 1)
+
+def record_median_beat(ecg_data, r_peaks=None, baselines=None):
+    """ Baseline corrected median beat of every lead of a record, None without a whole beat """
+    signals = ecg_data.get('signals')
+    if not isinstance(signals, dict) or not signals:
+        return None
+    r_peaks = record_r_peaks(ecg_data) if r_peaks is None else r_peaks
+    baselines = record_beat_baselines(ecg_data, r_peaks) if baselines is None else baselines
+    return median_beats(signals, record_fs(ecg_data), r_peaks, ecg_data.get('adc'), baselines)
+
+def save_record_beats(patient_id, ecg_data):
+    """ R peaks, beat baselines and median beat of a record into ecg_beats and ecg_median_beats, each found once """
+    fs = record_fs(ecg_data)
+    if not fs:
+        return
+    r_peaks = record_r_peaks(ecg_data)
+    baselines = record_beat_baselines(ecg_data, r_peaks)
+    upsert_record_beats(patient_id, r_peaks, fs, QRS_DETECTOR_VERSION, baselines)
+    median = record_median_beat(ecg_data, r_peaks, baselines)
+    if median is not None:
+        upsert_median_beat(patient_id, fs, median)
+
+def store_record_beats(ecg_data):
+    """ save_record_beats of a stored record, a failure is reported but never fails the ingest """
+    patient_id = (ecg_data.get('patient_info') or {}).get('anonymous_id')
+    if patient_id is None:
+        return
+    try:
+        save_record_beats(int(patient_id), ecg_data)
+    except Exception as e:
+        print("\033[93mCould not store the R peaks: {}\033[0m".format(str(e)))  # Yellow text
+
+def beats_response(beats):
+    """ JSON shape of a fetch_record_beats entry """
+    return {
+        "fs": beats['fs'],
+        "detector_version": beats['detector_version'],
+        "heart_rate": heart_rate(beats['r_peaks'], beats['fs']),
+        "r_peaks": beats['r_peaks'].tolist(),
+    }
+
+def median_beat_response(median, leads=None):
+    """ JSON shape of a fetch_median_beats entry, only the given leads when there are any """
+    names = [name for name in median['leads'] if not leads or name in leads]
+    amplitudes = median_beat_amplitudes(median, median['fs'])
+    return {
+        "fs": median['fs'],
+        "offset": median['offset'],
+        "beat_count": median['beat_count'],
+        "leads": {name: np.round(median['beat'][median['leads'].index(name)].astype(np.float64), 5).tolist() for name in names},
+        "amplitudes": {name: amplitudes[name] for name in names if name in amplitudes},
+    }
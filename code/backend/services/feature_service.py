@@ -0,0 +1,137 @@
+import re
+import warnings
+import numpy as np
+from backend.db.features import *
+from backend.services.beat_service import record_fs, record_r_peaks, heart_rate, record_median_beat
+from backend.axis import electrical_axis, axis_diagnosis
+from backend.median_beat import median_beat_amplitudes
+
+# Rhythm comment text to a short code, the first keyword found wins
+RHYTHM_CODES = [
+    ('fibrillation', 'AF'),
+    ('flutter', 'AFL'),
+    ('pace', 'PACED'),
+    ('tachycardia', 'STACH'),
+    ('bradycardia', 'SBRAD'),
+    ('irregular', 'SARRH'),
+    ('arrhythmia', 'SARRH'),
+    ('sinus', 'SR'),
+]
+
+# Diagnosis flag, the patient_info list it comes from and the words that set it
+DIAGNOSIS_FLAGS = [
+    ('lvh', 'hypertrophies', ['left ventricular']),
+    ('rvh', 'hypertrophies', ['right ventricular']),
+    ('lah', 'hypertrophies', ['left atrial']),
+    ('rah', 'hypertrophies', ['right atrial']),
+    ('lbbb', 'conduction_system_disease', ['left bundle', 'lbbb']),
+    ('rbbb', 'conduction_system_disease', ['right bundle', 'rbbb']),
+    ('av_block', 'conduction_system_disease', ['av block', 'a-v block', 'atrioventricular']),
+]
+
+def rhythm_code(rhythm):
+    if not rhythm:
+        return None
+    rhythm = rhythm.lower()
+    return next((code for keyword, code in RHYTHM_CODES if keyword in rhythm), 'OTHER')
+
+def parse_age(age):
+    """ Whole years from the header text ('45', '89+', None) """
+    match = re.search(r'\d+', str(age)) if age is not None else None
+    return int(match.group()) if match else None
+
+def as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def patient_features(patient_info):
+    """ Typed feature columns from the header fields of a parsed record """
+    sex = str(patient_info.get('sex') or patient_info.get('gender') or '').strip().upper()[:1] or None
+    features = {
+        'age': parse_age(patient_info.get('age')),
+        'sex': sex,
+        'rhythm_code': rhythm_code(patient_info.get('rhythm') or patient_info.get('heart_rhythm')),
+    }
+    for flag, field, words in DIAGNOSIS_FLAGS:
+        text = ' '.join(str(item) for item in as_list(patient_info.get(field))).lower()
+        features[flag] = any(word in text for word in words)
+    features['ischemia'] = bool(as_list(patient_info.get('ischemia')))
+    features['pacing'] = bool(as_list(patient_info.get('cardiac_pacing')))
+    features['repolarization'] = bool(patient_info.get('repolarization_abnormalities'))
+    return features
+
+def estimate_heart_rate(ecg_data):
+    """ Beats per minute from the record's R peaks, None if it cannot tell """
+    signals = ecg_data.get('signals')
+    if not isinstance(signals, dict):
+        return None
+    fs = record_fs(ecg_data)
+    if not fs or len(next(iter(signals.values()), [])) < fs:
+        return None
+    return heart_rate(record_r_peaks(ecg_data), fs)
+
+def axis_features(median, fs):
+    """ Automatic axis columns from a median beat, its net QRS amplitudes (max - |min|) in leads I and III
+
+    All None without a median beat, or without leads I and III or any QRS in them.
+    """
+    features = dict.fromkeys(AUTO_AXIS_COLUMNS)
+    amplitudes = median_beat_amplitudes(median, fs) if median else {}
+    for lead, name in ((1, 'i'), (2, 'ii'), (3, 'iii')):
+        if name in amplitudes:
+            features[f'net_qrs_{lead}'] = amplitudes[name]['lead_vector']
+    if features['net_qrs_1'] is None or features['net_qrs_3'] is None:
+        return features
+    angle, magnitude = electrical_axis(features['net_qrs_1'], features['net_qrs_3'])
+    if magnitude > 0:
+        features['auto_axis'] = round(float(angle), 1)
+        features['auto_axis_diagnosis'] = axis_diagnosis(float(angle))
+    return features
+
+def estimate_axis(ecg_data):
+    """ axis_features of a parsed or stored record's median beat """
+    return axis_features(record_median_beat(ecg_data), record_fs(ecg_data))
+
+def store_record_features(ecg_data):
+    """ Feature row of a stored record with its heart rate and axis, a failure is reported but never fails the ingest """
+    patient_info = ecg_data.get('patient_info') or {}
+    patient_id = patient_info.get('anonymous_id')
+    if patient_id is None:
+        return
+    try:
+        upsert_patient_features(patient_id, {**patient_features(patient_info), 'heart_rate': estimate_heart_rate(ecg_data),
+                                             **estimate_axis(ecg_data)})
+    except Exception as e:
+        print("\033[93mCould not store patient features: {}\033[0m".format(str(e)))  # Yellow text
+
+def result_vector_features(measures):
+    """ Axis and QRS amplitude columns from fetch_result_vector_measures rows """
+    def column(name):
+        return np.array([float(row[name]) if row[name] not in (None, '', 'null') else np.nan for row in measures])
+
+    features = {'selections': len(measures)}
+    if not measures:
+        return {**features, 'axis': None, 'qrs_amplitude_1': None, 'qrs_amplitude_2': None, 'qrs_amplitude_3': None}
+
+    # Leads without any selection are all NaN, their mean is NaN and not a warning
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        lead1, lead3 = np.nanmean(column('lead_1_lead_vector')), np.nanmean(column('lead_3_lead_vector'))
+        axis, _ = electrical_axis(lead1, lead3)
+        features['axis'] = None if np.isnan(axis) else round(float(axis), 1)
+        for lead in (1, 2, 3):
+            amplitude = np.nanmean(column(f'lead_{lead}_corrected_max_peak') - column(f'lead_{lead}_corrected_min_peak'))
+            features[f'qrs_amplitude_{lead}'] = None if np.isnan(amplitude) else round(float(amplitude), 4)
+    return features
+
+def refresh_result_vector_features(patient_ids):
+    """ Recomputes axis and QRS amplitudes of the patients after their beat selections changed """
+    for patient_id in sorted(set(patient_ids)):
+        try:
+            measures = fetch_result_vector_measures(patient_id)
+            if not measures["success"]:
+                raise Exception(measures["error"])
+            upsert_patient_features(patient_id, result_vector_features(measures["data"]))
+        except Exception as e:
+            print("\033[93mCould not update patient features of {}: {}\033[0m".format(patient_id, str(e)))  # Yellow text
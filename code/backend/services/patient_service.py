@@ -1,6 +1,9 @@
 from backend.db.patient import *
 from backend.db.ecg import *
 from backend.services.ecg_service import *
+from backend.services.feature_service import store_record_features
+from backend.services.similarity_service import store_record_embedding
+from backend.services.beat_service import store_record_beats
 
 def validate_patient_info(patient_info):
     if "anonymous_id" not in patient_info:
@@ -48,9 +51,60 @@ def store_patient_and_ecg_data(data):
                 return {"success": False, "error": ecg_result["error"]}
         else:
             print("\033[92mECG data added successfully\033[0m") # Green text
+            store_record_beats(data)
+            store_record_features(data)
+            store_record_embedding(data)
             
         return {"success": True, "message": "Patient and ECG data stored successfully"}
 
     except Exception as e:
         print("\033[91mError: {}\033[0m".format(str(e)))  # Red text
         return {"success": False, "error": str(e)}
+
+def store_patients_and_ecg_data(records, store_one=store_patient_and_ecg_data):
+    """ store_patient_and_ecg_data for a batch of parsed records, one result per record
+
+    The new patients and ECG rows of the whole batch are written with executemany in one
+    transaction. If that fails every record is stored on its own with store_one instead,
+    so a bad record only fails itself.
+    """
+    results = [None] * len(records)
+    try:
+        # Records the checks of the single path would turn down get its error results
+        single = {n for n, data in enumerate(records)
+                  if not validate_patient_info(data['patient_info'])["success"] or not validate_ecg_data(data)["success"]}
+        patient_ids = [data['patient_info']['anonymous_id'] for n, data in enumerate(records) if n not in single]
+        known_patients = fetch_existing_patient_ids(patient_ids)
+        with_ecg = fetch_patient_ids_with_ecg(patient_ids)
+
+        new_patients, patient_rows, stored, ecg_rows = [], [], [], []
+        for n, data in enumerate(records):
+            if n in single:
+                continue
+            patient_id = str(data['patient_info']['anonymous_id'])
+            if patient_id in with_ecg:
+                results[n] = {"success": False, "ecg_exists": True}
+                continue
+            with_ecg.add(patient_id)  # a second record of the patient in the same batch
+            if patient_id not in known_patients:
+                known_patients.add(patient_id)
+                new_patients.append(data['patient_info'])
+                patient_rows.append(patient_params(data['patient_info']))
+            stored.append(n)
+            ecg_rows.append(ecg_data_params(data['patient_info']['anonymous_id'], data))
+        execute_transaction([(INSERT_PATIENT, patient_rows), (INSERT_ECG_DATA, ecg_rows)])
+    except Exception as e:
+        print("\033[91mError storing the batch, storing its records one by one: {}\033[0m".format(str(e)))  # Red text
+        return [store_one(data) for data in records]
+    print("\033[92m{} new patients and {} ECG records added in one batch\033[0m".format(len(new_patients), len(stored)))  # Green text
+
+    for patient_info in new_patients:
+        index_new_patient(patient_info)
+    for n in stored:
+        store_record_beats(records[n])
+        store_record_features(records[n])
+        store_record_embedding(records[n])
+        results[n] = {"success": True, "message": "Patient and ECG data stored successfully"}
+    for n in sorted(single):
+        results[n] = store_one(records[n])
+    return results
@@ -0,0 +1,66 @@
+import hashlib
+import os
+from backend.db.record_hash import *
+from backend.wfdb_reader import dat_file_names, record_members
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def record_file_paths(base_path):
+    """ Returns the .hea path followed by every .dat file its signal lines reference """
+    hea_path = base_path + ".hea"
+    with open(hea_path, "r", errors="replace") as file:
+        header_text = file.read()
+    directory = os.path.dirname(base_path)
+    return [hea_path] + [os.path.join(directory, name) for name in dat_file_names(header_text)]
+
+def hash_record_files(base_path):
+    """ Content hash of a record, the bytes of its .hea and .dat files """
+    digest = hashlib.blake2b(digest_size=32)
+    for path in record_file_paths(base_path):
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_zip_record(zip_ref, base_name):
+    """ Same hash as hash_record_files for a record inside an open ZipFile """
+    digest = hashlib.blake2b(digest_size=32)
+    for member in record_members(zip_ref, base_name):
+        with zip_ref.open(member) as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def lookup_record(base_path, zip_ref=None):
+    """ Returns (content_hash, patient_id), patient_id is None if the record has not been ingested yet """
+    try:
+        if zip_ref is not None:
+            content_hash = hash_zip_record(zip_ref, base_path)
+        else:
+            content_hash = hash_record_files(base_path)
+    except (OSError, KeyError):
+        return None, None  # unreadable record, let the parser report it
+
+    try:
+        return content_hash, fetch_patient_id_by_hash(content_hash)
+    except Exception as e:
+        print("\033[93mCould not check record hash: {}\033[0m".format(str(e)))  # Yellow text
+        return content_hash, None
+
+def remember_record(content_hash, patient_info, storage_result):
+    """ Records the hash of a stored record so uploading it again skips parsing """
+    if content_hash is None or not isinstance(storage_result, dict):
+        return
+    if not (storage_result.get("success") or storage_result.get("ecg_exists")):
+        return
+    patient_id = (patient_info or {}).get("anonymous_id")
+    if patient_id is None:
+        return
+    try:
+        insert_record_hash(content_hash, patient_id)
+    except Exception as e:
+        print("\033[93mCould not store record hash: {}\033[0m".format(str(e)))  # Yellow text
+
+def duplicate_result(patient_id):
+    """ Storage result reported for a record that was already ingested """
+    return {"success": False, "duplicate": True, "patient_id": patient_id}
@@ -1,5 +1,7 @@
+from datetime import datetime
 from flask import jsonify
 from backend.db.result_vector import *
+from backend.services.feature_service import refresh_result_vector_features
 
 def validate_result_vector_data(data):
     if "anonymous_id" not in data or not str(data['anonymous_id']).isdigit():
@@ -22,10 +24,56 @@ def add_result_vector(data):
     try:
         processed_data = process_result_vector(data)
         insert_result_vector_into_db(processed_data)
+        refresh_result_vector_features([int(data['anonymous_id'])])
         return {"success": True, "message": "Result vector stored successfully"}
     except Exception as e:
         return {"success": False, "error": str(e)}, 500
 
+def add_result_vectors(data_list):
+    """ Validates every payload first, then stores them all with one multi-row insert """
+    if not isinstance(data_list, list) or not data_list:
+        return {"success": False, "error": "Expected a non-empty list of result vectors"}, 400
+
+    errors = []
+    for index, data in enumerate(data_list):
+        validation_result = validate_result_vector_data(data) if isinstance(data, dict) else ({"error": "Invalid result vector"}, 400)
+        if isinstance(validation_result, tuple):
+            errors.append({"index": index, "error": validation_result[0]["error"]})
+    if errors:
+        return {"success": False, "errors": errors}, 400
+
+    try:
+        store_result_vectors([process_result_vector(data) for data in data_list])
+        return {"success": True, "stored": len(data_list), "message": "Result vectors stored successfully"}
+    except Exception as e:
+        return {"success": False, "error": str(e)}, 500
+
+def store_result_vectors(processed_list):
+    """ Inserts the rows in one statement, then recomputes the features of their patients """
+    insert_result_vectors_into_db(processed_list)
+    refresh_result_vector_features([processed_data['anonymous_id'] for processed_data in processed_list])
+
+def queue_result_vector(buffer, data):
+    """ add_result_vector through a write-behind buffer, acknowledged once queued or once written (buffer.ack) """
+    validation_result = validate_result_vector_data(data)
+    if isinstance(validation_result, tuple):
+        return validation_result
+
+    processed_data = process_result_vector(data)
+    processed_data['created_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        pending = buffer.submit(processed_data)
+    except TimeoutError as e:
+        # Taken back out of the queue, nothing was stored so the post can be retried
+        return {"success": False, "error": str(e)}, 503
+    except Exception as e:
+        return {"success": False, "error": str(e)}, 500
+    if buffer.ack == "db":
+        if not pending.done():
+            return {"success": True, "pending": True, "message": "Result vector accepted, write pending"}, 202
+        return {"success": True, "message": "Result vector stored successfully"}
+    return {"success": True, "message": "Result vector queued"}
+
 def process_result_vector(data):
     processed_data = {
         "anonymous_id": int(data['anonymous_id']),
@@ -33,10 +81,14 @@ def process_result_vector(data):
     }
     return processed_data
 
+LEAD_NUMBERS = {"I": 1, "II": 2, "III": 3}
+
 def process_lead_data(lead_data_list):
     beat_data = {"Lead 1": {}, "Lead 2": {}, "Lead 3": {}} #ensure all expected keys exist. empty dictionaries for missing leads avoiding key errors.
     for lead_data in lead_data_list:
         lead = lead_data.get('lead')
+        # The chart posts roman lead names (I, II, III)
+        lead = LEAD_NUMBERS.get(str(lead).upper(), lead)
         beat_data[f"Lead {lead}"] = {
             "start_time": lead_data.get('startTime'),
             "end_time": lead_data.get('endTime'),
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+import numpy as np
+from backend.db.embedding import *
+from backend.services.beat_service import record_fs, record_r_peaks
+from backend.median_beat import median_beats
+from backend.similarity_index import EmbeddingIndex
+
+# The independent leads (the limb leads III, aVR, aVL, aVF are combinations of I and II)
+EMBEDDING_LEADS = ['i', 'ii', 'v1', 'v2', 'v3', 'v4', 'v5', 'v6']
+SAMPLES_PER_LEAD = 32
+EMBEDDING_DIMS = len(EMBEDDING_LEADS) * SAMPLES_PER_LEAD
+# Median beat window around the R peak, seconds
+BEAT_WINDOW = (-0.2, 0.4)
+
+# Searches rank on a projection first once the index is this big, SIMILARITY_APPROXIMATE=0 turns it off
+APPROXIMATE_MIN_RECORDS = int(os.getenv('SIMILARITY_APPROXIMATE_MIN_RECORDS', 50000))
+APPROXIMATE = os.getenv('SIMILARITY_APPROXIMATE', '1') == '1'
+
+index = EmbeddingIndex(EMBEDDING_DIMS)
+_loaded = False
+_load_lock = threading.Lock()
+
+def record_embedding(ecg_data):
+    """ Unit length vector of the record's median beat per lead, resampled to SAMPLES_PER_LEAD, None without beats
+
+    Leads the record does not have stay zero.
+    """
+    signals = ecg_data.get('signals')
+    fs = record_fs(ecg_data)
+    if not isinstance(signals, dict) or not signals or not fs:
+        return None
+    length = int(-BEAT_WINDOW[0] * fs) + int(BEAT_WINDOW[1] * fs)
+    if length < SAMPLES_PER_LEAD:
+        return None
+    median = median_beats({name: signals[name] for name in EMBEDDING_LEADS if name in signals}, fs,
+                          record_r_peaks(ecg_data), ecg_data.get('adc'), window=BEAT_WINDOW)
+    if median is None:
+        return None
+
+    edges = np.linspace(0, length, SAMPLES_PER_LEAD + 1).astype(int)
+    embedding = np.zeros((len(EMBEDDING_LEADS), SAMPLES_PER_LEAD))
+    for name, beat in zip(median['leads'], median['beat'].astype(np.float64)):
+        beat -= beat[:edges[2]].mean()  # PR segment level as zero
+        # Mean of each bin rather than every nth sample, so it does not alias
+        embedding[EMBEDDING_LEADS.index(name)] = np.add.reduceat(beat, edges[:-1]) / np.diff(edges)
+
+    norm = np.linalg.norm(embedding)
+    if norm == 0 or not np.isfinite(norm):
+        return None
+    return (embedding.ravel() / norm).astype(np.float32)
+
+def get_index():
+    """ The process wide index, loaded from ecg_embeddings on first use """
+    global _loaded
+    if not _loaded:
+        with _load_lock:
+            if not _loaded:
+                for patient_id, vector in stream_embeddings():
+                    if len(vector) == EMBEDDING_DIMS:
+                        index.add(patient_id, vector)
+                _loaded = True
+    return index
+
+def reset_index():
+    """ Empties the index, the next search loads it again """
+    global index, _loaded
+    with _load_lock:
+        index = EmbeddingIndex(EMBEDDING_DIMS)
+        _loaded = False
+
+def store_record_embedding(ecg_data):
+    """ Embedding of a stored record into the table and index, a failure is reported but never fails the ingest """
+    patient_id = (ecg_data.get('patient_info') or {}).get('anonymous_id')
+    if patient_id is None:
+        return
+    try:
+        vector = record_embedding(ecg_data)
+        if vector is None:
+            return
+        upsert_embedding(int(patient_id), vector)
+        # Before the first load the stored row is picked up by it, during it the lock waits for it
+        with _load_lock:
+            if _loaded:
+                index.add(int(patient_id), vector)
+    except Exception as e:
+        print("\033[93mCould not store the record embedding: {}\033[0m".format(str(e)))  # Yellow text
+
+def remove_record_embedding(patient_id):
+    """ Takes a deleted patient out of this process' index, the table row goes with the patient (ON DELETE CASCADE)
+
+    Other server processes keep the patient in their index, similar_patients drops
+    such hits when it serves them.
+    """
+    with _load_lock:
+        if _loaded:
+            index.remove(int(patient_id))
+
+def drop_deleted(patient_ids):
+    """ Removes the patients deleted by another process from the index, returns the ones that still exist """
+    existing = fetch_embedded_patient_ids(patient_ids)
+    for patient_id in set(patient_ids) - existing:
+        remove_record_embedding(patient_id)
+    return existing
+
+def similar_patients(patient_id, k=10, approximate=None):
+    """ The k patients whose records are most similar to the patient's, cosine similarity of the embeddings """
+    started = time.perf_counter()
+    current = get_index()
+    vector = current.vector(int(patient_id))
+    if vector is None or not drop_deleted([int(patient_id)]):
+        return {"success": False, "error": "No embedding for this patient"}
+    if approximate is None:
+        approximate = APPROXIMATE and len(current) >= APPROXIMATE_MIN_RECORDS
+    if approximate and current.metrics()["projection_dims"] is None:
+        current.fit_projection()
+    # Hits deleted by another process are dropped from the index, then the search runs again for the rest
+    while True:
+        matches = current.search(vector, k, exclude=int(patient_id), approximate=approximate)
+        existing = drop_deleted([match for match, _ in matches])
+        if len(existing) == len(matches):
+            break
+    return {
+        "success": True,
+        "patient_id": int(patient_id),
+        "approximate": bool(approximate),
+        "data": [{"patient_id": match, "similarity": round(score, 4)} for match, score in matches],
+        "took_ms": round(1000 * (time.perf_counter() - started), 2),
+    }
@@ -0,0 +1,74 @@
+"""Content addressed store for ECG signal arrays.
+
+With SIGNAL_STORE_DIR set, each record's leads are written as one .npy file
+(leads x samples, so a lead is contiguous on disk) named after the SHA-256 of
+its contents. The ecg_data row then only keeps the key plus the lead names,
+shape, dtype and sampling rate. Reads np.load the file with mmap_mode='r', so
+a window of samples costs page cache reads instead of a database round trip
+and a JSON parse. Identical recordings share one file. Files are never
+removed by a patient delete, because another row may point to the same key.
+"""
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+
+class SignalStore:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.npy")
+
+    def put(self, signals, dtype, fs):
+        """ Writes {lead: samples} as one array, returns the metadata the ecg_data row keeps """
+        leads = list(signals)
+        array = np.ascontiguousarray(np.stack([np.asarray(signals[lead], dtype=dtype) for lead in leads]))
+        digest = hashlib.sha256(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(array.tobytes())
+        key = digest.hexdigest()
+
+        path = self.path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Temporary file and rename, a reader never maps half a file
+            descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(descriptor, 'wb') as file:
+                    np.save(file, array)
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        return {"key": key, "leads": leads, "shape": list(array.shape), "dtype": array.dtype.str, "fs": fs}
+
+    def open(self, key):
+        """ Read only memory map of the leads x samples array """
+        return np.load(self.path(key), mmap_mode='r')
+
+    def read(self, meta, start=None, stop=None, leads=None):
+        """ {lead: samples[start:stop]} as views into the memory map, nothing is copied """
+        array = self.open(meta["key"])
+        names = meta["leads"]
+        return {lead: array[names.index(lead), start:stop] for lead in (leads or names) if lead in names}
+
+
+# SIGNAL_STORE_DIR turns the store on, rows written without it keep their signals in the database
+SIGNAL_STORE_DIR = os.getenv('SIGNAL_STORE_DIR')
+
+store = SignalStore(SIGNAL_STORE_DIR) if SIGNAL_STORE_DIR else None
+
+
+def use_store(new_store):
+    """ Switches the store new records are written to (None keeps signals in the database), returns the previous one """
+    global store
+    previous, store = store, new_store
+    return previous
+
+
+def get_store():
+    return store
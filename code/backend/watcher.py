@@ -0,0 +1,221 @@
+"""Watches a folder tree for new WFDB records and ingests them as they land.
+
+Run from the code/ folder:
+
+    python -m backend.watcher <dir> [--interval S] [--settle S] [--batch-size N]
+                                    [--workers N] [--timeout S] [--memory-limit MB]
+                                    [--checkpoint PATH]
+
+A record is ingested once its .hea and every .dat it references exist, the
+.dat is as long as the header says, and their sizes have not changed for
+--settle seconds, so half written files are left alone. Ingestion goes through
+the same dedup/parse/store steps as the upload routes (backend.ingest).
+
+The checkpoint keeps the mtime of every folder, the records still waiting to
+settle or to be retried and the records already ingested, so after a restart
+only folders that changed are listed again and nothing is ingested twice. It
+is only written when one of those changed. An ingested record is remembered
+until its files are gone from the folder, after that the content hash check
+of the ingest steps is what keeps a copy of it from being stored again.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.ingest import ingest_batch, new_stats, parser_pool
+from backend.wfdb_reader import dat_file_names, parse_header
+
+
+class DirectoryWatcher:
+    def __init__(self, root, checkpoint=None, settle=2.0, batch_size=100, retry_interval=60.0):
+        self.root = os.path.abspath(root)
+        self.checkpoint = checkpoint or self.root.rstrip(os.sep) + '.watch-checkpoint.json'
+        self.settle = settle
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self.dirs = {}       # folder -> {"mtime": mtime_ns, "subdirs": [...]}
+        self.pending = {}    # base path -> signature seen on the previous poll
+        self.ingested = {}   # folder -> base paths ingested from it that are still there
+        self.retry_at = {}   # base path -> time a failed record is tried again
+        self.changed = False  # state differs from the checkpoint file
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.checkpoint):
+            return
+        with open(self.checkpoint, 'r') as file:
+            state = json.load(file)
+        self.dirs = state.get("dirs", {})
+        self.pending = {base_path: None for base_path in state.get("pending", [])}
+        self.retry_at = state.get("retry_at", {})
+        for base_path in state.get("ingested", []):
+            self.ingested.setdefault(os.path.dirname(base_path), set()).add(base_path)
+
+    def save(self):
+        """ Writes the checkpoint if anything in it changed since the last write """
+        if not self.changed:
+            return
+        # Write then rename so a crash never leaves a half written checkpoint
+        state = {
+            "dirs": self.dirs,
+            "pending": sorted(self.pending),
+            "retry_at": self.retry_at,
+            "ingested": sorted(base_path for paths in self.ingested.values() for base_path in paths),
+        }
+        temp_path = self.checkpoint + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(state, file)
+        os.replace(temp_path, self.checkpoint)
+        self.changed = False
+
+    def scan(self):
+        """ Base paths of the .hea files in folders whose mtime changed since the last scan """
+        found = []
+        seen = set()
+        recent = time.time_ns() - int(self.settle * 1e9)
+        stack = [self.root]
+        while stack:
+            folder = stack.pop()
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            seen.add(folder)
+
+            entry = self.dirs.get(folder)
+            # A folder changed in the last few seconds is listed again in case
+            # a file landed within the same mtime tick as the previous listing
+            if entry is None or entry["mtime"] != mtime or mtime > recent:
+                subdirs, headers = [], set()
+                with os.scandir(folder) as entries:
+                    for item in entries:
+                        if item.is_dir(follow_symlinks=False):
+                            subdirs.append(item.path)
+                        elif item.name.endswith('.hea'):
+                            headers.add(item.path[:-4])
+                done = self.ingested.get(folder, set())
+                if done - headers:
+                    # Files of ingested records were moved away, no need to remember them
+                    done &= headers
+                    if not done:
+                        del self.ingested[folder]
+                    self.changed = True
+                found.extend(sorted(headers - done))
+                listed = {"mtime": mtime, "subdirs": subdirs}
+                if listed != entry:
+                    self.dirs[folder] = entry = listed
+                    self.changed = True
+            stack.extend(entry["subdirs"])
+
+        for folder in list(self.dirs):
+            if folder not in seen:
+                del self.dirs[folder]  # folder was removed
+                self.ingested.pop(folder, None)
+                self.changed = True
+        return found
+
+    def record_signature(self, base_path):
+        """ (sizes, newest mtime) of a record's files, None while any of them is missing or short """
+        try:
+            with open(base_path + '.hea', 'r', errors='replace') as file:
+                header_text = file.read()
+            dat_paths = [os.path.join(os.path.dirname(base_path), name) for name in dat_file_names(header_text)]
+            if not dat_paths:
+                return None  # header is still being written
+            stats = [os.stat(path) for path in [base_path + '.hea'] + dat_paths]
+        except OSError:
+            return None
+
+        # For fast path formats the header says exactly how long the .dat must be
+        header = parse_header(header_text)
+        if header is not None and header["sig_len"] is not None:
+            n_samples = header["sig_len"] * header["n_sig"]
+            expected = n_samples * 2 if header["fmt"] == '16' else (n_samples * 3 + 1) // 2
+            if stats[1].st_size < expected:
+                return None
+
+        return tuple(stat.st_size for stat in stats), max(stat.st_mtime for stat in stats)
+
+    def poll(self, stats, pool=None):
+        """ Finds new records and ingests the complete ones, returns how many were tried """
+        for base_path in self.scan():
+            if base_path not in self.pending:
+                self.pending[base_path] = None
+                self.changed = True
+
+        now = time.time()
+        ready = []
+        for base_path, previous in list(self.pending.items()):
+            if not os.path.exists(base_path + '.hea'):
+                del self.pending[base_path]  # removed before it was complete
+                self.retry_at.pop(base_path, None)
+                self.changed = True
+                continue
+            if self.retry_at.get(base_path, 0) > now:
+                continue
+            signature = self.record_signature(base_path)
+            self.pending[base_path] = signature
+            if signature is not None and signature == previous and now - signature[1] >= self.settle:
+                ready.append(base_path)
+
+        for start in range(0, len(ready), self.batch_size):
+            batch = ready[start:start + self.batch_size]
+            finished = set(ingest_batch(batch, stats, pool))
+            for base_path in batch:
+                if base_path in finished:
+                    self.ingested.setdefault(os.path.dirname(base_path), set()).add(base_path)
+                    del self.pending[base_path]
+                    self.retry_at.pop(base_path, None)
+                else:
+                    self.retry_at[base_path] = time.time() + self.retry_interval
+            self.changed = True
+        self.save()
+        return len(ready)
+
+    def watch(self, interval=1.0, workers=1, timeout=30.0, memory_limit_mb=2048):
+        """ Polls until interrupted """
+        stats = new_stats()
+        pool = parser_pool(self.root, workers, timeout, memory_limit_mb)
+        print(f"Watching {self.root} (checkpoint {self.checkpoint})")
+        try:
+            while True:
+                started = time.perf_counter()
+                count = self.poll(stats, pool)
+                if count:
+                    elapsed = time.perf_counter() - started
+                    print(f"Ingested batch of {count} records in {elapsed:.1f}s "
+                          f"(stored {stats['stored']}, duplicates {stats['duplicates']}, failed {stats['failed']})")
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.close()
+            self.save()
+        return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.watcher", description="Ingest WFDB records as they are copied into a folder.")
+    parser.add_argument("directory", help="folder tree the acquisition carts write to")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between polls (default: 1)")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds a record's files must be unchanged (default: 2)")
+    parser.add_argument("--batch-size", type=int, default=100, help="records ingested per batch (default: 100)")
+    parser.add_argument("--workers", type=int, default=1, help="parser processes (default: 1)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds a record may take to parse (default: 30)")
+    parser.add_argument("--memory-limit", type=int, default=2048, help="MB of memory per parser process (default: 2048)")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <directory>.watch-checkpoint.json)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a folder")
+
+    watcher = DirectoryWatcher(args.directory, checkpoint=args.checkpoint, settle=args.settle, batch_size=args.batch_size)
+    watcher.watch(interval=args.interval, workers=args.workers, timeout=args.timeout, memory_limit_mb=args.memory_limit)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""Fast path reader for WFDB records stored in one format 16 or 212 .dat file.
+
+The .dat bytes are decoded straight from a memory-mapped file or a ZIP member
+with np.frombuffer (format 16 needs no copy at all). Anything the fast path does
+not handle (other formats, several .dat files, skew, byte offsets, multiple
+samples per frame, multi-segment records) returns None so callers can fall back
+to wfdb.rdrecord.
+"""
+import os
+import posixpath
+from collections import namedtuple
+
+import numpy as np
+
+DEFAULT_FS = 250.0
+DEFAULT_ADC_GAIN = 200.0
+SUPPORTED_FORMATS = ('16', '212')
+
+# Same attribute names as wfdb.Record so either can be passed to get_ecg_data
+DigitalRecord = namedtuple('DigitalRecord', [
+    'record_name', 'fs', 'sig_name', 'd_signal', 'adc_gain', 'baseline',
+    'units', 'fmt', 'comments'
+])
+
+
+def dat_file_names(header_text):
+    """ Names of the .dat files referenced by the signal lines of a header, in order """
+    lines = [line.strip() for line in header_text.splitlines() if line.strip() and not line.strip().startswith('#')]
+    names = []
+    for line in lines[1:]:
+        name = line.split()[0]
+        if name != '~' and name not in names:
+            names.append(name)
+    return names
+
+
+def parse_header(header_text):
+    """ Parses the text of a .hea file, returns None if the fast path does not support the record """
+    try:
+        return _parse_header(header_text)
+    except (ValueError, IndexError):
+        return None  # malformed header, wfdb gives the proper error
+
+
+def _parse_header(header_text):
+    comments = []
+    lines = []
+    for line in header_text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#'):
+            comments.append(line.strip(' \t#'))
+        else:
+            lines.append(line)
+
+    if not lines:
+        return None
+
+    record_fields = lines[0].split()
+    record_name = record_fields[0]
+    if '/' in record_name or len(record_fields) < 2:
+        return None  # multi-segment record
+    n_sig = int(record_fields[1])
+
+    fs = DEFAULT_FS
+    if len(record_fields) > 2:
+        fs = float(record_fields[2].split('/')[0].split('(')[0])
+    sig_len = int(record_fields[3]) if len(record_fields) > 3 else None
+
+    signal_lines = lines[1:1 + n_sig]
+    if n_sig == 0 or len(signal_lines) != n_sig:
+        return None
+
+    file_names = set()
+    formats = set()
+    sig_name, adc_gain, baseline, units = [], [], [], []
+    for line in signal_lines:
+        fields = line.split()
+        if len(fields) < 9:
+            return None  # no description, wfdb works out the defaults
+        file_names.add(fields[0])
+        formats.add(fields[1])
+
+        gain_field = fields[2]
+        unit = 'mV'
+        if '/' in gain_field:
+            gain_field, unit = gain_field.split('/', 1)
+        lead_baseline = int(fields[4])  # baseline defaults to adc_zero
+        if '(' in gain_field:
+            gain_field, lead_baseline = gain_field.split('(', 1)
+            lead_baseline = int(lead_baseline.rstrip(')'))
+        gain = float(gain_field)
+
+        sig_name.append(' '.join(fields[8:]))
+        adc_gain.append(gain if gain != 0 else DEFAULT_ADC_GAIN)
+        baseline.append(lead_baseline)
+        units.append(unit)
+
+    # One multiplexed .dat file with a plain format 16 or 212 for every lead
+    if len(file_names) != 1 or len(formats) != 1:
+        return None
+    fmt = formats.pop()
+    file_name = file_names.pop()
+    if fmt not in SUPPORTED_FORMATS or file_name == '~':
+        return None
+
+    return {
+        "record_name": record_name,
+        "n_sig": n_sig,
+        "fs": fs,
+        "sig_len": sig_len,
+        "file_name": file_name,
+        "fmt": fmt,
+        "sig_name": sig_name,
+        "adc_gain": adc_gain,
+        "baseline": baseline,
+        "units": units,
+        "comments": comments,
+    }
+
+
+def _decode_fmt16(buffer, n_samples):
+    # Little-endian int16 frames, this is a view on the buffer
+    return np.frombuffer(buffer, dtype='<i2', count=n_samples)
+
+
+def _decode_fmt212(buffer, n_samples):
+    # Two 12-bit samples packed in every 3 bytes
+    n_pairs = (n_samples + 1) // 2
+    n_bytes = min(len(buffer), n_pairs * 3)
+    raw = np.frombuffer(buffer, dtype=np.uint8, count=n_bytes)
+    if n_bytes < n_pairs * 3:
+        # An odd number of samples may end with a 2 byte group
+        raw = np.concatenate([raw, np.zeros(n_pairs * 3 - n_bytes, dtype=np.uint8)])
+
+    triplets = raw.reshape(-1, 3).astype(np.int16)
+    samples = np.empty((n_pairs, 2), dtype=np.int16)
+    samples[:, 0] = triplets[:, 0] | ((triplets[:, 1] & 0x0F) << 8)
+    samples[:, 1] = triplets[:, 2] | ((triplets[:, 1] & 0xF0) << 4)
+    samples[samples > 2047] -= 4096  # sign extend the 12-bit values
+    return samples.reshape(-1)[:n_samples]
+
+
+def read_record_from_buffers(header_text, dat_buffer):
+    """ Decodes a record from header text and the raw .dat bytes (bytes, memoryview or mmap) """
+    header = parse_header(header_text)
+    if header is None:
+        return None
+
+    n_sig = header["n_sig"]
+    if header["fmt"] == '16':
+        available = len(dat_buffer) // 2 // n_sig
+    else:
+        available = len(dat_buffer) * 2 // 3 // n_sig
+    sig_len = header["sig_len"] if header["sig_len"] is not None else available
+    if sig_len > available:
+        return None  # truncated .dat, let wfdb report it
+
+    if header["fmt"] == '16':
+        samples = _decode_fmt16(dat_buffer, sig_len * n_sig)
+    else:
+        samples = _decode_fmt212(dat_buffer, sig_len * n_sig)
+
+    return DigitalRecord(
+        record_name=header["record_name"],
+        fs=header["fs"],
+        sig_name=header["sig_name"],
+        d_signal=samples.reshape(sig_len, n_sig),
+        adc_gain=header["adc_gain"],
+        baseline=header["baseline"],
+        units=header["units"],
+        fmt=header["fmt"],
+        comments=header["comments"],
+    )
+
+
+def read_record(base_path):
+    """ Reads <base_path>.hea and memory-maps its .dat file, returns None when wfdb is needed instead """
+    with open(base_path + '.hea', 'r', errors='replace') as file:
+        header_text = file.read()
+
+    header = parse_header(header_text)
+    if header is None:
+        return None
+
+    dat_path = os.path.join(os.path.dirname(base_path), header["file_name"])
+    if os.path.getsize(dat_path) == 0:
+        return None
+    dat_buffer = np.memmap(dat_path, dtype=np.uint8, mode='r')
+    return read_record_from_buffers(header_text, dat_buffer)
+
+
+def read_record_from_zip(zip_ref, base_name):
+    """ Reads a record straight from an open ZipFile, base_name is the member path without .hea """
+    header_text = zip_ref.read(base_name + '.hea').decode('utf-8', errors='replace')
+
+    header = parse_header(header_text)
+    if header is None:
+        return None
+
+    dat_name = posixpath.join(posixpath.dirname(base_name), header["file_name"])
+    return read_record_from_buffers(header_text, zip_ref.read(dat_name))
+
+
+def record_members(zip_ref, base_name):
+    """ ZIP member names of a record, the .hea followed by the .dat files it references """
+    header_name = base_name + '.hea'
+    header_text = zip_ref.read(header_name).decode('utf-8', errors='replace')
+    names = set(zip_ref.namelist())
+    dat_members = [posixpath.join(posixpath.dirname(base_name), name) for name in dat_file_names(header_text)]
+    return [header_name] + [member for member in dat_members if member in names]
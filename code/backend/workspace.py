@@ -0,0 +1,163 @@
+"""Isolated per-upload workspaces.
+
+Every upload gets its own uniquely named folder (on tmpfs when UPLOAD_TMPFS is
+set) that is removed with everything in it when the upload finishes, whether
+it succeeded or not. The uploaded ZIP and its extraction are checked against a
+per-upload and a total disk quota, and a background janitor removes workspaces
+left behind by crashed workers.
+
+Every gunicorn worker runs its own janitor over the same folder, so a live
+workspace is marked on disk: its HEARTBEAT_FILE is touched by the janitor of
+the process using it, and no janitor removes a workspace whose heartbeat is
+newer than max_age.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+
+WORKSPACE_PREFIX = 'upload-'
+HEARTBEAT_FILE = '.workspace-heartbeat'
+SAVE_CHUNK = 1024 * 1024  # bytes of an upload reserved and written at a time
+
+_lock = threading.Lock()
+_reserved = {}  # workspace path -> bytes reserved for its extracted files
+
+
+class WorkspaceQuotaError(Exception):
+    """Raised when extracting an upload would go over a disk quota"""
+
+
+class UploadWorkspace:
+    def __init__(self, root, workspace_quota=None, total_quota=None):
+        self.root = root
+        self.workspace_quota = workspace_quota
+        self.total_quota = total_quota
+        self.folder = None
+        self._saved = {}  # path of a saved upload -> its reserved bytes
+
+    def __enter__(self):
+        os.makedirs(self.root, exist_ok=True)
+        self.folder = tempfile.mkdtemp(prefix=WORKSPACE_PREFIX, dir=self.root)
+        open(os.path.join(self.folder, HEARTBEAT_FILE), 'w').close()
+        with _lock:
+            _reserved[self.folder] = 0
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        with _lock:
+            _reserved.pop(self.folder, None)
+        return False
+
+    def path(self, file_name):
+        """ Path for an uploaded file inside the workspace, directory parts of the name are dropped """
+        return os.path.join(self.folder, os.path.basename(file_name))
+
+    def save_upload(self, file):
+        """ Writes an uploaded file (werkzeug FileStorage) into the workspace, each chunk counted against the quotas first """
+        file_path = self.path(file.filename)
+        self._saved[file_path] = 0
+        with open(file_path, 'wb') as output:
+            while True:
+                chunk = file.stream.read(SAVE_CHUNK)
+                if not chunk:
+                    break
+                self.reserve(len(chunk))
+                self._saved[file_path] += len(chunk)
+                output.write(chunk)
+        return file_path
+
+    def remove(self, file_path):
+        """ Deletes a saved upload and gives its bytes back to the quotas """
+        os.remove(file_path)
+        size = self._saved.pop(file_path, 0)
+        with _lock:
+            _reserved[self.folder] -= size
+
+    def extract_zip(self, zip_path, folder_name):
+        """ Extracts a ZIP into a sub-folder of the workspace after checking the quotas """
+        extracted_folder = self.path(folder_name)
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            size = sum(info.file_size for info in zip_ref.infolist())
+            self.reserve(size)
+            os.makedirs(extracted_folder, exist_ok=True)
+            zip_ref.extractall(extracted_folder)
+        return extracted_folder
+
+    def reserve(self, size):
+        with _lock:
+            used = _reserved.get(self.folder, 0) + size
+            if self.workspace_quota and used > self.workspace_quota:
+                raise WorkspaceQuotaError(f"Upload is too large to extract ({used} bytes, limit {self.workspace_quota}).")
+            total = sum(_reserved.values()) + size
+            if self.total_quota and total > self.total_quota:
+                raise WorkspaceQuotaError("Not enough upload space right now, please try again later.")
+            _reserved[self.folder] = used
+
+
+def reserved_bytes():
+    """ Bytes currently reserved by all active workspaces in this process """
+    with _lock:
+        return sum(_reserved.values())
+
+
+def touch_active():
+    """ Refreshes the heartbeat of every workspace this process is using """
+    with _lock:
+        active = list(_reserved)
+    for folder in active:
+        try:
+            os.utime(os.path.join(folder, HEARTBEAT_FILE))
+        except OSError:
+            pass  # removed by its request in the meantime
+
+
+def last_heartbeat(folder):
+    """ mtime of the workspace or of its heartbeat file, whichever is newer """
+    latest = os.stat(folder).st_mtime
+    try:
+        return max(latest, os.stat(os.path.join(folder, HEARTBEAT_FILE)).st_mtime)
+    except OSError:
+        return latest
+
+
+def cleanup_orphans(root, max_age):
+    """ Removes workspaces whose heartbeat is older than max_age seconds, in any process """
+    if not os.path.isdir(root):
+        return []
+    touch_active()
+    removed = []
+    cutoff = time.time() - max_age
+    with _lock:
+        active = set(_reserved)
+    for entry in os.scandir(root):
+        if not entry.name.startswith(WORKSPACE_PREFIX) or not entry.is_dir(follow_symlinks=False):
+            continue
+        if entry.path in active or last_heartbeat(entry.path) > cutoff:
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed.append(entry.path)
+    return removed
+
+
+def start_janitor(get_root, max_age, interval):
+    """ Runs cleanup_orphans every interval seconds in a daemon thread, get_root returns the folder to clean """
+    # Heartbeats have to be refreshed well within max_age or other workers see live workspaces as orphans
+    interval = min(interval, max_age / 3)
+
+    def run():
+        while True:
+            try:
+                removed = cleanup_orphans(get_root(), max_age)
+                if removed:
+                    print(f"Removed {len(removed)} orphaned upload workspaces")
+            except Exception as e:
+                print(f"Upload workspace cleanup failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="upload-janitor", daemon=True)
+    thread.start()
+    return thread
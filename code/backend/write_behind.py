@@ -0,0 +1,137 @@
+"""Write-behind buffer that turns many small inserts into a few multi-row ones.
+
+Items are queued and a background thread hands them to flush(items) once
+max_rows are waiting or max_delay_ms after the first one arrived, whichever
+comes first. submit() either returns as soon as the item is queued
+(ack="buffer", fastest, up to one flush interval can be lost if the process
+dies) or waits until the batch holding it was written (ack="db", concurrent
+posts still share one insert).
+
+An ack="db" submit that times out while its item is still queued takes the
+item back out and raises TimeoutError, nothing is written and the client can
+retry. Once the item's batch is being written it can no longer be taken back,
+submit then returns the unfinished PendingWrite (done() is False) and the
+caller answers that the write is pending instead of failing it.
+"""
+import atexit
+import threading
+import time
+
+
+class PendingWrite:
+    def __init__(self):
+        self._done = threading.Event()
+        self.error = None
+
+    def finish(self, error=None):
+        self.error = error
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """ True once the batch holding the item was written, raises its error if the write failed """
+        if not self._done.wait(timeout):
+            return False
+        if self.error is not None:
+            raise self.error
+        return True
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush, max_rows=100, max_delay_ms=50, ack="db"):
+        if ack not in ("db", "buffer"):
+            raise ValueError(f"Unknown ack mode: {ack}")
+        self.flush = flush
+        self.max_rows = max(1, max_rows)
+        self.max_delay = max_delay_ms / 1000
+        self.ack = ack
+
+        self._cond = threading.Condition()
+        self._items = []
+        self._first_at = None
+        self._closed = False
+        self._counters = {"submitted": 0, "flushed_rows": 0, "flushes": 0, "failed_rows": 0, "cancelled": 0}
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, item, timeout=10.0):
+        """ Queues one item, with ack="db" waits until it was written (raises the write error if not)
+
+        Raises TimeoutError if the item was still queued after timeout, it is then dropped.
+        """
+        pending = PendingWrite()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Write-behind buffer is closed.")
+            self._items.append((item, pending))
+            self._counters["submitted"] += 1
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+            self._cond.notify()
+        if self.ack == "db" and not pending.wait(timeout):
+            with self._cond:
+                queued = next((n for n, (_, other) in enumerate(self._items) if other is pending), None)
+                if queued is not None:
+                    del self._items[queued]
+                    self._counters["cancelled"] += 1
+                    if not self._items:
+                        self._first_at = None
+                    raise TimeoutError(f"Not written after {timeout:g}s, the item was dropped")
+            # Its batch is being written, the caller reports the write as pending
+        return pending
+
+    def _take_batch(self):
+        # Called with the condition held, waits until a batch is due
+        while True:
+            if self._items and (len(self._items) >= self.max_rows or self._closed):
+                break
+            if self._items:
+                remaining = self._first_at + self.max_delay - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            elif self._closed:
+                return []
+            else:
+                self._cond.wait()
+        batch, self._items = self._items[:self.max_rows], self._items[self.max_rows:]
+        self._first_at = time.monotonic() if self._items else None
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            error = None
+            try:
+                self.flush([item for item, _ in batch])
+            except Exception as e:
+                error = e
+                print("\033[91mWrite-behind flush of {} rows failed: {}\033[0m".format(len(batch), str(e)))  # Red text
+            with self._cond:
+                self._counters["flushes"] += 1
+                self._counters["failed_rows" if error else "flushed_rows"] += len(batch)
+            for _, pending in batch:
+                pending.finish(error)
+
+    def metrics(self):
+        with self._cond:
+            flushes = self._counters["flushes"]
+            return {
+                "pending": len(self._items),
+                "ack": self.ack,
+                "rows_per_flush": round((self._counters["flushed_rows"] + self._counters["failed_rows"]) / flushes, 1) if flushes else 0.0,
+                **self._counters,
+            }
+
+    def close(self, timeout=5.0):
+        """ Writes whatever is still queued and stops the flush thread """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
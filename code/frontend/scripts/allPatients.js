@@ -1,9 +1,80 @@
-document.addEventListener("DOMContentLoaded", function() {
+// Patients are loaded a page at a time, nextCursor is null once the last page is shown
+const PAGE_SIZE = 100;
+let nextCursor = null;
+
+function parseList(value) {
+    return Array.isArray(value) ? value : value ? JSON.parse(value) : [];
+}
+
+function buildPatientsUrl(cursor) {
+    const params = new URLSearchParams({ limit: PAGE_SIZE });
+    const filters = {
+        gender: 'filter-gender',
+        age_min: 'filter-age-min',
+        age_max: 'filter-age-max',
+        rhythm: 'filter-rhythm',
+        diagnosis: 'filter-diagnosis',
+        sort: 'filter-sort',
+        order: 'filter-order'
+    };
+    Object.entries(filters).forEach(([param, id]) => {
+        const input = document.getElementById(id);
+        if (input && input.value) {
+            params.set(param, input.value);
+        }
+    });
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    return `/api/patients_info?${params.toString()}`;
+}
+
+function renderPatientRow(patient) {
+    const row = document.createElement('tr');
+
+    const patientId = patient.patient_id;
+    const age = patient.age;
+    const gender = patient.gender;
+    const heart_rhythm = patient.heart_rhythm;
+    const hypertrophies = parseList(patient.hypertrophies);
+    const ischemia = parseList(patient.ischemia);
+    const conductionSystemDisease = parseList(patient.conduction_system_disease);
+    const cardiacPacing = parseList(patient.cardiac_pacing);
+    const repolarization_abnormalities = patient.repolarization_abnormalities || 'None';
+
+    // Format the parsed data for display
+    const hypertrophiesDisplay = hypertrophies.length > 0 ? hypertrophies.join('<br><br>') : 'None';
+    const ischemiaDisplay = ischemia.length > 0 ? ischemia.join('<br><br>') : 'None';
+    const conductionDisplay =
+        conductionSystemDisease.length > 0 ? conductionSystemDisease.join('<br><br>') : 'None';
+    const pacingDisplay = cardiacPacing.length > 0 ? cardiacPacing.join('<br><br>') : 'None';
+    row.innerHTML = `
+        <td class="patient-id">${patientId}</td>
+        <td>${age}</td>
+        <td>${gender}</td>
+        <td>${heart_rhythm}</td>
+        <td>${pacingDisplay}</td>
+        <td>${conductionDisplay}</td>
+        <td>${hypertrophiesDisplay}</td>
+        <td>${ischemiaDisplay}</td>
+        <td>${repolarization_abnormalities}</td>
+        <td class="actions">
+            <div class="buttons-container">
+                <button class="button view-button" onclick="viewECG(${patient.patient_id})">View ECG</button>
+                <button class="button delete-button" onClick="deletePatient(${patient.patient_id})">Delete</button>
+            </div>
+            
+        </td>
+    `;
+    return row;
+}
+
+function loadPatients(reset) {
     // Check if we need to bypass cache (when coming from upload page)
     const bypassCache = window.location.search.includes('refresh=');
-    
+
     // Fetch patient data with appropriate caching options
-    fetch('/api/patients_info', {
+    return fetch(buildPatientsUrl(reset ? null : nextCursor), {
         // Add cache control headers if we're refreshing the page
         headers: bypassCache ? {
             'Cache-Control': 'no-cache, no-store, must-revalidate',
@@ -20,66 +91,21 @@ document.addEventListener("DOMContentLoaded", function() {
         .then(data => {
             if (data.success && Array.isArray(data.data)) {
                 const patients = data.data;
-                console.log(patients);
                 const tableBody = document.getElementById('patients-table-body');
-                // Clear existing rows to avoid duplicates when refreshing
-                tableBody.innerHTML = '';
-                
-                patients.forEach(patient => {
-                    const row = document.createElement('tr');
-                    
-                    const patientId = patient.patient_id;
-                    const age = patient.age;
-                    const gender = patient.gender;
-                    const heart_rhythm = patient.heart_rhythm;
-                    const hypertrophies = Array.isArray(patient.hypertrophies)
-                        ? patient.hypertrophies
-                        : patient.hypertrophies
-                        ? JSON.parse(patient.hypertrophies)
-                        : [];
-                    const ischemia = Array.isArray(patient.ischemia)
-                        ? patient.ischemia
-                        : patient.ischemia
-                        ? JSON.parse(patient.ischemia)
-                        : [];
-                    const conductionSystemDisease = Array.isArray(patient.conduction_system_disease)
-                        ? patient.conduction_system_disease
-                        : patient.conduction_system_disease
-                        ? JSON.parse(patient.conduction_system_disease)
-                        : [];
-                    const cardiacPacing = Array.isArray(patient.cardiac_pacing)
-                        ? patient.cardiac_pacing
-                        : patient.cardiac_pacing
-                        ? JSON.parse(patient.cardiac_pacing)
-                        : [];
-                    const repolarization_abnormalities = patient.repolarization_abnormalities || 'None';
+                // Clear existing rows when starting over (first load or new filters)
+                if (reset) {
+                    tableBody.innerHTML = '';
+                }
 
-                    // Format the parsed data for display
-                    const hypertrophiesDisplay = hypertrophies.length > 0 ? hypertrophies.join('<br><br>') : 'None';
-                    const ischemiaDisplay = ischemia.length > 0 ? ischemia.join('<br><br>') : 'None';
-                    const conductionDisplay =
-                        conductionSystemDisease.length > 0 ? conductionSystemDisease.join('<br><br>') : 'None';
-                    const pacingDisplay = cardiacPacing.length > 0 ? cardiacPacing.join('<br><br>') : 'None';
-                    row.innerHTML = `
-                        <td class="patient-id">${patientId}</td>
-                        <td>${age}</td>
-                        <td>${gender}</td>
-                        <td>${heart_rhythm}</td>
-                        <td>${pacingDisplay}</td>
-                        <td>${conductionDisplay}</td>
-                        <td>${hypertrophiesDisplay}</td>
-                        <td>${ischemiaDisplay}</td>
-                        <td>${repolarization_abnormalities}</td>
-                        <td class="actions">
-                            <div class="buttons-container">
-                                <button class="button view-button" onclick="viewECG(${patient.patient_id})">View ECG</button>
-                                <button class="button delete-button" onClick="deletePatient(${patient.patient_id})">Delete</button>
-                            </div>
-                            
-                        </td>
-                    `;
-                    tableBody.appendChild(row);
+                patients.forEach(patient => {
+                    tableBody.appendChild(renderPatientRow(patient));
                 });
+
+                nextCursor = data.next_cursor || null;
+                const loadMore = document.getElementById('load-more');
+                if (loadMore) {
+                    loadMore.style.display = nextCursor ? '' : 'none';
+                }
             } else {
                 throw new Error('Invalid data format');
             }
@@ -88,6 +114,22 @@ document.addEventListener("DOMContentLoaded", function() {
             console.error('Error fetching patient data:', error);
             alert('Failed to load patient data. Please try again later.');
         });
+}
+
+document.addEventListener("DOMContentLoaded", function() {
+    const filters = document.getElementById('patients-filters');
+    if (filters) {
+        filters.addEventListener('submit', event => {
+            event.preventDefault();
+            loadPatients(true);
+        });
+    }
+    const loadMore = document.getElementById('load-more');
+    if (loadMore) {
+        loadMore.addEventListener('click', () => loadPatients(false));
+    }
+
+    loadPatients(true);
 });
 
 function viewECG(patientId) {
@@ -141,6 +183,8 @@ function deletePatient(patientId) {
 if (typeof module !== 'undefined') {
     module.exports = {
         viewECG,
-        deletePatient
+        deletePatient,
+        buildPatientsUrl,
+        loadPatients
     };
 }
\ No newline at end of file
@@ -26,7 +26,7 @@ window.addEventListener("DOMContentLoaded", () => {
             window.patientInfo = data.patient_info; // Save globally
             updatePatientInfo(data.patient_info);
             plotECGHighcharts({
-                ...data.ecg_data,
+                ...toPhysicalSignals(data.ecg_data),
                 patient_info: data.patient_info
             });
             
@@ -34,6 +34,21 @@ window.addEventListener("DOMContentLoaded", () => {
         });
     }
   });
+
+// Signals arrive as int16 ADC units with per-lead gain/baseline, convert them
+// to physical units (mV) here since this is where they are plotted
+function toPhysicalSignals(data) {
+    if (!data || !data.adc || !data.signals) {
+        return data; // older records are already stored in physical units
+    }
+    const signals = {};
+    Object.keys(data.signals).forEach(lead => {
+        const gain = data.adc.gain[lead];
+        const baseline = data.adc.baseline[lead];
+        signals[lead] = data.signals[lead].map(value => (value - baseline) / gain);
+    });
+    return { ...data, signals: signals };
+}
   
 function plotECGHighcharts(data) {
     let standardLeadOrder = ["i", "ii", "iii", "avr", "avl", "avf", "v1", "v2", "v3", "v4", "v5", "v6"];
@@ -1233,6 +1248,7 @@ if (chooseAnotherBtn) {
 if (typeof module !== 'undefined') {
     module.exports = {
         updatePatientInfo,
+        toPhysicalSignals,
         findClosestTimeIndex,
         showInterpretationModal,
         processECGSelection,
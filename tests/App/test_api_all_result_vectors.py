@@ -25,3 +25,23 @@ def test_get_all_result_vectors_exception(mock_fetch):
     assert response.status_code == 500
     assert "error" in response.json
     assert response.json["error"] == "Database failure" # database error message in response
+
+
+@patch("backend.app.fetch_result_vectors_page")
+def test_get_all_result_vectors_page(mock_page):
+    mock_page.return_value = {"success": True, "data": [], "next_cursor": None}
+
+    with app.test_client() as client:
+        response = client.get("/api/all_result_vectors?limit=20&since=2024-01-01&decode=1")
+
+    assert response.status_code == 200
+    mock_page.assert_called_once_with(patient_id=None, since="2024-01-01 00:00:00", until=None,
+                                      limit=20, cursor=None, decode=True)
+
+
+def test_result_vector_stats_rejects_bad_bin():
+    with app.test_client() as client:
+        response = client.get("/api/result_vector_stats?bin=0")
+
+    assert response.status_code == 400
+    assert response.json["success"] is False
@@ -218,3 +218,16 @@ def test_get_ecg_data_with_patient_info(tmp_path):
     assert "ischemia" in result["patient_info"]
     assert "conduction_system_disease" in result["patient_info"]
     assert "cardiac_pacing" in result["patient_info"]
+
+
+def test_get_ecg_data_keeps_adc_units(sample_ecg_data):
+    """Signals stay integer ADC units, gain/baseline convert back to physical values"""
+    result = get_ecg_data(sample_ecg_data)
+    record = wfdb.rdrecord(sample_ecg_data)
+
+    assert "adc" in result
+    for index, lead in enumerate(["i", "ii", "iii"]):
+        digital = np.array(result["signals"][lead])
+        assert digital.dtype.kind == "i"
+        physical = (digital - result["adc"]["baseline"][lead]) / result["adc"]["gain"][lead]
+        np.testing.assert_allclose(physical, record.p_signal[:, index], atol=1 / result["adc"]["gain"][lead])
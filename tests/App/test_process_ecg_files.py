@@ -11,6 +11,11 @@ from backend.app import app
 import tempfile
 import shutil
 
+@pytest.fixture(autouse=True)
+def inline_parsing(monkeypatch):
+    # get_ecg_data is patched in this process, the sandbox would parse with the real one
+    monkeypatch.setitem(app.config, 'INGEST_SANDBOX', False)
+
 @pytest.fixture
 def sample_extracted_folder(tmp_path):
     test_folder = tmp_path / "ecg_test_folder_no_hea"
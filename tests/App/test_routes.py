@@ -1,7 +1,7 @@
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
-from backend.app import app
+from backend.app import app, ecg_cache
 import pytest
 from unittest.mock import patch, MagicMock
 import io
@@ -10,6 +10,7 @@ import zipfile
 
 @pytest.fixture
 def client():
+    ecg_cache.clear()
     with app.test_client() as client:
         yield client
 
@@ -120,6 +121,73 @@ def test_get_patient_info_route(client, mocker):
     assert response.json["name"] == "Test Patient"
     
 
+def test_ecg_data_export_streams_ndjson(client, mocker):
+    stream = mocker.patch("backend.app.stream_ecg_data", return_value=(row for row in [{"id": 1, "patient_id": 2}, {"id": 2, "patient_id": 3}]))
+    response = client.get("/api/ecg_data?patient_ids=2,3&since=2024-01-01&until=2024-02-01")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.get_data(as_text=True) == '{"id": 1, "patient_id": 2}\n{"id": 2, "patient_id": 3}\n'
+    stream.assert_called_once_with([2, 3], "2024-01-01 00:00:00", "2024-02-01 00:00:00")
+
+
+def test_ecg_data_export_rejects_bad_dates(client):
+    response = client.get("/api/ecg_data?since=yesterday")
+    assert response.status_code == 400
+    assert response.json["success"] is False
+
+
+def test_ecg_data_route_is_cached_until_delete(client, mocker):
+    fetch = mocker.patch("backend.app.fetch_ecg_data_by_patient_id", return_value={"signals": {"i": [1, 2]}})
+    mocker.patch("backend.app.delete_patient_by_id", return_value={"success": True})
+    assert client.get("/api/ecg_data/5").json == {"signals": {"i": [1, 2]}}
+    assert client.get("/api/ecg_data/5").json == {"signals": {"i": [1, 2]}}
+    assert fetch.call_count == 1
+
+    invalidations = client.get("/api/cache_metrics").json["invalidations"]
+    client.delete("/api/delete_patient/5")
+    fetch.return_value = None
+    assert client.get("/api/ecg_data/5").status_code == 404
+    assert client.get("/api/cache_metrics").json["invalidations"] == invalidations + 1
+
+
+def test_ecg_signal_window_route(client, mocker):
+    import numpy as np
+    window = mocker.patch("backend.app.fetch_ecg_signal_window", return_value={
+        "signals": {"i": np.array([1, 2], dtype=np.int16), "ii": np.array([3, 4], dtype=np.int16)}, "fs": 500.0,
+        "adc": {"gain": {"i": 200.0, "ii": 400.0}, "baseline": {"i": 0, "ii": -4}}})
+    response = client.get("/api/ecg_signal/4?start=10&stop=12&leads=i,ii")
+    assert response.status_code == 200
+    assert response.headers["X-ECG-Leads"] == "i,ii"
+    assert response.headers["X-ECG-Samples"] == "2"
+    assert np.frombuffer(response.data, dtype=response.headers["X-ECG-Dtype"]).tolist() == [1, 2, 3, 4]
+    window.assert_called_once_with(4, 10, 12, ["i", "ii"])
+    assert response.headers["X-ECG-Gain"] == "200.0,400.0"
+    assert response.headers["X-ECG-Baseline"] == "0,-4"
+
+
+def test_post_result_vectors_batch_route(client, mocker):
+    insert = mocker.patch("backend.services.result_vector_service.insert_result_vectors_into_db")
+    response = client.post("/api/post_result_vectors", json={"vectors": [
+        {"anonymous_id": "1", "leadDataArray": []}, {"anonymous_id": "2", "leadDataArray": []}]})
+    assert response.status_code == 200
+    assert response.json["stored"] == 2
+    insert.assert_called_once()
+
+    response = client.post("/api/post_result_vectors", json=[{"leadDataArray": []}])
+    assert response.status_code == 400
+
+
+def test_cohort_route_passes_filters(client, mocker):
+    cohort = mocker.patch("backend.app.fetch_cohort", return_value={"success": True, "count": 0, "data": [], "next_cursor": None})
+    response = client.get("/api/cohort?flags=lvh&age_min=50&age_max=70&axis_max=-30&sex=female")
+    assert response.status_code == 200
+    kwargs = cohort.call_args.kwargs
+    assert kwargs["flags"] == ["lvh"] and kwargs["age_min"] == 50 and kwargs["axis_max"] == -30.0 and kwargs["sex"] == "F"
+
+    cohort.side_effect = ValueError("Unknown flags: x")
+    assert client.get("/api/cohort?flags=x").status_code == 400
+
+
 def test_get_patient_ecg_data_route(client, mocker):
     mocker.patch("backend.app.fetch_ecg_data_by_patient_id", return_value={"signals": {}})
     response = client.get("/api/ecg_data/1")
@@ -154,3 +222,96 @@ def test_api_load_ecg_not_found(mock_fetch_ecg, client):
     assert response.status_code == 404
     json_data = response.get_json()
     assert "error" in json_data
+
+
+def test_get_patients_page_route(client, mocker):
+    mock_page = mocker.patch("backend.app.fetch_patients_page", return_value={"success": True, "data": [], "next_cursor": None})
+    response = client.get("/api/patients_info?limit=20&sort=age&order=desc&gender=F&age_min=40&fields=age,gender&cursor=abc")
+
+    assert response.status_code == 200
+    mock_page.assert_called_once_with(limit=20, cursor="abc", sort="age", descending=True, gender="F",
+                                      age_min=40, age_max=None, rhythm=None, diagnosis=None, fields=["age", "gender"])
+
+
+def test_get_patients_page_route_bad_request(client, mocker):
+    mocker.patch("backend.app.fetch_patients_page", side_effect=ValueError("Cannot sort on ischemia"))
+    response = client.get("/api/patients_info?sort=ischemia")
+
+    assert response.status_code == 400
+    assert response.json["error"] == "Cannot sort on ischemia"
+
+
+def test_patients_by_diagnosis_route(client, mocker):
+    lookup = mocker.patch("backend.app.fetch_patients_by_diagnoses", return_value={"success": True, "count": 0, "data": [], "next_cursor": None})
+    response = client.get("/api/patients_by_diagnosis?codes=hypertrophy:left_ventricular_hypertrophy,conduction:i_degree_av_block&match=any&limit=5")
+    assert response.status_code == 200
+    assert lookup.call_args.args[0] == ["hypertrophy:left_ventricular_hypertrophy", "conduction:i_degree_av_block"]
+    assert lookup.call_args.kwargs["match"] == "any" and lookup.call_args.kwargs["limit"] == 5
+
+    lookup.side_effect = ValueError("Unknown diagnosis codes: x")
+    assert client.get("/api/patients_by_diagnosis?codes=x").status_code == 400
+
+
+def test_similar_route(client, mocker):
+    similar = mocker.patch("backend.app.similar_patients", return_value={"success": True, "patient_id": 1, "data": []})
+    assert client.get("/api/similar/1?k=5").status_code == 200
+    assert similar.call_args.args == (1, 5, None)
+    client.get("/api/similar/1?approximate=0")
+    assert similar.call_args.args == (1, 10, False)
+    assert client.get("/api/similar/1?k=0").status_code == 400
+    assert client.get("/api/similar/1?k=x").status_code == 400
+
+    similar.return_value = {"success": False, "error": "No embedding for this patient"}
+    assert client.get("/api/similar/1").status_code == 404
+
+
+def test_r_peaks_routes(client, mocker):
+    import numpy as np
+    beats = {"fs": 500.0, "beat_count": 3, "detector_version": 1, "r_peaks": np.array([100, 600, 1100], dtype=np.int32)}
+    fetch = mocker.patch("backend.app.fetch_record_beats", return_value={1: beats})
+    response = client.get("/api/r_peaks/1")
+    assert response.status_code == 200
+    assert response.json["r_peaks"] == [100, 600, 1100] and response.json["heart_rate"] == 60.0
+
+    response = client.get("/api/r_peaks?patient_ids=1,2")
+    assert fetch.call_args.args[0] == [1, 2]
+    assert list(response.json["data"]) == ["1"]
+    assert client.get("/api/r_peaks?patient_ids=x").status_code == 400
+    assert client.get("/api/r_peaks").status_code == 400
+
+    fetch.return_value = {}
+    assert client.get("/api/r_peaks/2").status_code == 404
+
+
+def test_beat_baselines_route(client, mocker):
+    import numpy as np
+    beats = {"fs": 500.0, "beat_count": 2, "detector_version": 1, "r_peaks": np.array([300, 800], dtype=np.int32),
+             "baselines": {"segments": [[100, 120], [600, 620]], "leads": {"i": [0.1, 0.2]}}}
+    mocker.patch("backend.app.fetch_record_beats", return_value={1: beats})
+    mocker.patch("backend.app.fetch_ecg_data_by_patient_id", return_value={"signals": {"i": [0.0] * 1000}, "fs": 500.0})
+    response = client.get("/api/beat_baselines/1")
+    assert response.status_code == 200
+    assert response.json["segments"] == [[100, 120], [600, 620]]
+    assert response.json["measurements"]["i"]["avg_baseline"] == [pytest.approx(0.138), pytest.approx(0.2)]
+
+    response = client.get("/api/beat_baselines/1?measure=0")
+    assert "measurements" not in response.json
+
+    beats["baselines"] = None
+    assert client.get("/api/beat_baselines/1").status_code == 404
+
+
+def test_median_beat_route(client, mocker):
+    import numpy as np
+    median = {"fs": 500.0, "leads": ["i", "ii"], "offset": 2, "beat_count": 9,
+              "beat": np.array([[0.0, 0.1, 1.0, -0.2, 0.0], [0.0, 0.0, 0.5, -0.1, 0.0]], dtype=np.float32)}
+    fetch = mocker.patch("backend.app.fetch_median_beats", return_value={1: median})
+    response = client.get("/api/median_beat/1?leads=II")
+    assert response.status_code == 200
+    assert response.json["beat_count"] == 9 and response.json["offset"] == 2
+    assert list(response.json["leads"]) == ["ii"]
+    assert response.json["amplitudes"]["ii"]["lead_vector"] == pytest.approx(0.4)
+    fetch.assert_called_once_with([1])
+
+    fetch.return_value = {}
+    assert client.get("/api/median_beat/1").status_code == 404
@@ -0,0 +1,43 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+from backend.app import app, ingest_admission, upload_user
+import pytest
+import io
+
+
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+
+def test_upload_rejected_when_queue_full(client, monkeypatch):
+    monkeypatch.setattr(ingest_admission, "max_concurrent", 0)
+    monkeypatch.setattr(ingest_admission, "max_queue", 0)
+
+    data = {'files[]': (io.BytesIO(b"zip"), 'data.zip')}
+    response = client.post('/uploads', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert "error" in response.json
+
+
+def test_ingest_metrics_route(client):
+    response = client.get('/api/ingest_metrics')
+    assert response.status_code == 200
+    assert "queue_depth" in response.json
+    assert "wait_ms_p95" in response.json
+
+
+def test_upload_user_header_only_from_trusted_proxies(monkeypatch):
+    monkeypatch.setitem(app.config, "TRUSTED_PROXIES", {"10.0.0.2"})
+    headers = {"X-User-Id": "someone-else"}
+
+    with app.test_request_context(headers=headers, environ_base={"REMOTE_ADDR": "203.0.113.5"}):
+        assert upload_user() == "203.0.113.5"
+    with app.test_request_context(headers=headers, environ_base={"REMOTE_ADDR": "10.0.0.2"}):
+        assert upload_user() == "someone-else"
+    with app.test_request_context(environ_base={"REMOTE_ADDR": "10.0.0.2"}):
+        assert upload_user() == "10.0.0.2"
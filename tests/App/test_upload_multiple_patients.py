@@ -12,8 +12,11 @@ from backend.app import app
 def client():
     app.config['TESTING'] = True
     app.config['UPLOAD_FOLDER'] = 'test_uploads'
+    # get_ecg_data is patched in this process, the sandbox would parse with the real one
+    app.config['INGEST_SANDBOX'] = False
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     yield app.test_client()
+    app.config['INGEST_SANDBOX'] = True
     # Clean up
     for root, dirs, files in os.walk(app.config['UPLOAD_FOLDER'], topdown=False):
         for name in files:
@@ -87,3 +90,32 @@ def test_upload_valid_zip_with_error_in_ecg(mock_store, mock_get, client):
     assert len(json_data["patients"]) == 1
     assert json_data["patients"][0]["file"] == "patient1.hea"
     assert json_data["patients"][0]["error"] == "Invalid ECG format"
+
+
+def test_upload_parses_real_record_in_sandbox(client, monkeypatch):
+    import numpy as np
+    import wfdb
+    from backend import app as app_module
+
+    monkeypatch.setitem(app.config, 'INGEST_SANDBOX', True)
+    record_dir = app.config['UPLOAD_FOLDER']
+    time_values = np.linspace(0, 10, 5000)
+    signals = np.array([np.sin(2 * np.pi * f * time_values) for f in (1, 1.2, 1.5)]).T
+    wfdb.wrsamp(record_name="1", fs=500, units=['mV'] * 3, sig_name=['i', 'ii', 'iii'],
+                p_signal=signals, write_dir=record_dir, fmt=['16'] * 3)
+    mem_zip = io.BytesIO()
+    with zipfile.ZipFile(mem_zip, 'w') as zf:
+        for name in ("1.hea", "1.dat"):
+            zf.write(os.path.join(record_dir, name), name)
+    mem_zip.seek(0)
+
+    calls = app_module.parser_pool().metrics()["calls"]
+    with patch('backend.app.store_patient_and_ecg_data', return_value={"success": True}), \
+         patch('backend.app.lookup_record', return_value=(None, None)), \
+         patch('backend.app.remember_record'):
+        response = client.post('/uploadMultiplePatients', content_type='multipart/form-data',
+                               data={'file': (mem_zip, 'record.zip')})
+
+    assert response.status_code == 200
+    assert response.get_json()["patients"] == [{"file": "1.hea", "result": {"success": True}}]
+    assert app_module.parser_pool().metrics()["calls"] == calls + 1
@@ -86,3 +86,38 @@ def test_upload_files_valid_zip(mock_remove, mock_zipfile, mock_save, mock_proce
         assert response.json[0]["file"] == "valid.zip"
         assert "result" in response.json[0]
         assert response.json[0]["result"] == {"message": "Success"}
+
+
+# test several ZIPs are processed concurrently and come back in upload order
+@patch('backend.app.process_and_store_ecg_data')
+@patch('werkzeug.datastructures.FileStorage.save')
+@patch('zipfile.ZipFile')
+@patch('os.remove')
+def test_upload_files_parallel_keeps_order(mock_remove, mock_zipfile, mock_save, mock_process_and_store, client):
+    import threading
+    import time
+
+    lock = threading.Lock()
+    running = {"now": 0, "peak": 0}
+
+    def process(folder_path):
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        # The first archives take longest so they finish last
+        time.sleep(0.05 * (4 - int(folder_path[-1])))
+        with lock:
+            running["now"] -= 1
+        return jsonify({"folder": os.path.basename(folder_path)})
+
+    mock_process_and_store.side_effect = process
+    mock_zipfile.return_value.__enter__.return_value.infolist.return_value = []
+
+    app.config['UPLOAD_PARALLELISM'] = 2
+    data = {'files[]': [(io.BytesIO(b"PK"), f'ecg{i}.zip') for i in range(4)]}
+    response = client.post('/uploads', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert [item["file"] for item in response.json] == ['ecg0.zip', 'ecg1.zip', 'ecg2.zip', 'ecg3.zip']
+    assert [item["result"]["folder"] for item in response.json] == ['ecg0', 'ecg1', 'ecg2', 'ecg3']
+    assert running["peak"] == 2
@@ -0,0 +1,97 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+from backend.admission import AdmissionController, AdmissionRejected
+import pytest
+import threading
+import time
+
+
+def start_waiter(controller, user, order):
+    """Queues an upload for user in a thread, appends the user to order once admitted"""
+    def run():
+        admitted_at = controller.acquire(user)
+        order.append(user)
+        controller.release(user, admitted_at)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def wait_for_queue(controller, depth):
+    for _ in range(200):
+        if controller.metrics()["queue_depth"] == depth:
+            return
+        time.sleep(0.01)
+    raise AssertionError("queue never reached depth {}".format(depth))
+
+
+def test_concurrency_limit_and_release():
+    controller = AdmissionController(max_concurrent=1, max_queue=2, max_wait=5, per_user_limit=2)
+    controller.acquire("a")
+    assert controller.metrics()["running"] == 1
+
+    order = []
+    thread = start_waiter(controller, "b", order)
+    wait_for_queue(controller, 1)
+    assert order == [] # still waiting for the slot
+
+    controller.release("a")
+    thread.join(2)
+    assert order == ["b"]
+    assert controller.metrics()["running"] == 0
+
+
+def test_queue_full_is_rejected_with_retry_after():
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    controller.acquire("a")
+    with pytest.raises(AdmissionRejected) as error:
+        controller.acquire("b")
+    assert error.value.retry_after >= 1
+    assert controller.metrics()["rejected"] == 1
+
+
+def test_wait_timeout():
+    controller = AdmissionController(max_concurrent=1, max_queue=2, max_wait=0.05)
+    controller.acquire("a")
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("b")
+    metrics = controller.metrics()
+    assert metrics["timed_out"] == 1
+    assert metrics["queue_depth"] == 0
+    assert metrics["running_by_user"] == {"a": 1}  # the timed out user leaves no entry behind
+
+
+def test_per_user_queue_limit():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, per_user_queue=0)
+    controller.acquire("a")
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("a")
+
+
+def test_fairness_between_users():
+    """A user with a bulk upload running does not get the next slot ahead of another user"""
+    controller = AdmissionController(max_concurrent=2, max_queue=10, max_wait=5, per_user_limit=2, per_user_queue=5)
+    bulk_admitted = controller.acquire("bulk")
+    controller.acquire("other")  # both slots taken
+
+    order = []
+    threads = [start_waiter(controller, "bulk", order)]
+    wait_for_queue(controller, 1)
+    threads.append(start_waiter(controller, "clinician", order))
+    wait_for_queue(controller, 2)
+
+    controller.release("other")  # one slot frees up: bulk has one running, clinician none
+    for thread in threads:
+        thread.join(2)
+    assert order[0] == "clinician"
+    controller.release("bulk", bulk_admitted)
+
+
+def test_metrics_wait_times():
+    controller = AdmissionController()
+    admitted_at = controller.acquire("a")
+    controller.release("a", admitted_at)
+    metrics = controller.metrics()
+    assert metrics["admitted"] == 1
+    assert metrics["wait_ms_max"] >= 0
@@ -0,0 +1,135 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+import numpy as np
+import pytest
+from backend import backfill_axis
+from backend.app import app
+from backend.axis import axis_diagnosis, electrical_axis
+from backend.db import db_setup
+from backend.db.beats import fetch_median_beats
+from backend.db.engine import SQLiteEngine
+from backend.db.features import fetch_cohort
+from backend.db.utils import execute_query, fetch_from_db
+from backend.services.feature_service import axis_features
+from backend.services.patient_service import store_patient_and_ecg_data
+from backend.VectorGraphing import Display_Vector
+
+FS = 500
+BEAT_TIME = np.arange(int(0.7 * FS)) / FS
+
+
+def beat():
+    """P wave at 100 ms, R (+1000) at 250 ms, S (-200) at 275 ms, T at 500 ms"""
+    t = BEAT_TIME
+    return (80 * np.exp(-((t - 0.1) / 0.02) ** 2) + 1000 * np.exp(-((t - 0.25) / 0.012) ** 2)
+            - 200 * np.exp(-((t - 0.275) / 0.008) ** 2) + 300 * np.exp(-((t - 0.5) / 0.05) ** 2))
+
+
+def lead(seconds=10, seed=0):
+    """Beats every 840 ms on a 0.25 Hz baseline wander"""
+    samples = np.arange(FS * seconds)
+    signal = np.random.default_rng(seed).normal(0, 5, len(samples)) + 300 * np.sin(2 * np.pi * 0.25 * samples / FS)
+    for start in range(50, len(samples) - len(BEAT_TIME), 420):
+        signal[start:start + len(BEAT_TIME)] += beat()
+    return signal
+
+
+@pytest.mark.parametrize("lead1", [-3.0, -1.2, -0.4, 0.3, 1.0, 2.5])
+@pytest.mark.parametrize("lead3", [-2.8, -1.0, -0.2, 0.5, 1.5, 3.1])
+def test_same_angle_and_diagnosis_as_display_vector(lead1, lead3):
+    with app.app_context():
+        shown = Display_Vector(lead1, lead3).get_json()
+    angle, magnitude = electrical_axis(lead1, lead3)
+    assert angle == pytest.approx(shown["angle"], abs=0.5)
+    assert magnitude == pytest.approx(shown["magnitude"])
+    assert axis_diagnosis(angle) == axis_diagnosis(shown["angle"])
+
+
+def test_diagnosis_boundaries():
+    assert axis_diagnosis(-29) == axis_diagnosis(80) == axis_diagnosis(80.4) == "No Axis Deviation"
+    assert axis_diagnosis(-29.6) == axis_diagnosis(-80) == "Abnormal Left Axis Deviation"
+    assert axis_diagnosis(-81) == axis_diagnosis(-99) == "Superior Axis Deviation"
+    assert axis_diagnosis(-100) == axis_diagnosis(-180) == "Extreme Axis Deviation"
+    assert axis_diagnosis(81) == axis_diagnosis(99.4) == "Inferior Axis Deviation"
+    assert axis_diagnosis(100) == axis_diagnosis(180) == "Abnormal Right Axis Deviation"
+    assert axis_diagnosis(float("nan")) == axis_diagnosis(None) == "ERROR"
+
+
+def test_axis_features_from_a_median_beat():
+    qrs = np.array([0.0, 0.2, 1.0, -0.3, 0.0], dtype=np.float32)
+    median = {"leads": ["i", "ii", "iii"], "beat": np.vstack([qrs, 0.5 * qrs, -2 * qrs]), "offset": 2}
+    features = axis_features(median, FS)
+    assert features["net_qrs_1"] == pytest.approx(0.7) and features["net_qrs_3"] == pytest.approx(-1.4)
+    assert features["auto_axis"] == pytest.approx(round(float(electrical_axis(0.7, -1.4)[0]), 1))
+    assert features["auto_axis_diagnosis"] == "Abnormal Left Axis Deviation"
+
+    # Without lead III or any QRS there is no axis
+    assert axis_features({**median, "leads": ["i", "ii", "v1"]}, FS)["auto_axis"] is None
+    assert axis_features({**median, "beat": np.zeros((3, 5), dtype=np.float32)}, FS)["auto_axis"] is None
+    assert set(axis_features(None, FS).values()) == {None}
+
+
+@pytest.fixture
+def database(tmp_path):
+    previous = db_setup.use_engine(SQLiteEngine(str(tmp_path / "ecg.sqlite3")))
+    yield
+    db_setup.use_engine(previous)
+
+
+def record(patient_id, scale3):
+    signal = lead(seed=patient_id) / 1000  # mV
+    return {
+        "time": (np.arange(len(signal)) / FS).tolist(),
+        "fs": float(FS),
+        "signals": {"i": signal.tolist(), "ii": ((1 + scale3) * signal).tolist(), "iii": (scale3 * signal).tolist()},
+        "maxima_graph_data": {}, "minima_graph_data": {}, "baselines_graph_data": {},
+        "patient_info": {
+            "anonymous_id": patient_id, "age": "50", "sex": "F", "rhythm": "Sinus rhythm",
+            "hypertrophies": [], "conduction_system_disease": [], "ischemia": [], "cardiac_pacing": [],
+            "repolarization_abnormalities": None,
+        },
+    }
+
+
+def stored_axes():
+    result = fetch_from_db("SELECT patient_id, auto_axis, auto_axis_diagnosis, net_qrs_1, net_qrs_3 FROM patient_features "
+                           "ORDER BY patient_id")
+    return {row["patient_id"]: row for row in result["data"]}
+
+
+def test_axis_is_found_at_ingest(database):
+    store_patient_and_ecg_data(record(1, 1.0))
+    store_patient_and_ecg_data(record(2, -2.0))
+    axes = stored_axes()
+    # Net QRS of the beat is about 1000 - 200 units, 0.8 mV
+    assert axes[1]["net_qrs_1"] == pytest.approx(0.8, abs=0.05)
+    assert axes[1]["auto_axis"] == pytest.approx(60, abs=2)
+    assert axes[1]["auto_axis_diagnosis"] == "No Axis Deviation"
+    assert axes[2]["auto_axis"] == pytest.approx(electrical_axis(1, -2)[0], abs=2)
+    assert axes[2]["auto_axis_diagnosis"] == "Abnormal Left Axis Deviation"
+
+    left = fetch_cohort(axis_diagnosis="Abnormal Left Axis Deviation")
+    assert [row["patient_id"] for row in left["data"]] == [2]
+    assert [row["patient_id"] for row in fetch_cohort(auto_axis_min=30)["data"]] == [1]
+
+
+def test_backfill_fills_the_missing_axes(database, mocker):
+    for patient_id, scale3 in ((1, 1.0), (2, -2.0), (3, 0.5)):
+        store_patient_and_ecg_data(record(patient_id, scale3))
+    expected = stored_axes()
+    execute_query("UPDATE patient_features SET auto_axis = NULL, auto_axis_diagnosis = NULL, net_qrs_1 = NULL, net_qrs_3 = NULL "
+                  "WHERE patient_id IN (1, 2)")
+    # Patient 1 still has its median beat, patient 2 is decoded again
+    execute_query("DELETE FROM ecg_median_beats WHERE patient_id = 2")
+    decode = mocker.spy(backfill_axis, "fetch_ecg_data_by_patient_id")
+
+    assert backfill_axis.run(workers=2, batch_size=1) == (2, 2)
+    assert [call.args[0] for call in decode.call_args_list] == [2]
+    assert stored_axes() == expected
+    assert sorted(fetch_median_beats([1, 2, 3])) == [1, 2, 3]
+
+    # Nothing is missing any more, --all walks everyone again
+    assert backfill_axis.run(workers=2) == (0, 0)
+    assert backfill_axis.main(["--all", "--workers", "3"]) == 0
+    assert stored_axes() == expected
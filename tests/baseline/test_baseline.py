@@ -0,0 +1,130 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+import numpy as np
+import pytest
+import wfdb
+from backend.baseline import rolling_stats, beat_baselines, corrected_peaks, baseline_at
+from backend.db import db_setup
+from backend.db.beats import fetch_record_beats, upsert_record_beats
+from backend.db.engine import SQLiteEngine
+from backend.ecg_processing import get_ecg_data
+from backend.qrs import detect_qrs
+from backend.services.beat_service import record_measurements
+from backend.services.patient_service import store_patient_and_ecg_data
+
+FS = 500
+BEAT_TIME = np.arange(int(0.7 * FS)) / FS
+R_OFFSET = int(0.25 * FS)
+
+
+def beat():
+    """P wave at 100 ms, R (+1000) at 250 ms, S (-200) at 275 ms, T at 500 ms"""
+    t = BEAT_TIME
+    return (80 * np.exp(-((t - 0.1) / 0.02) ** 2) + 1000 * np.exp(-((t - 0.25) / 0.012) ** 2)
+            - 200 * np.exp(-((t - 0.275) / 0.008) ** 2) + 300 * np.exp(-((t - 0.5) / 0.05) ** 2))
+
+
+def wandering(seconds=10, seed=0):
+    """Beats every 840 ms on a 0.25 Hz, 600 unit baseline wander, returns the signal, wander and true R peaks"""
+    samples = np.arange(FS * seconds)
+    wander = 300 * np.sin(2 * np.pi * 0.25 * samples / FS) + 100
+    signal = np.random.default_rng(seed).normal(0, 5, len(samples)) + wander
+    starts = list(range(50, len(samples) - len(BEAT_TIME), 420))
+    for start in starts:
+        signal[start:start + len(BEAT_TIME)] += beat()
+    return signal, wander, np.array(starts) + R_OFFSET
+
+
+def test_rolling_stats_match_numpy():
+    leads = np.random.default_rng(0).normal(1000, 50, (3, 400))
+    mean, variance = rolling_stats(leads, 20)
+    assert mean.shape == variance.shape == (3, 381)
+    np.testing.assert_allclose(mean[1, 17], leads[1, 17:37].mean())
+    np.testing.assert_allclose(variance[2, 300], leads[2, 300:320].var())
+
+
+def test_baselines_follow_the_wander():
+    signal, wander, _ = wandering()
+    leads = {"i": signal, "ii": 0.5 * signal}
+    r_peaks = detect_qrs(leads, FS)
+    baselines = beat_baselines(leads, FS, r_peaks)
+    assert len(baselines["segments"]) == len(r_peaks)
+    for segment, r_peak, level in zip(baselines["segments"], r_peaks, baselines["leads"]["i"]):
+        start, end = segment
+        # Before the QRS and off the top of the P wave
+        assert end <= r_peak - int(0.05 * FS)
+        assert not start <= r_peak - int(0.15 * FS) <= end
+        assert level == pytest.approx(wander[(start + end) // 2], abs=10)
+    assert baselines["leads"]["ii"][3] == pytest.approx(0.5 * baselines["leads"]["i"][3], abs=5)
+
+
+def test_first_beat_without_room_has_no_baseline():
+    signal, _, _ = wandering()
+    baselines = beat_baselines({"i": signal}, FS, [10, 1000])
+    assert baselines["segments"][0] is None and baselines["leads"]["i"][0] is None
+    assert baselines["segments"][1] is not None
+
+
+def test_adc_baselines_are_millivolts():
+    signal, _, r_peaks = wandering()
+    adc = {"gain": {"i": 200.0}, "baseline": {"i": 100}}
+    physical = beat_baselines({"i": signal}, FS, r_peaks)["leads"]["i"]
+    converted = beat_baselines({"i": signal}, FS, r_peaks, adc)["leads"]["i"]
+    assert converted == pytest.approx([(value - 100) / 200 for value in physical], abs=1e-4)
+
+
+def test_corrected_peaks_take_out_the_wander():
+    signal, wander, r_peaks = wandering()
+    baselines = beat_baselines({"i": signal}, FS, r_peaks)
+    measured = corrected_peaks({"i": signal}, FS, r_peaks, baselines["segments"], baselines["leads"], leads=["i"])["i"]
+    corrected_max = np.array(measured["corrected_max_peak"])
+    assert np.abs(corrected_max - 1000).max() < 100
+    # Against the whole lead's median the wander would move the peaks by hundreds
+    assert np.ptp(np.array(measured["max_beat"]) - np.median(signal)) > 400
+    vectors = np.array(measured["lead_vector"])
+    np.testing.assert_allclose(vectors, corrected_max - np.abs(measured["corrected_min_peak"]), atol=1e-4)
+    assert np.isnan(baseline_at(np.array([0]), [None], [None])).all()
+
+
+@pytest.fixture
+def database(tmp_path):
+    previous = db_setup.use_engine(SQLiteEngine(str(tmp_path / "ecg.sqlite3")))
+    yield
+    db_setup.use_engine(previous)
+
+
+def test_parsed_record_carries_beats_and_is_stored(tmp_path, database):
+    signal, _, r_peaks = wandering()
+    physical = np.vstack([signal, 0.6 * signal, -0.4 * signal]).T / 1000
+    wfdb.wrsamp(record_name="7", fs=FS, units=["mV"] * 3, sig_name=["i", "ii", "iii"], p_signal=physical,
+                write_dir=str(tmp_path), comments=["<age>: 50", "<sex>: F", "Rhythm: Sinus rhythm."])
+    ecg_data = get_ecg_data(str(tmp_path / "7"))
+
+    assert np.abs(np.array(ecg_data["r_peaks"]) - r_peaks).max() <= 1
+    assert len(ecg_data["beat_baselines"]["segments"]) == len(r_peaks)
+    # The lead baseline is the median of the beat baselines, not of the whole lead
+    beats = [value for value in ecg_data["beat_baselines"]["leads"]["i"] if value is not None]
+    assert ecg_data["baselines_graph_data"]["i"] == pytest.approx(np.median(beats))
+
+    assert store_patient_and_ecg_data(ecg_data)["success"] is True
+    stored = fetch_record_beats([7])[7]
+    assert stored["baselines"]["segments"] == ecg_data["beat_baselines"]["segments"]
+    for lead in ("i", "ii", "iii"):
+        assert stored["baselines"]["leads"][lead] == pytest.approx(ecg_data["beat_baselines"]["leads"][lead], abs=1e-4)
+
+    measured = record_measurements(ecg_data, stored)
+    assert sorted(measured) == ["i", "ii", "iii"]
+    assert np.abs(np.array(measured["i"]["corrected_max_peak"]) - 1.0).max() < 0.1
+
+
+def test_rows_without_baselines(database):
+    store_patient_and_ecg_data({
+        "time": [0.0, 0.002], "fs": 500.0, "signals": {"i": [0, 0], "ii": [0, 0], "iii": [0, 0]},
+        "maxima_graph_data": {}, "minima_graph_data": {}, "baselines_graph_data": {},
+        "patient_info": {"anonymous_id": 3, "age": "1", "sex": "M", "rhythm": None, "hypertrophies": [],
+                         "conduction_system_disease": [], "ischemia": [], "cardiac_pacing": [],
+                         "repolarization_abnormalities": None},
+    })
+    upsert_record_beats(3, [1, 2], 500.0, 1)
+    assert fetch_record_beats([3])[3]["baselines"] is None
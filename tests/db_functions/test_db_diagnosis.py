@@ -0,0 +1,115 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+import pytest
+from backend.db import db_setup
+from backend.db.engine import SQLiteEngine
+from backend.db.diagnosis import normalize_diagnosis, diagnosis_entries, index_patient_diagnoses, fetch_diagnoses
+from backend.db.patient import insert_patient_into_db, fetch_patients_by_diagnoses, delete_patient_by_id
+from backend.db.utils import execute_query, execute_transaction
+from unittest.mock import patch
+
+LVH = "hypertrophy:left_ventricular_hypertrophy"
+LAH = "hypertrophy:left_atrial_hypertrophy"
+AV_BLOCK = "conduction:i_degree_av_block"
+
+
+def patient(patient_id, hypertrophies=(), blocks=(), repolarization=None):
+    return {
+        "anonymous_id": patient_id, "sex": "M", "age": "50", "rhythm": "Sinus rhythm",
+        "hypertrophies": list(hypertrophies), "conduction_system_disease": list(blocks),
+        "ischemia": [], "cardiac_pacing": [], "repolarization_abnormalities": repolarization,
+    }
+
+
+@pytest.fixture
+def patients(tmp_path):
+    previous = db_setup.use_engine(SQLiteEngine(str(tmp_path / "ecg.sqlite3")))
+    for patient_id in range(1, 31):
+        hypertrophies = ["Left ventricular hypertrophy."] if patient_id % 2 == 0 else []
+        if patient_id % 3 == 0:
+            hypertrophies.append("Left atrial hypertrophy")
+        blocks = ["I degree AV block"] if patient_id % 5 == 0 else []
+        insert_patient_into_db(patient(patient_id, hypertrophies, blocks))
+    yield
+    db_setup.use_engine(previous)
+
+
+def all_ids(codes, match="all", limit=100):
+    ids, cursor = [], None
+    while True:
+        page = fetch_patients_by_diagnoses(codes, match=match, limit=limit, cursor=cursor)
+        assert page["success"] is True
+        ids.extend(row["patient_id"] for row in page["data"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids, page["count"]
+
+
+def test_entries_are_normalized_and_deduplicated():
+    info = patient(1, ["Left ventricular hypertrophy.", "left  ventricular hypertrophy"], repolarization="Inferior wall")
+    assert normalize_diagnosis("I degree A-V block.") == "i_degree_a_v_block"
+    assert diagnosis_entries(info) == [
+        (LVH, "hypertrophy", "Left ventricular hypertrophy"),
+        ("repolarization:inferior_wall", "repolarization", "Inferior wall"),
+    ]
+    # patients rows hold the lists as JSON text
+    assert diagnosis_entries({"ischemia": '["Anterior wall"]'}) == [("ischemia:anterior_wall", "ischemia", "Anterior wall")]
+
+
+def test_vocabulary_counts_patients(patients):
+    vocabulary = {row["code"]: row for row in fetch_diagnoses()["data"]}
+    assert vocabulary[LVH]["patients"] == 15
+    assert vocabulary[LAH]["patients"] == 10
+    assert vocabulary[AV_BLOCK]["patients"] == 6
+    assert vocabulary[AV_BLOCK]["label"] == "I degree AV block"
+    assert [row["code"] for row in fetch_diagnoses("conduction")["data"]] == [AV_BLOCK]
+
+
+def test_all_intersects_and_pages(patients):
+    assert all_ids([LVH, LAH], limit=2) == ([6, 12, 18, 24, 30], 5)
+    assert all_ids([LVH, LAH, AV_BLOCK]) == ([30], 1)
+    assert all_ids([AV_BLOCK]) == ([5, 10, 15, 20, 25, 30], 6)
+
+
+def test_any_unions(patients):
+    ids, count = all_ids([LAH, AV_BLOCK], match="any", limit=4)
+    assert ids == [3, 5, 6, 9, 10, 12, 15, 18, 20, 21, 24, 25, 27, 30]
+    assert count == len(ids)
+
+
+def test_rows_are_patients(patients):
+    page = fetch_patients_by_diagnoses([AV_BLOCK], limit=1)
+    assert page["data"][0]["patient_id"] == 5
+    assert page["data"][0]["heart_rhythm"] == "Sinus rhythm"
+
+
+def test_unknown_code_and_match(patients):
+    with pytest.raises(ValueError, match="Unknown diagnosis codes"):
+        fetch_patients_by_diagnoses([LVH, "hypertrophy:nope"])
+    with pytest.raises(ValueError):
+        fetch_patients_by_diagnoses([LVH], match="some")
+    with pytest.raises(ValueError):
+        fetch_patients_by_diagnoses(["", " "])
+
+
+def test_reindex_replaces_and_delete_cascades(patients):
+    index_patient_diagnoses(2, patient(2, blocks=["I degree AV block"]))
+    assert 2 not in all_ids([LVH])[0]
+    assert 2 in all_ids([AV_BLOCK])[0]
+
+    delete_patient_by_id(30)
+    assert 30 not in all_ids([AV_BLOCK])[0]
+    assert execute_query("SELECT COUNT(*) AS n FROM patient_diagnoses WHERE patient_id = 30", fetch_one=True)["n"] == 0
+
+
+def test_failed_reindex_keeps_the_old_rows(patients):
+    def broken_insert(statements):
+        (delete, delete_params), (_, insert_params) = statements
+        execute_transaction([(delete, delete_params), ("INSERT INTO no_such_table VALUES (%s, %s)", insert_params)])
+
+    with patch("backend.db.diagnosis.execute_transaction", side_effect=broken_insert):
+        with pytest.raises(Exception):
+            index_patient_diagnoses(2, patient(2, blocks=["I degree AV block"]))
+    assert 2 in all_ids([LVH])[0]
+    assert 2 not in all_ids([AV_BLOCK])[0]
@@ -46,8 +46,8 @@ def test_insert_ecg_data_into_db(mock_db_functions):
     expected_query = """
         INSERT INTO ecg_data (
             patient_id, time_data, signal_raw_data, maxima_data,
-            minima_data, baseline_data
-        ) VALUES (%s, %s, %s, %s, %s, %s)
+            minima_data, baseline_data, adc_data, signal_key, signal_meta
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
     """
 
     expected_values = (
@@ -56,7 +56,10 @@ def test_insert_ecg_data_into_db(mock_db_functions):
         json.dumps([0.1, 0.2, 0.3]),
         json.dumps([0.3, 0.4]),
         json.dumps([0.1, 0.2]),
-        json.dumps([0.15, 0.25])
+        json.dumps([0.15, 0.25]),
+        None, # no adc gain/baseline, legacy physical signals
+        None, # no signal store, signals stay in the row
+        None
     )
 
     mock_execute_query.assert_called_once_with(expected_query, expected_values)
@@ -124,3 +127,20 @@ def test_fetch_ecg_data_by_patient_id_failure(mock_execute_query):
     mock_execute_query.return_value = None  # Simulate no data found
 
     assert fetch_ecg_data_by_patient_id(123) is None # no result patient ecg data
+
+
+#test fetching ECG data stored as int16 ADC units with per-lead gain/baseline
+@patch('backend.db.ecg.execute_query')
+def test_fetch_ecg_data_by_patient_id_with_adc(mock_execute_query):
+    mock_execute_query.return_value = {
+        "time_data": json.dumps([0, 0.002]),
+        "signal_raw_data": json.dumps({"i": [200, -100]}),
+        "maxima_data": json.dumps({}),
+        "minima_data": json.dumps({}),
+        "baseline_data": json.dumps({}),
+        "adc_data": json.dumps({"gain": {"i": 200.0}, "baseline": {"i": 0}})
+    }
+
+    result = fetch_ecg_data_by_patient_id(123)
+    assert result["signals"] == {"i": [200, -100]}
+    assert result["adc"] == {"gain": {"i": 200.0}, "baseline": {"i": 0}}
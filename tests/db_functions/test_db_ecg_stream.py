@@ -0,0 +1,48 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+
+from backend.db import db_setup
+from backend.db.engine import SQLiteEngine
+from backend.db.ecg import insert_ecg_data_into_db, stream_ecg_data
+from backend.db.patient import insert_patient_into_db
+from backend.db.utils import execute_query
+
+
+@pytest.fixture
+def ecg_rows(tmp_path):
+    engine = SQLiteEngine(str(tmp_path / "ecg.sqlite3"))
+    previous = db_setup.use_engine(engine)
+    for patient_id in range(1, 6):
+        insert_patient_into_db({"anonymous_id": patient_id, "sex": "M", "age": 40, "rhythm": "Sinus rhythm",
+                                "repolarization_abnormalities": None})
+        insert_ecg_data_into_db(patient_id, {
+            "time": [0, 1], "signals": {"i": [patient_id, 0]}, "maxima_graph_data": [],
+            "minima_graph_data": [], "baselines_graph_data": []
+        })
+    execute_query("UPDATE ecg_data SET created_at = '2024-01-0' || patient_id || ' 12:00:00'")
+    yield
+    db_setup.use_engine(previous)
+
+
+def test_streams_every_row_in_order(ecg_rows):
+    rows = list(stream_ecg_data())
+    assert [row["patient_id"] for row in rows] == [1, 2, 3, 4, 5]
+    assert rows[0]["signal_raw_data"] == '{"i": [1, 0]}'
+
+
+def test_filters_by_patient_and_date(ecg_rows):
+    assert [row["patient_id"] for row in stream_ecg_data(patient_ids=[2, 4, 5])] == [2, 4, 5]
+    rows = stream_ecg_data(since="2024-01-02 00:00:00", until="2024-01-04 00:00:00")
+    assert [row["patient_id"] for row in rows] == [2, 3]
+
+
+def test_closing_early_releases_the_connection(ecg_rows):
+    rows = stream_ecg_data()
+    assert next(rows)["patient_id"] == 1
+    rows.close()
+    # The same thread's connection still takes writes
+    execute_query("DELETE FROM patients WHERE patient_id = 1")
+    assert [row["patient_id"] for row in stream_ecg_data()] == [2, 3, 4, 5]
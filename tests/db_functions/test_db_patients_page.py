@@ -0,0 +1,79 @@
+import pytest
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+
+from backend.db import db_setup
+from backend.db.engine import SQLiteEngine
+from backend.db.patient import fetch_patients_page, insert_patient_into_db
+
+
+@pytest.fixture
+def patients(tmp_path):
+    engine = SQLiteEngine(str(tmp_path / "ecg.sqlite3"))
+    previous = db_setup.use_engine(engine)
+    rhythms = ["Sinus rhythm", "Atrial fibrillation"]
+    for patient_id in range(1, 21):
+        insert_patient_into_db({
+            "anonymous_id": patient_id,
+            "sex": "M" if patient_id % 2 else "F",
+            "age": None if patient_id == 20 else 30 + patient_id % 7,
+            "rhythm": rhythms[patient_id % 2],
+            "hypertrophies": ["Left ventricular hypertrophy"] if patient_id % 5 == 0 else [],
+            "repolarization_abnormalities": None,
+        })
+    yield
+    db_setup.use_engine(previous)
+
+
+def all_pages(**kwargs):
+    rows, cursor, pages = [], None, 0
+    while True:
+        page = fetch_patients_page(cursor=cursor, **kwargs)
+        rows.extend(page["data"])
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return rows, pages
+
+
+def test_pages_cover_every_patient_once(patients):
+    rows, pages = all_pages(limit=6)
+    assert [row["patient_id"] for row in rows] == list(range(1, 21))
+    assert pages == 4
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_sort_by_age_with_nulls_matches_full_sort(patients, descending):
+    rows, _ = all_pages(limit=3, sort="age", descending=descending)
+    keys = [(row["age"] is not None, row["age"] or 0, row["patient_id"]) for row in rows]
+    assert keys == sorted(keys, reverse=descending)
+    assert len({row["patient_id"] for row in rows}) == 20
+
+
+def test_filters_and_projection(patients):
+    page = fetch_patients_page(gender="F", age_min=33, age_max=35, fields=["age"])
+    assert page["data"] and all(set(row) == {"patient_id", "age"} for row in page["data"])
+    assert all(33 <= row["age"] <= 35 and row["patient_id"] % 2 == 0 for row in page["data"])
+
+    page = fetch_patients_page(diagnosis="ventricular", fields=["hypertrophies"])
+    assert [row["patient_id"] for row in page["data"]] == [5, 10, 15, 20]
+    assert json.loads(page["data"][0]["hypertrophies"]) == ["Left ventricular hypertrophy"]
+
+    page = fetch_patients_page(rhythm="Atrial fibrillation", fields=["heart_rhythm"])
+    assert len(page["data"]) == 10
+
+
+def test_like_wildcards_are_literal(patients):
+    assert fetch_patients_page(diagnosis="%")["data"] == []
+
+
+def test_invalid_sort_and_fields(patients):
+    with pytest.raises(ValueError):
+        fetch_patients_page(sort="ischemia")
+    with pytest.raises(ValueError):
+        fetch_patients_page(fields=["password"])
+    with pytest.raises(ValueError):
+        fetch_patients_page(cursor="not a cursor")
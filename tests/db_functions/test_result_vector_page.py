@@ -0,0 +1,83 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+
+from backend.app import app
+from backend.VectorGraphing import Display_Vector
+from backend.db import db_setup
+from backend.db.engine import SQLiteEngine
+from backend.db.patient import insert_patient_into_db
+from backend.db.result_vector import (
+    insert_result_vectors_into_db, fetch_result_vectors_page, fetch_result_vector_stats, electrical_axis
+)
+
+
+def selection(patient_id, day, lead1, lead3):
+    return {
+        "anonymous_id": patient_id,
+        "created_at": f"2024-03-{day:02d} 10:00:00",
+        "beat_data": {"Lead 1": {"lead_vector": lead1}, "Lead 2": {"lead_vector": lead1 + lead3}, "Lead 3": {"lead_vector": lead3}},
+    }
+
+
+@pytest.fixture
+def selections(tmp_path):
+    previous = db_setup.use_engine(SQLiteEngine(str(tmp_path / "ecg.sqlite3")))
+    for patient_id in (1, 2):
+        insert_patient_into_db({"anonymous_id": patient_id, "sex": "F", "age": 40, "rhythm": "Sinus rhythm",
+                                "repolarization_abnormalities": None})
+    rows = [selection(1, day, 3, 2) for day in (1, 1, 2, 3)] + [selection(2, day, -3, -2) for day in (2, 4)]
+    insert_result_vectors_into_db(rows)
+    yield
+    db_setup.use_engine(previous)
+
+
+def test_pages_newest_first(selections):
+    seen, cursor = [], None
+    while True:
+        page = fetch_result_vectors_page(limit=4, cursor=cursor)
+        seen.extend(page["data"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == 6
+    assert len({row["id"] for row in seen}) == 6
+    assert [row["created_at"] for row in seen] == sorted((row["created_at"] for row in seen), reverse=True)
+
+
+def test_page_filters_and_decodes(selections):
+    page = fetch_result_vectors_page(patient_id=1, since="2024-03-02 00:00:00", until="2024-03-03 00:00:00", decode=True)
+    assert len(page["data"]) == 1
+    assert page["data"][0]["lead_1_data"] == {"lead_vector": 3}
+    assert page["next_cursor"] is None
+
+
+def test_axis_matches_display_vector():
+    with app.app_context():
+        for lead1, lead3 in [(3, 2), (3, -2), (-3, 2), (-3, -2), (1, 5), (2, -5)]:
+            shown = Display_Vector(lead1, lead3).get_json()
+            angle, magnitude = electrical_axis(lead1, lead3)
+            assert round(float(angle)) == shown["angle"]
+            assert float(magnitude) == pytest.approx(shown["magnitude"])
+
+
+def test_stats_per_patient_and_cohort(selections):
+    stats = fetch_result_vector_stats()
+    assert stats["cohort"]["count"] == 6
+    assert stats["patients"]["1"]["count"] == 4
+    assert stats["patients"]["1"]["mean_lead_vector"] == {"lead_1": 3.0, "lead_2": 5.0, "lead_3": 2.0}
+    assert round(stats["patients"]["1"]["mean_axis"]) == 41
+    assert round(stats["patients"]["2"]["mean_axis"]) == -139
+    histogram = {bucket["from"]: bucket["count"] for bucket in stats["cohort"]["axis_histogram"]}
+    assert histogram[30] == 4 and histogram[-150] == 2
+    assert stats["per_day"] == [{"day": "2024-03-01", "count": 2}, {"day": "2024-03-02", "count": 2},
+                                {"day": "2024-03-03", "count": 1}, {"day": "2024-03-04", "count": 1}]
+
+
+def test_stats_of_an_empty_range(selections):
+    stats = fetch_result_vector_stats(since="2030-01-01 00:00:00")
+    assert stats["cohort"]["count"] == 0
+    assert stats["cohort"]["mean_axis"] is None
+    assert stats["patients"] == {}
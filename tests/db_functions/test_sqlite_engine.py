@@ -0,0 +1,142 @@
+import pytest
+import sys
+import os
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+
+from backend.db import db_setup
+from backend.db.engine import SQLiteEngine, to_sqlite_query
+from backend.db.patient import fetch_all_patients, fetch_patient_by_id, delete_patient_by_id
+from backend.db.ecg import fetch_ecg_data_by_patient_id
+from backend.db.record_hash import fetch_patient_id_by_hash, insert_record_hash
+from backend.db.utils import execute_query, execute_transaction, fetch_from_db
+from backend.services.patient_service import store_patient_and_ecg_data, store_patients_and_ecg_data
+from unittest.mock import patch
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    engine = SQLiteEngine(str(tmp_path / "ecg.sqlite3"))
+    previous = db_setup.use_engine(engine)
+    yield engine
+    db_setup.use_engine(previous)
+
+
+def sample_ecg_data(patient_id):
+    return {
+        "time": [0.0, 0.002, 0.004],
+        "signals": {"i": [1, 2, 3], "ii": [4, 5, 6], "iii": [7, 8, 9]},
+        "adc": {"gain": {"i": 200.0, "ii": 200.0, "iii": 200.0}, "baseline": {"i": 0, "ii": 0, "iii": 0}},
+        "maxima_graph_data": {"i": {"maximas": [2], "maxima_values": [0.015]}},
+        "minima_graph_data": {"i": {"minimas": [0], "minima_values": [0.005]}},
+        "baselines_graph_data": {"i": 0.01},
+        "patient_info": {"anonymous_id": patient_id, "sex": "M", "age": 61, "rhythm": "Sinus rhythm",
+                         "hypertrophies": [], "ischemia": [], "conduction_system_disease": [],
+                         "cardiac_pacing": [], "repolarization_abnormalities": None},
+    }
+
+
+def test_to_sqlite_query():
+    assert to_sqlite_query("SELECT * FROM patients WHERE patient_id = %s AND gender LIKE 'M%%'") == \
+        "SELECT * FROM patients WHERE patient_id = ? AND gender LIKE 'M%'"
+    assert to_sqlite_query("INSERT IGNORE INTO t (a) VALUES (%s)") == "INSERT OR IGNORE INTO t (a) VALUES (?)"
+
+
+def test_store_and_fetch_round_trip(sqlite_engine):
+    result = store_patient_and_ecg_data(sample_ecg_data(17))
+    assert result["success"] is True
+
+    patient = fetch_patient_by_id(17)
+    assert patient["success"] is True
+    assert patient["data"][0]["gender"] == "M"
+    assert patient["data"][0]["age"] == 61
+
+    ecg_data = fetch_ecg_data_by_patient_id(17)
+    assert ecg_data["signals"]["ii"] == [4, 5, 6]
+    assert ecg_data["adc"]["gain"]["i"] == 200.0
+
+    # Second upload of the same patient only finds the existing ECG
+    assert store_patient_and_ecg_data(sample_ecg_data(17)) == {"success": False, "ecg_exists": True}
+
+
+def test_delete_cascades_like_the_mysql_trigger(sqlite_engine):
+    store_patient_and_ecg_data(sample_ecg_data(5))
+    insert_record_hash("a" * 64, 5)
+    assert fetch_patient_id_by_hash("a" * 64) == 5
+
+    assert delete_patient_by_id(5)["success"] is True
+    assert fetch_ecg_data_by_patient_id(5) is None
+    assert fetch_patient_id_by_hash("a" * 64) is None
+    assert fetch_all_patients() == {"success": True, "data": []}
+
+
+def test_wal_mode_and_connection_per_thread(sqlite_engine):
+    assert execute_query("PRAGMA journal_mode", fetch_one=True)["journal_mode"] == "wal"
+    assert sqlite_engine.connect() is sqlite_engine.connect()
+
+    store_patient_and_ecg_data(sample_ecg_data(1))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(fetch_from_db("SELECT patient_id FROM patients")))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [{"success": True, "data": [{"patient_id": 1}]}] * 4
+
+
+def test_failed_query_rolls_back(sqlite_engine):
+    with pytest.raises(Exception):
+        execute_query("INSERT INTO ecg_data (patient_id) VALUES (%s)", (404,))  # no such patient
+    assert fetch_from_db("SELECT * FROM ecg_data") == {"success": True, "data": []}
+
+
+def test_hash_of_a_deleted_patient_is_not_a_duplicate(sqlite_engine):
+    # A hash row left behind without the cascade, as on a MySQL table created without the foreign key
+    execute_query("PRAGMA foreign_keys = OFF")
+    insert_record_hash("b" * 64, 8)
+    execute_query("PRAGMA foreign_keys = ON")
+    assert fetch_patient_id_by_hash("b" * 64) is None
+
+    # Ingesting the record again takes the row over
+    store_patient_and_ecg_data(sample_ecg_data(9))
+    insert_record_hash("b" * 64, 9)
+    assert fetch_patient_id_by_hash("b" * 64) == 9
+
+
+def test_batch_store_in_one_transaction(sqlite_engine):
+    assert store_patient_and_ecg_data(sample_ecg_data(20))["success"] is True
+    execute_query("DELETE FROM ecg_data WHERE patient_id = %s", (20,))
+    assert store_patient_and_ecg_data(sample_ecg_data(21))["success"] is True
+
+    records = [sample_ecg_data(20), sample_ecg_data(21), sample_ecg_data(22), sample_ecg_data(22), {"patient_info": {}}]
+    with patch("backend.services.patient_service.execute_transaction", wraps=execute_transaction) as mock_transaction:
+        results = store_patients_and_ecg_data(records)
+
+    mock_transaction.assert_called_once()
+    assert results[0]["success"] is True  # stored patient without ECG data
+    assert results[1] == {"success": False, "ecg_exists": True}
+    assert results[2]["success"] is True
+    assert results[3] == {"success": False, "ecg_exists": True}  # second record of 22 in the batch
+    assert results[4] == {"success": False, "error": "Missing anonymous_id"}
+    assert fetch_ecg_data_by_patient_id(20)["signals"]["i"] == [1, 2, 3]
+    assert fetch_ecg_data_by_patient_id(22)["signals"]["ii"] == [4, 5, 6]
+    assert len(fetch_from_db("SELECT patient_id FROM ecg_data")["data"]) == 3
+
+
+def test_failed_batch_stores_records_one_by_one(sqlite_engine):
+    with patch("backend.services.patient_service.execute_transaction", side_effect=Exception("disk full")):
+        results = store_patients_and_ecg_data([sample_ecg_data(30), sample_ecg_data(31)])
+
+    assert [result["success"] for result in results] == [True, True]
+    assert fetch_ecg_data_by_patient_id(31)["signals"]["iii"] == [7, 8, 9]
+
+
+def test_batch_transaction_rolls_back(sqlite_engine):
+    with pytest.raises(Exception):
+        execute_transaction([
+            ("INSERT INTO patients (patient_id, gender, age) VALUES (%s, %s, %s)", [(40, "F", 50)]),
+            ("INSERT INTO patients (patient_id, gender, age) VALUES (%s, %s, %s)", [(41, "F", 50), (41, "F", 50)]),
+        ])
+    assert fetch_from_db("SELECT patient_id FROM patients")["data"] == []
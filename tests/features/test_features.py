@@ -0,0 +1,115 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+import numpy as np
+import pytest
+from backend.db import db_setup
+from backend.db.engine import SQLiteEngine
+from backend.db.features import fetch_cohort
+from backend.db.utils import execute_query
+from backend.services.feature_service import patient_features, estimate_heart_rate, rhythm_code
+from backend.services.patient_service import store_patient_and_ecg_data
+from backend.services.result_vector_service import store_result_vectors
+from backend import rebuild_features
+
+
+def pulse_train(bpm, fs=500, seconds=10):
+    """Noise with a 40 ms triangular R wave every beat"""
+    signal = np.random.default_rng(0).normal(0, 5, fs * seconds)
+    wave = 1000 * (1 - np.abs(np.linspace(-1, 1, int(0.04 * fs))))
+    for start in range(0, len(signal) - len(wave), int(fs * 60 / bpm)):
+        signal[start:start + len(wave)] += wave
+    return signal.tolist()
+
+
+def parsed_record(patient_id, age, sex, rhythm, hypertrophies=(), blocks=(), bpm=60):
+    return {
+        "time": (np.arange(5000) / 500).tolist(),
+        "fs": 500.0,
+        "signals": {"i": pulse_train(bpm), "ii": pulse_train(bpm), "iii": pulse_train(bpm)},
+        "maxima_graph_data": {}, "minima_graph_data": {}, "baselines_graph_data": {},
+        "patient_info": {
+            "anonymous_id": patient_id, "age": age, "sex": sex, "rhythm": rhythm,
+            "hypertrophies": list(hypertrophies), "conduction_system_disease": list(blocks),
+            "ischemia": [], "cardiac_pacing": [], "repolarization_abnormalities": None,
+        },
+    }
+
+
+def selection(patient_id, lead1, lead3):
+    def lead(vector):
+        return {"lead_vector": vector, "corrected_max_peak": vector + 1, "corrected_min_peak": -1}
+    return {"anonymous_id": patient_id, "beat_data": {"Lead 1": lead(lead1), "Lead 2": lead(lead1 + lead3), "Lead 3": lead(lead3)}}
+
+
+@pytest.fixture
+def database(tmp_path):
+    previous = db_setup.use_engine(SQLiteEngine(str(tmp_path / "ecg.sqlite3")))
+    yield
+    db_setup.use_engine(previous)
+
+
+@pytest.fixture
+def cohort(database):
+    store_patient_and_ecg_data(parsed_record(1, "55", "M", "Sinus rhythm", ["Left ventricular hypertrophy"], bpm=60))
+    store_patient_and_ecg_data(parsed_record(2, "65", "F", "Atrial fibrillation", ["Left ventricular hypertrophy"], bpm=100))
+    store_patient_and_ecg_data(parsed_record(3, "80", "F", "Sinus rhythm", blocks=["Complete left bundle branch block"]))
+    store_patient_and_ecg_data(parsed_record(4, "60", "M", "Sinus tachycardia"))
+    store_result_vectors([selection(1, 3, -2), selection(2, 3, 2), selection(4, 3, -2)])
+
+
+def test_patient_features_from_header_fields():
+    features = patient_features({"age": "89+", "sex": "female", "rhythm": "Atrial flutter, typical",
+                                 "hypertrophies": ["Left atrial hypertrophy"], "conduction_system_disease": ["I degree AV block"],
+                                 "ischemia": ["inferior wall"], "repolarization_abnormalities": None})
+    assert features["age"] == 89 and features["sex"] == "F" and features["rhythm_code"] == "AFL"
+    assert features["lah"] and features["av_block"] and features["ischemia"]
+    assert not features["lvh"] and not features["lbbb"] and not features["repolarization"]
+    assert rhythm_code(None) is None and rhythm_code("Something new") == "OTHER"
+
+
+def test_estimate_heart_rate():
+    assert estimate_heart_rate({"signals": {"ii": pulse_train(75)}, "fs": 500}) == pytest.approx(75, abs=1)
+    assert estimate_heart_rate({"signals": {"ii": [0.0] * 10}, "fs": 500}) is None
+    assert estimate_heart_rate({"signals": [0.1, 0.2]}) is None
+
+
+def test_features_are_stored_at_ingest_and_on_result_vectors(cohort):
+    row = execute_query("SELECT * FROM patient_features WHERE patient_id = 1", fetch_one=True)
+    assert row["age"] == 55 and row["sex"] == "M" and row["rhythm_code"] == "SR" and row["lvh"] == 1
+    assert row["heart_rate"] == pytest.approx(60, abs=1)
+    assert row["axis"] == pytest.approx(-23.4, abs=0.1)
+    assert row["qrs_amplitude_1"] == pytest.approx(5.0)
+    assert row["selections"] == 1
+
+
+def test_cohort_filters(cohort):
+    # LVH with left axis deviation, age 50-70
+    result = fetch_cohort(flags=["lvh"], age_min=50, age_max=70, axis_max=-10)
+    assert result["count"] == 1
+    assert [row["patient_id"] for row in result["data"]] == [1]
+    assert result["data"][0]["lvh"] is True
+
+    assert [row["patient_id"] for row in fetch_cohort(sex="F")["data"]] == [2, 3]
+    assert [row["patient_id"] for row in fetch_cohort(rhythm="AF")["data"]] == [2]
+    assert [row["patient_id"] for row in fetch_cohort(flags=["lbbb"])["data"]] == [3]
+    assert [row["patient_id"] for row in fetch_cohort(heart_rate_min=90)["data"]] == [2]
+    with pytest.raises(ValueError):
+        fetch_cohort(flags=["not_a_flag"])
+
+
+def test_cohort_pages(cohort):
+    first = fetch_cohort(limit=3)
+    assert first["count"] == 4
+    second = fetch_cohort(limit=3, cursor=first["next_cursor"])
+    assert [row["patient_id"] for row in first["data"] + second["data"]] == [1, 2, 3, 4]
+    assert second["next_cursor"] is None
+
+
+def test_rebuild_fills_missing_rows(cohort, capsys):
+    execute_query("DELETE FROM patient_features")
+    assert rebuild_features.run(batch_size=2) == 4
+    row = execute_query("SELECT * FROM patient_features WHERE patient_id = 2", fetch_one=True)
+    assert row["rhythm_code"] == "AF" and row["lvh"] == 1
+    assert row["heart_rate"] == pytest.approx(100, abs=1)
+    assert row["axis"] == pytest.approx(40.9, abs=0.1)
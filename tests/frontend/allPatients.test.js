@@ -1,5 +1,5 @@
 import { describe, it, expect, vi, beforeEach, afterEach } from 'vitest';
-import { viewECG, deletePatient } from '../../code/frontend/scripts/allPatients';
+import { viewECG, deletePatient, buildPatientsUrl, loadPatients } from '../../code/frontend/scripts/allPatients';
 
 beforeEach(() => {
   // Setup DOM environment
@@ -227,7 +227,7 @@ describe('All Patients Page Functionality', () => {
     document.dispatchEvent(domContentLoadedEvent);
     
     // Check that fetch was called
-    expect(global.fetch).toHaveBeenCalledWith('/api/patients_info', { headers: {} });
+    expect(global.fetch).toHaveBeenCalledWith('/api/patients_info?limit=100', { headers: {} });
     
     // Need to use an async approach to wait for promises to resolve
     return new Promise(resolve => {
@@ -316,7 +316,7 @@ describe('All Patients Page Functionality', () => {
     document.dispatchEvent(domContentLoadedEvent);
     
     // Check that fetch was called with no-cache headers
-    expect(global.fetch).toHaveBeenCalledWith('/api/patients_info', { 
+    expect(global.fetch).toHaveBeenCalledWith('/api/patients_info?limit=100', { 
       headers: {
         'Cache-Control': 'no-cache, no-store, must-revalidate',
         'Pragma': 'no-cache',
@@ -372,4 +372,34 @@ describe('All Patients Page Functionality', () => {
       }, 0);
     });
   });
-});
\ No newline at end of file
+
+  it('should build the page URL from the filters and cursor', () => {
+    document.body.innerHTML += `
+      <select id="filter-gender"><option value="F" selected>Female</option></select>
+      <input id="filter-age-min" value="40">
+      <input id="filter-diagnosis" value="">
+      <select id="filter-sort"><option value="age" selected>Age</option></select>
+    `;
+
+    expect(buildPatientsUrl(null)).toBe('/api/patients_info?limit=100&gender=F&age_min=40&sort=age');
+    expect(buildPatientsUrl('abc')).toBe('/api/patients_info?limit=100&gender=F&age_min=40&sort=age&cursor=abc');
+  });
+
+  it('should append the next page when loading more', async () => {
+    document.body.innerHTML += '<button id="load-more" style="display: none;">Load more</button>';
+    const page = (ids, cursor) => ({
+      ok: true,
+      json: () => Promise.resolve({ success: true, data: ids.map(id => ({ patient_id: id })), next_cursor: cursor })
+    });
+    global.fetch.mockResolvedValueOnce(page([1, 2], 'next')).mockResolvedValueOnce(page([3], null));
+
+    await loadPatients(true);
+    const loadMore = document.getElementById('load-more');
+    expect(loadMore.style.display).toBe('');
+
+    await loadPatients(false);
+    expect(global.fetch).toHaveBeenLastCalledWith('/api/patients_info?limit=100&cursor=next', { headers: {} });
+    expect(document.getElementById('patients-table-body').children.length).toBe(3);
+    expect(loadMore.style.display).toBe('none');
+  });
+});
@@ -4,6 +4,7 @@ import path from 'path';
 // Import the actual functions from app.js
 import { 
   updatePatientInfo, 
+  toPhysicalSignals,
   findClosestTimeIndex, 
   showInterpretationModal, 
   processECGSelection,
@@ -961,4 +962,20 @@ Electrical Axis Analysis:
       }, 0);
     });
   });
-});
\ No newline at end of file
+
+  it('should convert ADC signals to physical units', () => {
+    const data = {
+      time: [0, 0.002],
+      signals: { i: [200, -100] },
+      adc: { gain: { i: 200 }, baseline: { i: 0 } }
+    };
+
+    expect(toPhysicalSignals(data).signals.i).toEqual([1, -0.5]);
+  });
+
+  it('should leave signals without ADC gain unchanged', () => {
+    const data = { time: [0, 0.002], signals: { i: [0.1, 0.2] } };
+
+    expect(toPhysicalSignals(data)).toBe(data);
+  });
+});
@@ -0,0 +1,88 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+from backend.ingest import discover_records, run, main
+import pytest
+import numpy as np
+import wfdb
+import zipfile
+from unittest.mock import patch
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """Folder with two valid records in a data sub-folder"""
+    data_dir = tmp_path / "dataset" / "data"
+    data_dir.mkdir(parents=True)
+    time = np.linspace(0, 10, 5000)
+    signals = np.array([np.sin(2 * np.pi * f * time) for f in (1, 1.2, 1.5)]).T
+    for name in ("1", "2"):
+        wfdb.wrsamp(record_name=name, fs=500, units=['mV'] * 3, sig_name=['i', 'ii', 'iii'],
+                    p_signal=signals, write_dir=str(data_dir))
+    return tmp_path / "dataset"
+
+
+def test_discover_records_folder_and_zip(dataset, tmp_path):
+    keys = discover_records(str(dataset))
+    assert keys == [str(dataset / "data" / "1"), str(dataset / "data" / "2")]
+
+    zip_path = tmp_path / "dataset.zip"
+    with zipfile.ZipFile(zip_path, 'w') as zip_ref:
+        for name in ("1.hea", "1.dat", "2.hea", "2.dat"):
+            zip_ref.write(dataset / "data" / name, "data/" + name)
+    assert discover_records(str(zip_path)) == ["data/1", "data/2"]
+
+
+def test_dry_run_parses_without_storing(dataset):
+    with patch("backend.ingest.store_patients_and_ecg_data") as mock_store, \
+         patch("backend.ingest.lookup_record") as mock_lookup:
+        stats = run(str(dataset), dry_run=True)
+
+    mock_store.assert_not_called()
+    mock_lookup.assert_not_called()
+    assert stats["parsed"] == 2
+    assert stats["failed"] == 0
+
+
+@patch("backend.ingest.remember_record")
+@patch("backend.ingest.lookup_record", return_value=(None, None))
+@patch("backend.ingest.store_patients_and_ecg_data", side_effect=lambda records: [{"success": True}] * len(records))
+def test_resume_skips_checkpointed_records(mock_store, mock_lookup, mock_remember, dataset, tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.json")
+
+    stats = run(str(dataset), batch_size=1, checkpoint=checkpoint)
+    assert stats["stored"] == 2
+    assert sum(len(call.args[0]) for call in mock_store.call_args_list) == 2
+
+    mock_store.reset_mock()
+    stats = run(str(dataset), checkpoint=checkpoint, resume=True)
+    assert stats["resumed"] == 2
+    mock_store.assert_not_called()
+
+
+@patch("backend.ingest.store_patients_and_ecg_data")
+@patch("backend.ingest.lookup_record", return_value=("abc", 1))
+def test_known_records_are_not_parsed(mock_lookup, mock_store, dataset, tmp_path):
+    with patch("backend.ingest.get_ecg_data") as mock_get:
+        stats = run(str(dataset), checkpoint=str(tmp_path / "checkpoint.json"))
+
+    mock_get.assert_not_called()
+    mock_store.assert_not_called()
+    assert stats["duplicates"] == 2
+
+
+@patch("backend.ingest.remember_record")
+@patch("backend.ingest.lookup_record", return_value=(None, None))
+@patch("backend.ingest.store_patients_and_ecg_data", side_effect=lambda records: [{"success": True}] * len(records))
+def test_workers_and_batch_size_reach_the_pipeline(mock_store, mock_lookup, mock_remember, dataset, tmp_path):
+    from backend import ingest
+    with patch("backend.ingest.record_stages", wraps=ingest.record_stages) as mock_stages:
+        stats = run(str(dataset), workers=3, batch_size=7, checkpoint=str(tmp_path / "checkpoint.json"), sandbox=False)
+
+    assert stats["stored"] == 2
+    assert mock_stages.call_args.kwargs["analyze_workers"] == 3
+    assert mock_stages.call_args.kwargs["store_batch"] == 7
+
+def test_main_missing_source(tmp_path):
+    with pytest.raises(SystemExit):
+        main([str(tmp_path / "missing")])
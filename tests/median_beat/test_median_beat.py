@@ -0,0 +1,121 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+import numpy as np
+import pytest
+from backend.baseline import beat_baselines
+from backend.db import db_setup
+from backend.db.beats import fetch_median_beats
+from backend.db.engine import SQLiteEngine
+from backend.db.patient import delete_patient_by_id
+from backend.median_beat import median_beats, median_beat_amplitudes, MEDIAN_WINDOW
+from backend.services.beat_service import median_beat_response
+from backend.services.patient_service import store_patient_and_ecg_data
+
+FS = 500
+BEAT_TIME = np.arange(int(0.7 * FS)) / FS
+R_OFFSET = int(0.25 * FS)
+
+
+def beat():
+    """P wave at 100 ms, R (+1000) at 250 ms, S (-200) at 275 ms, T at 500 ms"""
+    t = BEAT_TIME
+    return (80 * np.exp(-((t - 0.1) / 0.02) ** 2) + 1000 * np.exp(-((t - 0.25) / 0.012) ** 2)
+            - 200 * np.exp(-((t - 0.275) / 0.008) ** 2) + 300 * np.exp(-((t - 0.5) / 0.05) ** 2))
+
+
+def wandering(ectopic=(), seconds=10, seed=0):
+    """Beats every 840 ms on a 0.25 Hz, 600 unit baseline wander, the ectopic beats upside down"""
+    samples = np.arange(FS * seconds)
+    signal = np.random.default_rng(seed).normal(0, 5, len(samples)) + 300 * np.sin(2 * np.pi * 0.25 * samples / FS) + 100
+    starts = list(range(50, len(samples) - len(BEAT_TIME), 420))
+    for n, start in enumerate(starts):
+        signal[start:start + len(BEAT_TIME)] += -beat() if n in ectopic else beat()
+    return signal, np.array(starts) + R_OFFSET
+
+
+def expected_beat():
+    """The beat in the median window, R peak at MEDIAN_WINDOW[0]"""
+    before = int(-MEDIAN_WINDOW[0] * FS)
+    return beat()[R_OFFSET - before:R_OFFSET - before + int((MEDIAN_WINDOW[1] - MEDIAN_WINDOW[0]) * FS)]
+
+
+def test_median_beat_is_the_beat_without_wander():
+    signal, r_peaks = wandering(ectopic=[3])
+    leads = {"i": signal, "ii": 0.5 * signal}
+    median = median_beats(leads, FS, r_peaks, baselines=beat_baselines(leads, FS, r_peaks))
+    assert median["leads"] == ["i", "ii"]
+    assert median["offset"] == int(0.25 * FS)
+    assert median["beat"].dtype == np.float32
+    assert median["beat_count"] == len(r_peaks)
+    expected = expected_beat()
+    assert median["beat"].shape == (2, len(expected))
+    # The inverted beat and the wander are both gone
+    assert np.abs(median["beat"][0] - expected).max() < 40
+    assert np.abs(median["beat"][1] - 0.5 * expected).max() < 20
+
+    amplitudes = median_beat_amplitudes(median, FS)
+    assert amplitudes["i"]["max_peak"] == pytest.approx(1000, abs=40)
+    assert amplitudes["i"]["min_peak"] == pytest.approx(expected[median["offset"]:].min(), abs=40)
+    assert amplitudes["i"]["lead_vector"] == pytest.approx(amplitudes["i"]["max_peak"] - abs(amplitudes["i"]["min_peak"]))
+
+
+def test_without_baselines_the_wander_stays():
+    signal, r_peaks = wandering()
+    median = median_beats({"i": signal}, FS, r_peaks)
+    # Beats sit on the wander at their R peak, the median keeps a level of it
+    assert np.abs(median["beat"][0] - expected_beat()).max() > 40
+
+
+def test_adc_median_is_millivolts():
+    signal, r_peaks = wandering()
+    adc = {"gain": {"i": 200.0}, "baseline": {"i": 100}}
+    physical = median_beats({"i": signal}, FS, r_peaks)["beat"][0]
+    converted = median_beats({"i": signal}, FS, r_peaks, adc)["beat"][0]
+    np.testing.assert_allclose(converted, (physical - 100) / 200, atol=1e-4)
+
+
+def test_no_whole_beat():
+    signal, _ = wandering()
+    assert median_beats({"i": signal}, FS, [10, len(signal) - 10]) is None
+    assert median_beats({"i": signal}, FS, []) is None
+    assert median_beats({}, FS, [500]) is None
+
+
+@pytest.fixture
+def database(tmp_path):
+    previous = db_setup.use_engine(SQLiteEngine(str(tmp_path / "ecg.sqlite3")))
+    yield
+    db_setup.use_engine(previous)
+
+
+def record(patient_id):
+    signal, _ = wandering(seed=patient_id)
+    return {
+        "time": (np.arange(len(signal)) / FS).tolist(),
+        "fs": float(FS),
+        "signals": {"i": signal.tolist(), "ii": (0.6 * signal).tolist(), "iii": (-0.4 * signal).tolist()},
+        "maxima_graph_data": {}, "minima_graph_data": {}, "baselines_graph_data": {},
+        "patient_info": {
+            "anonymous_id": patient_id, "age": "50", "sex": "F", "rhythm": "Sinus rhythm",
+            "hypertrophies": [], "conduction_system_disease": [], "ischemia": [], "cardiac_pacing": [],
+            "repolarization_abnormalities": None,
+        },
+    }
+
+
+def test_ingest_stores_the_median_beat(database):
+    store_patient_and_ecg_data(record(4))
+    stored = fetch_median_beats([4, 5])
+    assert sorted(stored) == [4]
+    median = stored[4]
+    assert median["leads"] == ["i", "ii", "iii"] and median["fs"] == FS
+    assert median["beat"].shape == (3, len(expected_beat()))
+    assert np.abs(median["beat"][2] + 0.4 * expected_beat()).max() < 20
+
+    response = median_beat_response(median, ["iii"])
+    assert list(response["leads"]) == list(response["amplitudes"]) == ["iii"]
+    assert response["amplitudes"]["iii"]["min_peak"] == pytest.approx(-400, abs=20)
+
+    delete_patient_by_id(4)
+    assert fetch_median_beats([4]) == {}
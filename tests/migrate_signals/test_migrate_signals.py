@@ -0,0 +1,89 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+import json
+import pytest
+import numpy as np
+from backend import signal_store
+from backend.signal_store import SignalStore
+from backend.migrate_signals import run, main
+from backend.db import db_setup
+from backend.db.engine import SQLiteEngine
+from backend.db.ecg import insert_ecg_data_into_db, fetch_ecg_data_by_patient_id
+from backend.db.patient import insert_patient_into_db
+from backend.db.utils import execute_query
+
+
+def record(patient_id, fs=257.0, samples=300, peak=2000):
+    rng = np.random.default_rng(patient_id)
+    return {
+        "time": (np.arange(samples) / fs).tolist(),
+        "signals": {lead: rng.integers(-peak, peak, samples).tolist() for lead in ["i", "ii", "iii"]},
+        "adc": {"gain": {"i": 200.0, "ii": 200.0, "iii": 200.0}, "baseline": {"i": 0, "ii": 0, "iii": 0}},
+        "maxima_graph_data": {}, "minima_graph_data": {}, "baselines_graph_data": {}
+    }
+
+
+@pytest.fixture
+def legacy_rows(tmp_path):
+    """Five rows with JSON signals, patient 5 does not fit int16"""
+    previous_engine = db_setup.use_engine(SQLiteEngine(str(tmp_path / "ecg.sqlite3")))
+    previous_store = signal_store.use_store(None)
+    for patient_id in range(1, 6):
+        insert_patient_into_db({"anonymous_id": patient_id, "sex": "M", "age": 60, "rhythm": "Sinus rhythm",
+                                "repolarization_abnormalities": None})
+        insert_ecg_data_into_db(patient_id, record(patient_id, peak=100000 if patient_id == 5 else 2000))
+    before = {patient_id: fetch_ecg_data_by_patient_id(patient_id) for patient_id in range(1, 6)}
+    store = SignalStore(str(tmp_path / "signals"))
+    signal_store.use_store(store)
+    yield store, before, str(tmp_path / "checkpoint.json")
+    signal_store.use_store(previous_store)
+    db_setup.use_engine(previous_engine)
+
+
+def row(patient_id):
+    return execute_query("SELECT * FROM ecg_data WHERE patient_id = %s", (patient_id,), fetch_one=True)
+
+
+def test_rows_move_to_the_store_and_read_the_same(legacy_rows, capsys):
+    store, before, checkpoint = legacy_rows
+    stats = run(store, batch_size=2, checkpoint=checkpoint)
+    assert stats["migrated"] == 4
+    assert stats["failed"] == 1
+    for patient_id in range(1, 5):
+        assert row(patient_id)["signal_key"] is not None
+        assert row(patient_id)["signal_raw_data"] is None
+        assert fetch_ecg_data_by_patient_id(patient_id) == before[patient_id]
+    assert "ETA" in capsys.readouterr().out
+
+
+def test_rows_that_do_not_round_trip_stay_json(legacy_rows):
+    store, before, checkpoint = legacy_rows
+    run(store, checkpoint=checkpoint)
+    assert row(5)["signal_key"] is None
+    assert fetch_ecg_data_by_patient_id(5) == before[5]
+    with open(checkpoint) as file:
+        assert "int16" in json.load(file)["failed"][str(row(5)["id"])]
+
+
+def test_resume_continues_after_the_checkpoint(legacy_rows):
+    store, _, checkpoint = legacy_rows
+    assert run(store, batch_size=2, checkpoint=checkpoint, limit=2)["migrated"] == 2
+    assert row(3)["signal_key"] is None
+    stats = run(store, batch_size=2, checkpoint=checkpoint, resume=True)
+    assert stats["pending"] == 3
+    assert stats["migrated"] == 2
+    assert row(3)["signal_key"] is not None
+
+
+def test_keep_json_leaves_the_old_columns(legacy_rows):
+    store, before, checkpoint = legacy_rows
+    run(store, checkpoint=checkpoint, keep_json=True)
+    assert row(1)["signal_key"] is not None
+    assert json.loads(row(1)["signal_raw_data"]) == before[1]["signals"]
+
+
+def test_main_requires_a_store(legacy_rows, monkeypatch):
+    monkeypatch.setattr(signal_store, "SIGNAL_STORE_DIR", None)
+    with pytest.raises(SystemExit):
+        main(["--store", ""])
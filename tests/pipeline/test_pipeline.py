@@ -0,0 +1,138 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+from backend.pipeline import Pipeline, Stage, StageTimings, record_stages, record_task
+import random
+import threading
+import time
+
+
+def test_results_keep_input_order():
+    def slow(item):
+        time.sleep(random.random() / 200)
+        item["value"] = item["n"] * 2
+
+    pipeline = Pipeline([Stage("double", slow, workers=4)], queue_size=2)
+    results = list(pipeline.run({"n": n} for n in range(50)))
+
+    assert [item["value"] for item in results] == [n * 2 for n in range(50)]
+
+
+def test_queues_bound_items_in_flight():
+    lock = threading.Lock()
+    state = {"fed": 0, "seen": 0, "ahead": 0}
+
+    def items():
+        for n in range(200):
+            with lock:
+                state["fed"] += 1
+                state["ahead"] = max(state["ahead"], state["fed"] - state["seen"])
+            yield {"n": n}
+
+    pipeline = Pipeline([Stage("a", lambda item: None), Stage("b", lambda item: time.sleep(0.001))], queue_size=2)
+    for _ in pipeline.run(items()):
+        with lock:
+            state["seen"] += 1
+
+    # workers plus queue slots of every stage and the input
+    assert state["ahead"] <= 2 + 2 * 3 + 1
+
+
+def test_done_items_skip_later_stages_and_batches():
+    batches = []
+
+    def mark(item):
+        if item["n"] % 3 == 0:
+            item["done"] = True
+
+    def store(items):
+        batches.append([item["n"] for item in items])
+
+    timings = StageTimings()
+    pipeline = Pipeline([Stage("mark", mark), Stage("store", store, batch_size=4)], timings=timings)
+    results = list(pipeline.run({"n": n} for n in range(12)))
+
+    assert len(results) == 12
+    stored = sorted(n for batch in batches for n in batch)
+    assert stored == [n for n in range(12) if n % 3]
+    assert all(len(batch) <= 4 for batch in batches)
+
+    snapshot = timings.snapshot()
+    assert snapshot["mark"]["items"] == 12
+    assert snapshot["store"]["items"] == 8
+
+
+def test_stage_errors_are_kept_per_item():
+    def explode(item):
+        if item["n"] == 2:
+            raise ValueError("bad record")
+
+    results = list(Pipeline([Stage("parse", explode, workers=2)]).run({"n": n} for n in range(4)))
+
+    assert results[2]["error"] == "bad record"
+    assert all("error" not in item for n, item in enumerate(results) if n != 2)
+
+
+def test_record_stages_dedup_parse_and_store():
+    stored = []
+    remembered = []
+    parse = lambda key: {"error": "Missing required leads"} if key == "bad" else {"patient_info": {"anonymous_id": key}}
+    lookup = lambda key: ("hash-" + key, 7 if key == "known" else None)
+
+    def store(ecg_data):
+        stored.append(ecg_data["patient_info"]["anonymous_id"])
+        return {"success": True}
+
+    stages = record_stages(parse, store, lookup, lambda *args: remembered.append(args))
+    tasks = list(Pipeline(stages).run(record_task(key, key + ".hea") for key in ["new", "known", "bad"]))
+
+    assert stored == ["new"]
+    assert remembered == [("hash-new", {"anonymous_id": "new"}, {"success": True})]
+    assert tasks[1]["duplicate_of"] == 7 and "ecg_data" not in tasks[1]
+    assert tasks[2]["error"] == "Missing required leads"
+    assert tasks[0]["storage_result"] == {"success": True}
+
+
+def test_record_stages_store_many_gets_batches():
+    batches = []
+    remembered = []
+    parse = lambda key: {"patient_info": {"anonymous_id": key}}
+
+    def store_many(records):
+        batches.append([ecg_data["patient_info"]["anonymous_id"] for ecg_data in records])
+        return [{"success": True, "patient_id": ecg_data["patient_info"]["anonymous_id"]} for ecg_data in records]
+
+    keys = [str(n) for n in range(10)]
+    stages = record_stages(parse, None, lambda key: ("hash-" + key, None), lambda *args: remembered.append(args),
+                           store_batch=4, store_many=store_many)
+    tasks = list(Pipeline(stages).run(record_task(key, key + ".hea") for key in keys))
+
+    assert sorted(sum(batches, [])) == keys
+    assert all(len(batch) <= 4 for batch in batches)
+    assert [task["storage_result"]["patient_id"] for task in tasks] == keys
+    assert len(remembered) == 10
+
+
+def test_record_stages_failed_store_many_fails_the_batch():
+    def store_many(records):
+        raise RuntimeError("database is locked")
+
+    stages = record_stages(lambda key: {"patient_info": {"anonymous_id": key}}, store_batch=8, store_many=store_many)
+    tasks = list(Pipeline(stages).run(record_task(key, key + ".hea") for key in ["1", "2"]))
+
+    assert [task["error"] for task in tasks] == ["database is locked"] * 2
+    assert all("storage_result" not in task for task in tasks)
+
+
+def test_record_stages_store_many_with_batches_of_one():
+    batches = []
+
+    def store_many(records):
+        batches.append(len(records))
+        return [{"success": True}] * len(records)
+
+    stages = record_stages(lambda key: {"patient_info": {"anonymous_id": key}}, store_batch=1, store_many=store_many)
+    tasks = list(Pipeline(stages).run(record_task(key, key + ".hea") for key in ["1", "2"]))
+
+    assert batches == [1, 1]
+    assert [task["storage_result"] for task in tasks] == [{"success": True}] * 2
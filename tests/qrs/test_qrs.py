@@ -0,0 +1,124 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+import numpy as np
+import pytest
+from backend.db import db_setup
+from backend.db.beats import fetch_record_beats
+from backend.db.engine import SQLiteEngine
+from backend.db.patient import delete_patient_by_id
+from backend.qrs import detect_qrs, QRS_DETECTOR_VERSION
+from backend.services.beat_service import record_r_peaks, heart_rate, store_record_beats
+from backend.services.patient_service import store_patient_and_ecg_data
+
+FS = 500
+
+
+def beat(fs=FS, qrs=1000.0, t_wave=300.0):
+    """QRS at 100 ms and T wave at 350 ms of a 600 ms beat"""
+    t = np.arange(int(0.6 * fs)) / fs
+    return qrs * np.exp(-((t - 0.1) / 0.012) ** 2) + t_wave * np.exp(-((t - 0.35) / 0.05) ** 2)
+
+
+def ecg(starts, seconds=10, noise=5.0, seed=0, scale=None):
+    """One lead with a beat at every start, returns the signal and the true R peak indexes"""
+    signal = np.random.default_rng(seed).normal(0, noise, FS * seconds)
+    signal += 200 * np.sin(2 * np.pi * 0.3 * np.arange(len(signal)) / FS)  # baseline wander
+    for n, start in enumerate(starts):
+        signal[start:start + int(0.6 * FS)] += beat() * (scale[n] if scale else 1.0)
+    return signal, np.array(starts) + int(0.1 * FS)
+
+
+def regular(bpm, seconds=10):
+    return list(range(100, FS * seconds - FS, int(FS * 60 / bpm)))
+
+
+@pytest.mark.parametrize("bpm", [40, 60, 100, 150, 200])
+def test_finds_every_beat_within_a_sample(bpm):
+    signal, truth = ecg(regular(bpm))
+    peaks = detect_qrs({"ii": signal}, FS)
+    assert len(peaks) == len(truth)
+    assert np.abs(peaks - truth).max() <= 1
+    assert peaks.dtype == np.int32
+
+
+def test_leads_are_combined_after_scaling():
+    signal, truth = ecg(regular(75))
+    leads = {
+        "i": signal,
+        "avr": -0.3 * signal,  # small and upside down
+        "v1": np.zeros(len(signal)),  # flat lead
+        "v2": 50 * np.random.default_rng(1).normal(size=len(signal)),  # noise only
+    }
+    peaks = detect_qrs(leads, FS)
+    assert len(peaks) == len(truth) and np.abs(peaks - truth).max() <= 1
+
+
+def test_searchback_finds_a_small_beat():
+    starts = regular(60)
+    scale = [1.0] * len(starts)
+    scale[6] = 0.45  # below the threshold, above half of it
+    signal, truth = ecg(starts, scale=scale)
+    peaks = detect_qrs({"ii": signal}, FS)
+    assert len(peaks) == len(truth) and np.abs(peaks - truth).max() <= 1
+
+
+def test_tall_t_waves_are_not_beats():
+    starts = regular(60)
+    signal = np.random.default_rng(0).normal(0, 5, FS * 10)
+    for start in starts:
+        signal[start:start + int(0.6 * FS)] += beat(t_wave=700.0)
+    assert len(detect_qrs({"ii": signal}, FS)) == len(starts)
+
+
+def test_nothing_to_detect():
+    assert len(detect_qrs({"ii": np.zeros(FS * 10)}, FS)) == 0
+    assert len(detect_qrs({"ii": np.ones(100)}, FS)) == 0
+    assert len(detect_qrs({}, FS)) == 0
+    assert len(detect_qrs({"ii": np.ones(FS * 10)}, 20)) == 0
+
+
+def test_heart_rate_and_parsed_peaks():
+    signal, truth = ecg(regular(80))
+    assert heart_rate(detect_qrs({"ii": signal}, FS), FS) == pytest.approx(80, abs=0.5)
+    assert heart_rate([10], FS) is None
+    # Peaks analyze_record already found are used as they are
+    assert record_r_peaks({"r_peaks": [5, 9], "signals": {"ii": signal}, "fs": FS}).tolist() == [5, 9]
+
+
+@pytest.fixture
+def database(tmp_path):
+    previous = db_setup.use_engine(SQLiteEngine(str(tmp_path / "ecg.sqlite3")))
+    yield
+    db_setup.use_engine(previous)
+
+
+def record(patient_id, bpm):
+    signal, _ = ecg(regular(bpm), seed=patient_id)
+    return {
+        "time": (np.arange(len(signal)) / FS).tolist(),
+        "fs": float(FS),
+        "signals": {"i": signal.tolist(), "ii": signal.tolist(), "iii": signal.tolist()},
+        "maxima_graph_data": {}, "minima_graph_data": {}, "baselines_graph_data": {},
+        "patient_info": {
+            "anonymous_id": patient_id, "age": "50", "sex": "F", "rhythm": "Sinus rhythm",
+            "hypertrophies": [], "conduction_system_disease": [], "ischemia": [], "cardiac_pacing": [],
+            "repolarization_abnormalities": None,
+        },
+    }
+
+
+def test_ingest_stores_peaks(database):
+    store_patient_and_ecg_data(record(1, 60))
+    store_patient_and_ecg_data(record(2, 120))
+    beats = fetch_record_beats([1, 2, 3])
+    assert sorted(beats) == [1, 2]
+    assert beats[1]["beat_count"] == len(beats[1]["r_peaks"]) == len(regular(60))
+    assert heart_rate(beats[2]["r_peaks"], beats[2]["fs"]) == pytest.approx(120, abs=1)
+    assert beats[1]["detector_version"] == QRS_DETECTOR_VERSION
+
+    # Stored again replaces the row, the patient's delete removes it
+    store_record_beats({**record(1, 60), "r_peaks": [100, 600]})
+    assert fetch_record_beats([1])[1]["r_peaks"].tolist() == [100, 600]
+    delete_patient_by_id(1)
+    assert fetch_record_beats([1]) == {}
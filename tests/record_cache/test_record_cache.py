@@ -0,0 +1,117 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+from backend.record_cache import RecordCache, estimate_size
+import json
+from unittest.mock import MagicMock
+
+
+def record(samples):
+    return {"time": list(range(samples)), "signals": {"i": [0.5] * samples}}
+
+
+def test_second_get_is_served_from_memory():
+    cache = RecordCache()
+    load = MagicMock(return_value=record(10))
+    assert cache.get("1", load) == record(10)
+    assert cache.get("1", load) == record(10)
+    assert load.call_count == 1
+    metrics = cache.metrics()
+    assert metrics["hits"] == 1 and metrics["misses"] == 1
+    assert metrics["hit_rate"] == 0.5
+
+
+def test_missing_records_are_not_cached():
+    cache = RecordCache()
+    load = MagicMock(return_value=None)
+    assert cache.get("1", load) is None
+    assert cache.get("1", load) is None
+    assert load.call_count == 2
+    assert cache.metrics()["entries"] == 0
+
+
+def test_least_recently_used_is_evicted_by_bytes():
+    size = estimate_size(record(1000))
+    cache = RecordCache(max_bytes=size * 2)
+    cache.get("1", lambda: record(1000))
+    cache.get("2", lambda: record(1000))
+    cache.get("1", lambda: record(1000))  # 2 is now the least recently used
+    cache.get("3", lambda: record(1000))
+    metrics = cache.metrics()
+    assert metrics["entries"] == 2
+    assert metrics["evictions"] == 1
+    assert metrics["bytes"] <= size * 2
+    load = MagicMock(return_value=record(1000))
+    cache.get("1", load)
+    assert load.call_count == 0
+
+
+def test_invalidate_drops_memory_and_disk_entries(tmp_path):
+    cache = RecordCache(disk_dir=str(tmp_path))
+    cache.get("7", lambda: record(5))
+    assert (tmp_path / "7.json").exists()
+    cache.invalidate("7")
+    assert not (tmp_path / "7.json").exists()
+    load = MagicMock(return_value=record(6))
+    assert cache.get("7", load) == record(6)
+    assert load.call_count == 1
+
+
+def test_disk_tier_is_shared_between_caches(tmp_path):
+    RecordCache(disk_dir=str(tmp_path)).get("3", lambda: record(4))
+    other = RecordCache(disk_dir=str(tmp_path))
+    load = MagicMock()
+    assert other.get("3", load) == record(4)
+    load.assert_not_called()
+    assert other.metrics()["disk_hits"] == 1
+
+
+def test_expired_entries_are_reloaded():
+    cache = RecordCache(max_age=0)
+    load = MagicMock(return_value=record(3))
+    cache.get("1", load)
+    cache.get("1", load)
+    assert load.call_count == 2
+
+
+def test_load_racing_an_invalidation_is_not_stored():
+    cache = RecordCache()
+
+    def load():
+        cache.invalidate("1")  # a delete finished while the row was being read
+        return record(2)
+
+    assert cache.get("1", load) == record(2)
+    assert cache.metrics()["entries"] == 0
+
+
+def test_invalidation_during_the_disk_write_is_not_undone(tmp_path, monkeypatch):
+    from backend import record_cache
+    cache = RecordCache(disk_dir=str(tmp_path))
+    mkstemp = record_cache.tempfile.mkstemp
+
+    def invalidate_first(**kwargs):
+        cache.invalidate("4")  # a delete lands after the value was stored in memory
+        return mkstemp(**kwargs)
+
+    monkeypatch.setattr(record_cache.tempfile, "mkstemp", invalidate_first)
+    cache.get("4", lambda: record(3))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_disk_entries_expire(tmp_path):
+    RecordCache(disk_dir=str(tmp_path)).get("5", lambda: record(4))
+    os.utime(tmp_path / "5.json", (0, 0))
+    load = MagicMock(return_value=record(6))
+    assert RecordCache(disk_dir=str(tmp_path)).get("5", load) == record(6)
+    assert load.call_count == 1
+
+
+def test_disk_tier_drops_the_oldest_files(tmp_path):
+    cache = RecordCache(disk_dir=str(tmp_path), disk_max_bytes=2 * len(json.dumps(record(50))) + 10)
+    for n, key in enumerate(["1", "2", "3"]):
+        cache.get(key, lambda: record(50))
+        os.utime(tmp_path / f"{key}.json", (1000 + n, 1000 + n))
+    cache.get("4", lambda: record(50))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["3.json", "4.json"]
+    assert cache.metrics()["disk_evictions"] == 2
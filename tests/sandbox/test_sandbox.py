@@ -0,0 +1,96 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+from backend.sandbox import SandboxPool, SandboxError, parse_in_sandbox
+import pytest
+import time
+
+
+# Module level so the worker processes can unpickle them
+def square(value):
+    return value * value
+
+
+def hang(seconds):
+    time.sleep(seconds)
+    return "finished"
+
+
+def crash(code):
+    os._exit(code)
+
+
+def allocate(megabytes):
+    return len(bytearray(megabytes * 2 ** 20))
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+@pytest.fixture
+def pool():
+    with SandboxPool(workers=2, timeout=2.0, memory_limit=512 * 2 ** 20) as pool:
+        yield pool
+
+
+def test_call_returns_result(pool):
+    assert pool.call(square, 7) == 49
+
+
+def test_timeout_kills_worker_and_pool_keeps_going(pool):
+    started = time.monotonic()
+    with pytest.raises(SandboxError, match="Timed out"):
+        pool.call(hang, 60)
+    assert time.monotonic() - started < 10
+
+    assert pool.call(square, 3) == 9
+    assert pool.metrics()["timed_out"] == 1
+    assert pool.metrics()["respawned"] == 1
+
+
+def test_crashed_worker_is_respawned(pool):
+    with pytest.raises(SandboxError, match="crashed"):
+        pool.call(crash, 3)
+    assert pool.call(square, 4) == 16
+    assert pool.metrics()["crashed"] == 1
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="no RLIMIT_AS on Windows")
+def test_memory_limit(pool):
+    with pytest.raises(SandboxError, match="Out of memory"):
+        pool.call(allocate, 1024)
+    assert pool.call(allocate, 16) == 16 * 2 ** 20
+
+
+def test_parse_in_sandbox_returns_error_dict(pool):
+    result = parse_in_sandbox(pool, fail, "bad record")
+    assert result["message"] == "Failed to process ECG data"
+    assert "bad record" in result["error"]
+
+
+def test_upload_parses_in_sandbox(tmp_path, monkeypatch):
+    import numpy as np
+    import wfdb
+    from unittest.mock import patch
+    from backend import app as app_module
+
+    data_dir = tmp_path / "upload" / "data"
+    data_dir.mkdir(parents=True)
+    time_values = np.linspace(0, 10, 5000)
+    signals = np.array([np.sin(2 * np.pi * f * time_values) for f in (1, 1.2, 1.5)]).T
+    wfdb.wrsamp(record_name="1", fs=500, units=['mV'] * 3, sig_name=['i', 'ii', 'iii'],
+                p_signal=signals, write_dir=str(data_dir), fmt=['16'] * 3)
+    (data_dir / "2.hea").write_text("2 3 500 5000\n")  # no signal lines
+
+    monkeypatch.setitem(app_module.app.config, 'INGEST_SANDBOX', True)
+    calls = app_module.parser_pool().metrics()["calls"]  # the pool is shared with earlier uploads
+    with patch("backend.app.store_patient_and_ecg_data", return_value={"success": True}), \
+         patch("backend.app.lookup_record", return_value=(None, None)), \
+         app_module.app.app_context():
+        response = app_module.process_and_store_ecg_data(str(tmp_path / "upload"))
+
+    results = {item["file"]: item for item in response.get_json()["patient_results"]}
+    assert results["1.hea"]["storage_result"] == {"success": True}
+    assert "error" in results["2.hea"]
+    assert app_module.parser_pool().metrics()["calls"] == calls + 2
@@ -0,0 +1,52 @@
+import pytest
+from backend.services.record_hash_service import (
+    hash_record_files, lookup_record, remember_record, duplicate_result
+)
+
+
+@pytest.fixture
+def record_files(tmp_path):
+    (tmp_path / "1.hea").write_text("1 1 500 2\n1.dat 16 200/mV 16 0 0 0 0 i\n")
+    (tmp_path / "1.dat").write_bytes(b"\x01\x00\x02\x00")
+    return str(tmp_path / "1")
+
+
+def test_hash_changes_with_dat_bytes(record_files, tmp_path):
+    first = hash_record_files(record_files)
+    assert first == hash_record_files(record_files) # same bytes give the same hash
+
+    (tmp_path / "1.dat").write_bytes(b"\x01\x00\x03\x00")
+    assert hash_record_files(record_files) != first
+
+
+def test_lookup_known_record(record_files, mocker):
+    mocker.patch("backend.services.record_hash_service.fetch_patient_id_by_hash", return_value=7)
+    content_hash, patient_id = lookup_record(record_files)
+    assert content_hash == hash_record_files(record_files)
+    assert patient_id == 7
+
+
+def test_lookup_missing_files():
+    # unreadable records are left for the parser to report
+    assert lookup_record("does_not_exist") == (None, None)
+
+
+def test_lookup_db_failure(record_files, mocker):
+    mocker.patch("backend.services.record_hash_service.fetch_patient_id_by_hash", side_effect=Exception("DB error"))
+    content_hash, patient_id = lookup_record(record_files)
+    assert content_hash is not None
+    assert patient_id is None
+
+
+def test_remember_record_only_after_storing(mocker):
+    mock_insert = mocker.patch("backend.services.record_hash_service.insert_record_hash")
+
+    remember_record("abc", {"anonymous_id": "3"}, {"success": False, "error": "DB error"})
+    mock_insert.assert_not_called()
+
+    remember_record("abc", {"anonymous_id": "3"}, {"success": True})
+    mock_insert.assert_called_once_with("abc", "3")
+
+
+def test_duplicate_result():
+    assert duplicate_result(3) == {"success": False, "duplicate": True, "patient_id": 3}
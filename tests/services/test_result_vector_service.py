@@ -37,3 +37,62 @@ def test_add_result_vector_success(monkeypatch):
     result = add_result_vector(data)
     assert result["success"] is True
     assert result["message"] == "Result vector stored successfully"
+
+def test_add_result_vectors_inserts_once(monkeypatch):
+    inserted = []
+    monkeypatch.setattr(rvs, "insert_result_vectors_into_db", lambda rows: inserted.append(rows))
+    data = [{"anonymous_id": "1", "leadDataArray": [{"lead": 1, "startTime": 0.1}]},
+            {"anonymous_id": "2", "leadDataArray": []}]
+    result = rvs.add_result_vectors(data)
+    assert result["success"] is True
+    assert result["stored"] == 2
+    assert len(inserted) == 1
+    assert [row["anonymous_id"] for row in inserted[0]] == [1, 2]
+    assert inserted[0][0]["beat_data"]["Lead 1"]["start_time"] == 0.1
+
+def test_add_result_vectors_rejects_the_whole_batch(monkeypatch):
+    monkeypatch.setattr(rvs, "insert_result_vectors_into_db", lambda rows: pytest.fail("nothing should be stored"))
+    result, status_code = rvs.add_result_vectors([{"anonymous_id": "1"}, {"leadDataArray": []}, "junk"])
+    assert status_code == 400
+    assert [error["index"] for error in result["errors"]] == [1, 2]
+
+def test_queue_result_vector_stamps_the_post_time():
+    class Buffer:
+        ack = "buffer"
+        def __init__(self):
+            self.items = []
+        def submit(self, item):
+            self.items.append(item)
+
+    buffer = Buffer()
+    result = rvs.queue_result_vector(buffer, {"anonymous_id": "7", "leadDataArray": []})
+    assert result == {"success": True, "message": "Result vector queued"}
+    assert buffer.items[0]["anonymous_id"] == 7
+    assert buffer.items[0]["created_at"]
+
+def test_queue_result_vector_timeouts():
+    class Pending:
+        def done(self):
+            return False
+
+    class Buffer:
+        ack = "db"
+        def __init__(self, timed_out):
+            self.timed_out = timed_out
+        def submit(self, item):
+            if self.timed_out:
+                raise TimeoutError("Not written after 10s, the item was dropped")
+            return Pending()
+
+    data = {"anonymous_id": "7", "leadDataArray": []}
+    result, status_code = rvs.queue_result_vector(Buffer(timed_out=True), data)
+    assert status_code == 503 and result["success"] is False
+    result, status_code = rvs.queue_result_vector(Buffer(timed_out=False), data)
+    assert status_code == 202
+    assert result == {"success": True, "pending": True, "message": "Result vector accepted, write pending"}
+
+def test_roman_lead_names_map_to_lead_numbers():
+    beat_data = rvs.process_lead_data([{"lead": "I", "leadVector": 1.5}, {"lead": "III", "leadVector": -0.5}])
+    assert beat_data["Lead 1"]["lead_vector"] == 1.5
+    assert beat_data["Lead 3"]["lead_vector"] == -0.5
+    assert set(beat_data) == {"Lead 1", "Lead 2", "Lead 3"}
@@ -0,0 +1,120 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+import json
+import numpy as np
+import pytest
+from backend import signal_store
+from backend.signal_store import SignalStore
+from backend.db import db_setup
+from backend.db.engine import SQLiteEngine
+from backend.db.ecg import (
+    insert_ecg_data_into_db, fetch_ecg_data_by_patient_id, fetch_ecg_signal_window, stream_ecg_data
+)
+from backend.db.patient import insert_patient_into_db
+from backend.db.utils import execute_query
+
+
+def record(patient_id, samples=500):
+    rng = np.random.default_rng(patient_id)
+    return {
+        "time": (np.arange(samples) / 500.0).tolist(),
+        "fs": 500.0,
+        "signals": {lead: rng.integers(-2000, 2000, samples).tolist() for lead in ["i", "ii", "iii"]},
+        "adc": {"gain": {"i": 1000.0, "ii": 1000.0, "iii": 1000.0}, "baseline": {"i": 0, "ii": 0, "iii": 0}},
+        "maxima_graph_data": {}, "minima_graph_data": {}, "baselines_graph_data": {}
+    }
+
+
+@pytest.fixture
+def database(tmp_path):
+    previous = db_setup.use_engine(SQLiteEngine(str(tmp_path / "ecg.sqlite3")))
+    for patient_id in (1, 2):
+        insert_patient_into_db({"anonymous_id": patient_id, "sex": "F", "age": 50, "rhythm": "Sinus rhythm",
+                                "repolarization_abnormalities": None})
+    yield
+    db_setup.use_engine(previous)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SignalStore(str(tmp_path / "signals"))
+    previous = signal_store.use_store(store)
+    yield store
+    signal_store.use_store(previous)
+
+
+def test_put_is_content_addressed(tmp_path):
+    store = SignalStore(str(tmp_path))
+    first = store.put({"i": [1, 2, 3], "ii": [4, 5, 6]}, np.int16, 500.0)
+    second = store.put({"i": [1, 2, 3], "ii": [4, 5, 6]}, np.int16, 500.0)
+    other = store.put({"i": [1, 2, 3], "ii": [4, 5, 7]}, np.int16, 500.0)
+    assert first == second
+    assert other["key"] != first["key"]
+    assert first["shape"] == [2, 3]
+    assert len(list((tmp_path / first["key"][:2]).iterdir())) == 1
+
+
+def test_read_returns_memory_map_views(tmp_path):
+    store = SignalStore(str(tmp_path))
+    meta = store.put({"i": list(range(100)), "ii": list(range(100, 200))}, np.int16, 250.0)
+    window = store.read(meta, 10, 20, ["ii"])
+    assert list(window) == ["ii"]
+    assert window["ii"].tolist() == list(range(110, 120))
+    assert isinstance(window["ii"].base, np.memmap) or isinstance(window["ii"], np.memmap)
+
+
+def test_row_keeps_only_the_pointer(database, store):
+    insert_ecg_data_into_db(1, record(1))
+    row = execute_query("SELECT * FROM ecg_data WHERE patient_id = %s", (1,), fetch_one=True)
+    assert row["signal_raw_data"] is None and row["time_data"] is None
+    meta = json.loads(row["signal_meta"])
+    assert meta["key"] == row["signal_key"]
+    assert meta["shape"] == [3, 500] and meta["fs"] == 500.0 and meta["leads"] == ["i", "ii", "iii"]
+
+
+def test_both_row_formats_decode_the_same(database, store):
+    insert_ecg_data_into_db(1, record(1))
+    signal_store.use_store(None)
+    insert_ecg_data_into_db(2, record(1))
+    signal_store.use_store(store)
+
+    stored, in_row = fetch_ecg_data_by_patient_id(1), fetch_ecg_data_by_patient_id(2)
+    assert stored["signals"] == in_row["signals"] == record(1)["signals"]
+    assert stored["time"] == in_row["time"]
+
+
+def test_signal_window_from_either_format(database, store):
+    insert_ecg_data_into_db(1, record(1))
+    signal_store.use_store(None)
+    insert_ecg_data_into_db(2, record(1))
+    signal_store.use_store(store)
+
+    expected = record(1)["signals"]["ii"][100:150]
+    for patient_id in (1, 2):
+        window = fetch_ecg_signal_window(patient_id, 100, 150, ["ii"])
+        assert window["fs"] == pytest.approx(500.0)
+        assert window["signals"]["ii"].dtype == np.int16
+        assert window["signals"]["ii"].tolist() == expected
+    assert fetch_ecg_signal_window(99) is None
+
+
+def test_signal_window_rebuilds_millivolts(database, store):
+    data = record(1)
+    data["adc"] = {"gain": {"i": 200.0, "ii": 400.0, "iii": 1000.0}, "baseline": {"i": 10, "ii": -20, "iii": 0}}
+    insert_ecg_data_into_db(1, data)
+    signal_store.use_store(None)
+    insert_ecg_data_into_db(2, data)
+    signal_store.use_store(store)
+
+    expected = (np.asarray(data["signals"]["ii"][100:150]) + 20) / 400.0
+    for patient_id in (1, 2):
+        window = fetch_ecg_signal_window(patient_id, 100, 150, ["ii"])
+        adc = window["adc"]
+        millivolts = (window["signals"]["ii"] - adc["baseline"]["ii"]) / adc["gain"]["ii"]
+        assert millivolts == pytest.approx(expected)
+
+def test_export_inlines_stored_signals(database, store):
+    insert_ecg_data_into_db(1, record(1))
+    rows = list(stream_ecg_data())
+    assert json.loads(rows[0]["signal_raw_data"]) == record(1)["signals"]
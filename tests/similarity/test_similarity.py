@@ -0,0 +1,153 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+import numpy as np
+import pytest
+from backend.db import db_setup
+from backend.db.engine import SQLiteEngine
+from backend.db.patient import delete_patient_by_id
+from backend.similarity_index import EmbeddingIndex
+from backend.services import similarity_service
+from backend.services.similarity_service import record_embedding, similar_patients, EMBEDDING_DIMS
+from backend.services.patient_service import store_patient_and_ecg_data
+
+
+def unit_rows(count, dims=16, seed=0):
+    rows = np.random.default_rng(seed).normal(size=(count, dims)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def beat_signal(wave, bpm=60, fs=500, seconds=10, seed=0):
+    """Noise with the given beat shape every beat, the R peak at the first sample of the shape's maximum"""
+    signal = np.random.default_rng(seed).normal(0, 5, fs * seconds)
+    for start in range(100, len(signal) - len(wave), int(fs * 60 / bpm)):
+        signal[start:start + len(wave)] += wave
+    return signal
+
+
+def morphology(fs=500, inverted_t=False):
+    t = np.arange(int(0.5 * fs)) / fs
+    qrs = 1000 * np.exp(-((t - 0.1) / 0.01) ** 2)
+    t_wave = 250 * np.exp(-((t - 0.35) / 0.04) ** 2)
+    return qrs - t_wave if inverted_t else qrs + t_wave
+
+
+def record(patient_id, inverted_t=False, seed=0):
+    wave = morphology(inverted_t=inverted_t)
+    signals = {lead: beat_signal(wave, seed=seed + n).tolist() for n, lead in enumerate(["i", "ii", "iii", "v1", "v5"])}
+    return {
+        "time": (np.arange(5000) / 500).tolist(),
+        "fs": 500.0,
+        "signals": signals,
+        "maxima_graph_data": {}, "minima_graph_data": {}, "baselines_graph_data": {},
+        "patient_info": {
+            "anonymous_id": patient_id, "age": "50", "sex": "M", "rhythm": "Sinus rhythm",
+            "hypertrophies": [], "conduction_system_disease": [], "ischemia": [], "cardiac_pacing": [],
+            "repolarization_abnormalities": None,
+        },
+    }
+
+
+@pytest.fixture
+def database(tmp_path):
+    previous = db_setup.use_engine(SQLiteEngine(str(tmp_path / "ecg.sqlite3")))
+    similarity_service.reset_index()
+    yield
+    similarity_service.reset_index()
+    db_setup.use_engine(previous)
+
+
+def test_index_search_matches_brute_force():
+    rows = unit_rows(500)
+    index = EmbeddingIndex(16)
+    for key, row in enumerate(rows):
+        index.add(key + 1000, row)
+    assert len(index) == 500
+
+    matches = index.search(rows[7], k=5, exclude=1007)
+    expected = np.argsort(-(rows @ rows[7]))[1:6] + 1000
+    assert [key for key, _ in matches] == expected.tolist()
+    assert matches[0][1] >= matches[-1][1]
+    assert index.search(rows[7], k=1)[0] == (1007, pytest.approx(1.0))
+
+
+def test_index_remove_and_replace_keep_positions_right():
+    rows = unit_rows(50)
+    index = EmbeddingIndex(16, capacity=4)
+    for key, row in enumerate(rows):
+        index.add(key, row)
+    assert index.remove(3) and not index.remove(3)
+    assert 3 not in index and 49 in index
+    np.testing.assert_array_equal(index.vector(49), rows[49])
+    index.add(10, rows[20])
+    np.testing.assert_array_equal(index.vector(10), rows[20])
+    assert len(index) == 49
+    assert all(key != 3 for key, _ in index.search(rows[3], k=49))
+    with pytest.raises(ValueError):
+        index.add(1, np.zeros(3))
+
+
+def test_approximate_search_finds_the_near_duplicates():
+    rows = unit_rows(2000, dims=64, seed=1)
+    near = rows[0] + 0.05 * unit_rows(1, dims=64, seed=2)[0]
+    index = EmbeddingIndex(64)
+    for key, row in enumerate(rows):
+        index.add(key, row)
+    index.add(5000, near / np.linalg.norm(near))
+    assert index.fit_projection(dims=16)
+    index.add(6000, rows[0])  # added after the fit, projected on the way in
+    keys = [key for key, _ in index.search(rows[0], k=2, exclude=0, approximate=True)]
+    assert sorted(keys) == [5000, 6000]
+    assert index.metrics()["projection_dims"] == 16
+
+
+def test_embedding_is_unit_length_and_tells_morphologies_apart():
+    normal = record_embedding(record(1, seed=0))
+    again = record_embedding(record(2, seed=10))
+    inverted = record_embedding(record(3, inverted_t=True, seed=20))
+    assert normal.shape == (EMBEDDING_DIMS,) and normal.dtype == np.float32
+    assert np.linalg.norm(normal) == pytest.approx(1.0, abs=1e-5)
+    assert float(normal @ again) > 0.99
+    assert float(normal @ inverted) < float(normal @ again) - 0.1
+    flat = record(4)
+    flat["signals"] = {lead: [0.0] * 5000 for lead in flat["signals"]}
+    assert record_embedding(flat) is None
+
+
+def test_ingest_updates_index_and_similar_ranks(database):
+    for patient_id in range(1, 5):
+        store_patient_and_ecg_data(record(patient_id, seed=patient_id * 10))
+    store_patient_and_ecg_data(record(9, inverted_t=True, seed=90))
+
+    # Loaded from ecg_embeddings on the first search
+    result = similar_patients(1, k=4)
+    assert result["success"] is True
+    assert [match["patient_id"] for match in result["data"]][-1] == 9
+    assert {match["patient_id"] for match in result["data"][:3]} == {2, 3, 4}
+
+    # Records stored after the load go straight into the index
+    store_patient_and_ecg_data(record(5, seed=50))
+    assert 5 in [match["patient_id"] for match in similar_patients(1, k=4)["data"]]
+
+    delete_patient_by_id(5)
+    similarity_service.remove_record_embedding(5)
+    similarity_service.reset_index()
+    assert 5 not in [match["patient_id"] for match in similar_patients(1, k=10)["data"]]
+    assert similar_patients(77)["success"] is False
+
+
+def test_patients_deleted_by_another_process_are_dropped(database):
+    for patient_id in range(1, 6):
+        store_patient_and_ecg_data(record(patient_id, seed=10 * patient_id))
+    assert len(similar_patients(1, k=3)["data"]) == 3
+
+    # Deleted through another server process, this process' index still has them
+    delete_patient_by_id(2)
+    delete_patient_by_id(3)
+    assert 2 in similarity_service.get_index()
+    result = similar_patients(1, k=3)
+    assert sorted(match["patient_id"] for match in result["data"]) == [4, 5]
+    assert 2 not in similarity_service.get_index() and 3 not in similarity_service.get_index()
+
+    delete_patient_by_id(1)
+    assert similar_patients(1)["success"] is False
@@ -0,0 +1,122 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+from backend.watcher import DirectoryWatcher
+from backend.ingest import new_stats
+import json
+import pytest
+import numpy as np
+import wfdb
+from unittest.mock import patch
+
+
+def write_record(directory, name):
+    time = np.linspace(0, 10, 5000)
+    signals = np.array([np.sin(2 * np.pi * f * time) for f in (1, 1.2, 1.5)]).T
+    wfdb.wrsamp(record_name=name, fs=500, units=['mV'] * 3, sig_name=['i', 'ii', 'iii'],
+                p_signal=signals, fmt=['16'] * 3, write_dir=str(directory))
+    return str(directory / name)
+
+
+@pytest.fixture
+def inbox(tmp_path):
+    folder = tmp_path / "inbox" / "cart1"
+    folder.mkdir(parents=True)
+    return folder
+
+
+def make_watcher(inbox, tmp_path):
+    return DirectoryWatcher(str(inbox.parent), checkpoint=str(tmp_path / "watch.json"), settle=0)
+
+
+@patch("backend.watcher.ingest_batch", side_effect=lambda batch, *args: list(batch))
+def test_record_ingested_once_stable(mock_ingest, inbox, tmp_path):
+    base_path = write_record(inbox, "1")
+    watcher = make_watcher(inbox, tmp_path)
+
+    assert watcher.poll(new_stats()) == 0  # first sighting, sizes not confirmed yet
+    assert watcher.poll(new_stats()) == 1
+    mock_ingest.assert_called_once()
+    assert mock_ingest.call_args[0][0] == [base_path]
+
+    assert watcher.poll(new_stats()) == 0  # never ingested twice
+
+
+@patch("backend.watcher.ingest_batch", side_effect=lambda batch, *args: list(batch))
+def test_half_written_dat_is_ignored(mock_ingest, inbox, tmp_path):
+    base_path = write_record(inbox, "1")
+    with open(base_path + ".dat", "rb") as file:
+        content = file.read()
+    with open(base_path + ".dat", "wb") as file:
+        file.write(content[:len(content) // 2])  # cart still copying
+
+    watcher = make_watcher(inbox, tmp_path)
+    watcher.poll(new_stats())
+    assert watcher.poll(new_stats()) == 0
+    mock_ingest.assert_not_called()
+
+    with open(base_path + ".dat", "wb") as file:
+        file.write(content)
+    watcher.poll(new_stats())
+    assert watcher.poll(new_stats()) == 1
+
+
+@patch("backend.watcher.ingest_batch", side_effect=lambda batch, *args: list(batch))
+def test_restart_does_not_rescan_or_reingest(mock_ingest, inbox, tmp_path):
+    write_record(inbox, "1")
+    watcher = make_watcher(inbox, tmp_path)
+    watcher.poll(new_stats())
+    watcher.poll(new_stats())
+    assert mock_ingest.call_count == 1
+
+    restarted = make_watcher(inbox, tmp_path)
+    restarted.settle = 0
+    with patch("backend.watcher.time.time_ns", return_value=2 ** 62):  # folders are not recently changed
+        with patch("backend.watcher.os.scandir") as mock_scandir:
+            assert restarted.poll(new_stats()) == 0
+    mock_scandir.assert_not_called()
+    assert mock_ingest.call_count == 1
+
+
+@patch("backend.watcher.ingest_batch", return_value=[])
+def test_failed_record_is_retried_later(mock_ingest, inbox, tmp_path):
+    base_path = write_record(inbox, "1")
+    watcher = make_watcher(inbox, tmp_path)
+    watcher.poll(new_stats())
+    watcher.poll(new_stats())
+
+    assert base_path in watcher.pending
+    assert base_path in watcher.retry_at
+    assert watcher.poll(new_stats()) == 0  # waits for the retry interval
+
+
+@patch("backend.watcher.ingest_batch", side_effect=lambda batch, *args: list(batch))
+def test_idle_polls_do_not_rewrite_the_checkpoint(mock_ingest, inbox, tmp_path):
+    write_record(inbox, "1")
+    watcher = make_watcher(inbox, tmp_path)
+    watcher.poll(new_stats())
+    watcher.poll(new_stats())
+    assert (tmp_path / "watch.json").exists()
+
+    with patch("backend.watcher.json.dump") as mock_dump:
+        for _ in range(3):
+            assert watcher.poll(new_stats()) == 0
+    mock_dump.assert_not_called()
+
+
+@patch("backend.watcher.ingest_batch", side_effect=lambda batch, *args: list(batch))
+def test_ingested_records_are_forgotten_once_their_files_are_gone(mock_ingest, inbox, tmp_path):
+    first = write_record(inbox, "1")
+    second = write_record(inbox, "2")
+    watcher = make_watcher(inbox, tmp_path)
+    watcher.poll(new_stats())
+    watcher.poll(new_stats())
+    assert watcher.ingested == {str(inbox): {first, second}}
+
+    for extension in (".hea", ".dat"):
+        os.remove(first + extension)
+    watcher.poll(new_stats())
+    assert watcher.ingested == {str(inbox): {second}}
+    with open(tmp_path / "watch.json") as file:
+        assert json.load(file)["ingested"] == [second]
+    assert mock_ingest.call_count == 1
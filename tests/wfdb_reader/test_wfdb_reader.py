@@ -0,0 +1,78 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+from backend.wfdb_reader import read_record, read_record_from_zip, parse_header
+import pytest
+import numpy as np
+import wfdb
+import zipfile
+
+
+def write_record(directory, name, fmt, n_samples=5000, n_sig=3):
+    """Writes a WFDB record with the given .dat format and returns its base path"""
+    time = np.linspace(0, 10, n_samples)
+    signals = np.array([np.sin(2 * np.pi * (1 + 0.2 * i) * time) * (i + 1) for i in range(n_sig)]).T
+    wfdb.wrsamp(
+        record_name=name,
+        fs=500,
+        units=['mV'] * n_sig,
+        sig_name=['i', 'ii', 'iii'][:n_sig],
+        p_signal=signals,
+        fmt=[fmt] * n_sig,
+        write_dir=str(directory),
+        comments=["<age>: 45", "<sex>: M"]
+    )
+    return str(directory / name)
+
+
+@pytest.mark.parametrize("fmt", ["16", "212"])
+def test_read_record_matches_wfdb(tmp_path, fmt):
+    """Fast path must give the same samples as wfdb.rdrecord, sample for sample"""
+    base_path = write_record(tmp_path, "ecg_" + fmt, fmt)
+
+    record = read_record(base_path)
+    expected = wfdb.rdrecord(base_path, physical=False, return_res=16)
+
+    assert record is not None
+    np.testing.assert_array_equal(record.d_signal, expected.d_signal)
+    assert record.sig_name == expected.sig_name
+    assert record.fs == expected.fs
+    assert record.adc_gain == list(expected.adc_gain)
+    assert record.baseline == list(expected.baseline)
+    assert record.comments == expected.comments
+
+
+def test_read_record_odd_sample_count_fmt212(tmp_path):
+    """Format 212 with an odd number of samples ends with a 2 byte group"""
+    base_path = write_record(tmp_path, "odd_212", "212", n_samples=1001, n_sig=1)
+
+    record = read_record(base_path)
+    expected = wfdb.rdrecord(base_path, physical=False, return_res=16)
+
+    np.testing.assert_array_equal(record.d_signal, expected.d_signal)
+
+
+@pytest.mark.parametrize("fmt", ["16", "212"])
+def test_read_record_from_zip_matches_wfdb(tmp_path, fmt):
+    base_path = write_record(tmp_path, "zipped_" + fmt, fmt)
+    zip_path = tmp_path / "records.zip"
+    with zipfile.ZipFile(zip_path, 'w') as zip_ref:
+        zip_ref.write(base_path + ".hea", "data/zipped_" + fmt + ".hea")
+        zip_ref.write(base_path + ".dat", "data/zipped_" + fmt + ".dat")
+
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        record = read_record_from_zip(zip_ref, "data/zipped_" + fmt)
+
+    expected = wfdb.rdrecord(base_path, physical=False, return_res=16)
+    np.testing.assert_array_equal(record.d_signal, expected.d_signal)
+
+
+def test_unsupported_format_falls_back(tmp_path):
+    """Formats other than 16/212 are left to wfdb"""
+    base_path = write_record(tmp_path, "ecg_80", "80")
+    assert read_record(base_path) is None
+
+
+def test_parse_header_malformed():
+    assert parse_header("") is None
+    assert parse_header("record abc 500") is None
@@ -0,0 +1,124 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+from backend.workspace import UploadWorkspace, WorkspaceQuotaError, HEARTBEAT_FILE, cleanup_orphans, reserved_bytes
+from werkzeug.datastructures import FileStorage
+import io
+import pytest
+import time
+import zipfile
+
+
+def make_zip(path, size=1000):
+    with zipfile.ZipFile(path, 'w') as zip_ref:
+        zip_ref.writestr('data/1.hea', 'x' * size)
+    return str(path)
+
+
+def test_workspaces_are_unique_and_removed(tmp_path):
+    with UploadWorkspace(str(tmp_path)) as first, UploadWorkspace(str(tmp_path)) as second:
+        assert first.folder != second.folder
+        assert first.path('data.zip') != second.path('data.zip')  # same upload name does not collide
+        assert os.path.isdir(first.folder)
+
+    assert not os.path.exists(first.folder)
+    assert not os.path.exists(second.folder)
+
+
+def test_workspace_removed_on_failure(tmp_path):
+    with pytest.raises(RuntimeError):
+        with UploadWorkspace(str(tmp_path)) as workspace:
+            open(workspace.path('data.zip'), 'w').close()
+            raise RuntimeError("processing failed")
+    assert not os.path.exists(workspace.folder)
+    assert reserved_bytes() == 0
+
+
+def test_path_drops_directories(tmp_path):
+    with UploadWorkspace(str(tmp_path)) as workspace:
+        assert workspace.path('../../etc/data.zip') == os.path.join(workspace.folder, 'data.zip')
+
+
+def test_extract_zip(tmp_path):
+    zip_path = make_zip(tmp_path / 'data.zip')
+    with UploadWorkspace(str(tmp_path / 'uploads')) as workspace:
+        extracted = workspace.extract_zip(zip_path, 'data')
+        assert os.path.exists(os.path.join(extracted, 'data', '1.hea'))
+
+
+def test_workspace_quota(tmp_path):
+    zip_path = make_zip(tmp_path / 'data.zip', size=1000)
+    with UploadWorkspace(str(tmp_path / 'uploads'), workspace_quota=500) as workspace:
+        with pytest.raises(WorkspaceQuotaError):
+            workspace.extract_zip(zip_path, 'data')
+
+
+def test_total_quota(tmp_path):
+    zip_path = make_zip(tmp_path / 'data.zip', size=1000)
+    root = str(tmp_path / 'uploads')
+    with UploadWorkspace(root, total_quota=1500) as first, UploadWorkspace(root, total_quota=1500) as second:
+        first.extract_zip(zip_path, 'data')
+        with pytest.raises(WorkspaceQuotaError):
+            second.extract_zip(zip_path, 'data')
+
+
+def test_cleanup_orphans(tmp_path):
+    orphan = tmp_path / 'upload-orphan'
+    orphan.mkdir()
+    old = time.time() - 7200
+    os.utime(orphan, (old, old))
+    other = tmp_path / 'not-a-workspace'
+    other.mkdir()
+    os.utime(other, (old, old))
+
+    with UploadWorkspace(str(tmp_path)) as active:
+        os.utime(active.folder, (old, old))
+        removed = cleanup_orphans(str(tmp_path), max_age=3600)
+        assert removed == [str(orphan)]
+        assert os.path.exists(active.folder)  # still in use
+    assert os.path.exists(other)
+
+
+def test_saved_upload_counts_against_the_quota(tmp_path):
+    upload = FileStorage(io.BytesIO(b'x' * 1000), filename='data.zip')
+    with UploadWorkspace(str(tmp_path), workspace_quota=500) as workspace:
+        with pytest.raises(WorkspaceQuotaError):
+            workspace.save_upload(upload)
+
+    zip_path = make_zip(tmp_path / 'data.zip')
+    with open(zip_path, 'rb') as zip_file:
+        upload = FileStorage(zip_file, filename='data.zip')
+        with UploadWorkspace(str(tmp_path / 'uploads')) as workspace:
+            file_path = workspace.save_upload(upload)
+            assert reserved_bytes() == os.path.getsize(zip_path)
+            workspace.extract_zip(file_path, 'data')
+            workspace.remove(file_path)
+            assert reserved_bytes() == 1000
+            assert not os.path.exists(file_path)
+    assert reserved_bytes() == 0
+
+
+def test_cleanup_skips_workspaces_with_a_fresh_heartbeat(tmp_path):
+    # Workspaces of another worker process, this process does not know them
+    old = time.time() - 7200
+    live = tmp_path / 'upload-live'
+    live.mkdir()
+    (live / HEARTBEAT_FILE).touch()
+    os.utime(live, (old, old))
+    dead = tmp_path / 'upload-dead'
+    dead.mkdir()
+    (dead / HEARTBEAT_FILE).touch()
+    os.utime(dead / HEARTBEAT_FILE, (old, old))
+    os.utime(dead, (old, old))
+
+    assert cleanup_orphans(str(tmp_path), max_age=3600) == [str(dead)]
+    assert os.path.exists(live)
+
+
+def test_cleanup_refreshes_this_process_heartbeats(tmp_path):
+    with UploadWorkspace(str(tmp_path)) as active:
+        old = time.time() - 7200
+        heartbeat = os.path.join(active.folder, HEARTBEAT_FILE)
+        os.utime(heartbeat, (old, old))
+        cleanup_orphans(str(tmp_path), max_age=3600)
+        assert os.stat(heartbeat).st_mtime > time.time() - 60
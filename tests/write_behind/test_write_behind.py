@@ -0,0 +1,100 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../code")))
+from backend.write_behind import WriteBehindBuffer
+import threading
+import time
+import pytest
+
+
+def test_concurrent_submits_share_one_flush():
+    batches = []
+    buffer = WriteBehindBuffer(lambda rows: batches.append(list(rows)), max_rows=100, max_delay_ms=100, ack="db")
+    threads = [threading.Thread(target=buffer.submit, args=(n,)) for n in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(row for batch in batches for row in batch) == list(range(10))
+    assert len(batches) < 10
+    assert buffer.metrics()["flushed_rows"] == 10
+    buffer.close()
+
+
+def test_full_batch_flushes_before_the_delay():
+    flushed = threading.Event()
+    buffer = WriteBehindBuffer(lambda rows: flushed.set(), max_rows=3, max_delay_ms=60000, ack="buffer")
+    for n in range(3):
+        buffer.submit(n)
+    assert flushed.wait(2)
+    buffer.close()
+
+
+def test_buffer_ack_returns_before_the_write():
+    release = threading.Event()
+    buffer = WriteBehindBuffer(lambda rows: release.wait(2), max_rows=1, max_delay_ms=0, ack="buffer")
+    started = time.monotonic()
+    pending = buffer.submit("row")
+    assert time.monotonic() - started < 1
+    release.set()
+    assert pending.wait(2) is True
+    buffer.close()
+
+
+def test_db_ack_raises_the_write_error():
+    def fail(rows):
+        raise RuntimeError("database is down")
+
+    buffer = WriteBehindBuffer(fail, max_rows=1, max_delay_ms=0, ack="db")
+    with pytest.raises(RuntimeError, match="database is down"):
+        buffer.submit("row")
+    assert buffer.metrics()["failed_rows"] == 1
+    buffer.close()
+
+
+def test_db_ack_timeout_drops_the_queued_item():
+    written = []
+    release = threading.Event()
+
+    def flush(rows):
+        release.wait(2)
+        written.extend(rows)
+
+    buffer = WriteBehindBuffer(flush, max_rows=1, max_delay_ms=0, ack="db")
+    first = threading.Thread(target=buffer.submit, args=("first",))
+    first.start()
+    time.sleep(0.1)  # "first" is being written, "second" waits behind it
+    with pytest.raises(TimeoutError):
+        buffer.submit("second", timeout=0.1)
+    release.set()
+    first.join()
+    buffer.close()
+    assert written == ["first"]
+    assert buffer.metrics()["cancelled"] == 1
+
+
+def test_db_ack_timeout_during_the_write_is_pending():
+    release = threading.Event()
+    buffer = WriteBehindBuffer(lambda rows: release.wait(2), max_rows=1, max_delay_ms=0, ack="db")
+    pending = buffer.submit("row", timeout=0.1)
+    assert pending.done() is False
+    release.set()
+    assert pending.wait(2) is True
+    assert buffer.metrics()["cancelled"] == 0
+    buffer.close()
+
+
+def test_close_writes_what_is_queued():
+    written = []
+    buffer = WriteBehindBuffer(written.extend, max_rows=100, max_delay_ms=60000, ack="buffer")
+    buffer.submit(1)
+    buffer.submit(2)
+    buffer.close()
+    assert written == [1, 2]
+    with pytest.raises(RuntimeError):
+        buffer.submit(3)
+
+
+def test_unknown_ack_mode():
+    with pytest.raises(ValueError):
+        WriteBehindBuffer(print, ack="maybe")